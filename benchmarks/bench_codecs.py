@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+JSON vs MessagePack framing (core.codecs): frame sizes and throughput.
+
+For each message type the consumer sends or receives, measures the
+encoded size and how many messages per second each codec can encode and
+decode. ``json->msgpack`` is the per-process conversion a MessagePack
+connection pays for a broadcast frame that was pre-encoded as JSON
+(uncached here; repeats of the same frame hit the cache).
+
+Usage:
+    python benchmarks/bench_codecs.py
+"""
+import json
+import os
+import random
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import msgpack  # noqa: E402
+
+
+PLAYERS = 30
+REPEAT = 5000
+
+
+def player_ids():
+    random.seed(7)
+    return [str(uuid.UUID(int=random.getrandbits(128))) for _ in range(PLAYERS)]
+
+
+def messages():
+    ids = player_ids()
+    position = lambda: {  # noqa: E731
+        'lat': 37.7749 + random.uniform(-0.005, 0.005),
+        'lng': -122.4194 + random.uniform(-0.005, 0.005),
+    }
+    return {
+        'position_update (in)': {
+            'type': 'position_update', 'lat': 37.774912, 'lng': -122.419433, 'accuracy': 8.0
+        },
+        'heartbeat (in)': {'type': 'heartbeat'},
+        'chat_message': {
+            'type': 'chat_message', 'player_name': 'Agent Smith',
+            'message': 'Meet at the fountain in five', 'visibility': 'team',
+            'timestamp': '2024-01-01T12:00:00.000000+00:00'
+        },
+        'positions_snapshot': {
+            'type': 'positions_snapshot',
+            'positions': [{'player_id': player_id, 'position': position()} for player_id in ids]
+        },
+        'positions delta': {
+            't': 'pd', 's': 1042, 'b': 1041,
+            'd': [[i, random.randint(-20, 20), random.randint(-20, 20)] for i in range(PLAYERS)]
+        },
+        'radar_response': {
+            'type': 'radar_response',
+            'players': [
+                {'id': player_id, 'name': f'Player {i}', 'team': random.choice(['red', 'blue']),
+                 'position': position(), 'visibility': 'active'}
+                for i, player_id in enumerate(ids)
+            ]
+        },
+        'player_killed': {
+            'type': 'player_killed', 'victim_id': ids[0], 'killer_id': ids[1], 'cause': 'dagger'
+        },
+    }
+
+
+def rate(func, arg):
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        func(arg)
+    return REPEAT / (time.perf_counter() - start) / 1000
+
+
+def main():
+    pack = lambda payload: msgpack.packb(payload, use_bin_type=True)  # noqa: E731
+    unpack = lambda data: msgpack.unpackb(data, raw=False)  # noqa: E731
+    convert = lambda text: pack(json.loads(text))  # noqa: E731
+
+    print(f"{'message':<22}{'json B':>8}{'msgpack B':>11}{'ratio':>7}"
+          f"{'json enc k/s':>14}{'mp enc k/s':>12}{'json dec k/s':>14}{'mp dec k/s':>12}"
+          f"{'json->mp k/s':>14}")
+    for name, payload in messages().items():
+        text = json.dumps(payload)
+        packed = pack(payload)
+        print(f"{name:<22}{len(text.encode()):>8}{len(packed):>11}{len(packed) / len(text):>7.2f}"
+              f"{rate(json.dumps, payload):>14.0f}{rate(pack, payload):>12.0f}"
+              f"{rate(json.loads, text):>14.0f}{rate(unpack, packed):>12.0f}"
+              f"{rate(convert, text):>14.0f}")
+
+
+if __name__ == '__main__':
+    main()
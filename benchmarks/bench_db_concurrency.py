@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Consumer database throughput as connections scale: one sync thread vs the pool.
+
+Each simulated connection handles position updates back to back, like
+GameConsumer does. Every update runs a real query against a throwaway test
+database, plus ``LATENCY`` seconds of sleep standing in for the network
+round trip to a database server. One connection in every ``SLOW_EVERY``
+also runs a ``SLOW_QUERY`` second report query now and then.
+
+The same workload runs through Channels' thread-sensitive
+``database_sync_to_async`` (every call on one thread) and through
+``core.dbpool.db_sync_to_async`` with different pool sizes.
+
+Usage:
+    python benchmarks/bench_db_concurrency.py
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "examplesite.settings")
+os.environ.setdefault("DJANGO_SECRET_KEY", "benchmark")
+
+import django
+
+django.setup()
+
+from channels.db import database_sync_to_async  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test.utils import override_settings  # noqa: E402
+
+from core.dbpool import db_pool, db_sync_to_async  # noqa: E402
+from core.models import Game, Player, PlayerState  # noqa: E402
+
+
+CONNECTIONS = [1, 10, 50, 200]
+POOL_SIZES = [4, 16]
+UPDATES_PER_CONNECTION = 20
+LATENCY = 0.002
+SLOW_QUERY = 0.05
+SLOW_EVERY = 50
+
+
+def setup_players(count):
+    host = Player.objects.create(name="Host")
+    game = Game.objects.create(host=host, home_base_lat=37.7749, home_base_lng=-122.4194)
+    return [
+        str(Player.objects.create(name=f"Player {i}", game=game).id)
+        for i in range(count)
+    ]
+
+
+def position_update(player_id):
+    time.sleep(LATENCY)
+    PlayerState.objects.filter(player_id=player_id).values_list('position_lat', flat=True).first()
+
+
+def slow_report(player_id):
+    time.sleep(SLOW_QUERY)
+    Player.objects.filter(game__players__id=player_id).count()
+
+
+async def connection_loop(run, index, player_id):
+    for update in range(UPDATES_PER_CONNECTION):
+        if index % SLOW_EVERY == 0 and update % 5 == 0:
+            await run(slow_report)(player_id)
+        await run(position_update)(player_id)
+
+
+async def measure(run, player_ids):
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        connection_loop(run, index, player_id) for index, player_id in enumerate(player_ids)
+    ))
+    return len(player_ids) * UPDATES_PER_CONNECTION / (time.perf_counter() - start)
+
+
+def main():
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0)
+    try:
+        player_ids = setup_players(max(CONNECTIONS))
+        results = []
+        for connections in CONNECTIONS:
+            row = [asyncio.run(measure(database_sync_to_async, player_ids[:connections]))]
+            for size in POOL_SIZES:
+                with override_settings(CONSUMER_DB_THREADS=size):
+                    row.append(asyncio.run(measure(db_sync_to_async, player_ids[:connections])))
+            results.append((connections, row))
+        db_pool.shutdown()
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    print(f"Position updates/s with {LATENCY * 1e3:.0f} ms round trips ({connection.vendor})")
+    header = ''.join(f"{f'pool={size}':>12}" for size in POOL_SIZES)
+    print(f"{'connections':<13}{'one thread':>12}{header}")
+    for connections, row in results:
+        print(f"{connections:<13}" + ''.join(f"{value:>12.0f}" for value in row))
+
+
+if __name__ == '__main__':
+    main()
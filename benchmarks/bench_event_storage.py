@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Event log size and insert throughput: stored messages vs render-on-read params.
+
+Writes the same mix of events twice into a throwaway test database:
+once with the fully formatted ``message`` every row used to carry, and
+once as ``params`` rendered by ``core.event_messages`` when read. Reports
+the bytes the event table (with its indexes) takes, and inserts per
+second both row by row (``Event.objects.create``) and in
+``EVENT_BATCH_SIZE`` batches as the event sink writes them.
+
+Usage:
+    python benchmarks/bench_event_storage.py
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "examplesite.settings")
+os.environ.setdefault("DJANGO_SECRET_KEY", "benchmark")
+
+import django
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.db import connection, transaction  # noqa: E402
+
+from core.event_messages import render_message  # noqa: E402
+from core.models import Event, Game, Player  # noqa: E402
+
+
+EVENTS = 20000
+PLAYERS = 12
+ITEMS = ['emp', 'camera', 'dagger', 'mask', 'armor', 'invisibility_cloak', 'poison', 'motion_sensor']
+
+
+def item():
+    return {'item': random.choice(ITEMS)}
+
+
+def no_params():
+    return None
+
+
+# (type, relative frequency, has a player, params)
+MIX = [
+    ('item_picked', 6, True, item),
+    ('item_used', 6, True, item),
+    ('item_respawn', 4, False, item),
+    ('motion_detected', 3, True, lambda: {'item': random.choice(['camera', 'motion_sensor'])}),
+    ('player_joined', 1, True, no_params),
+    ('player_left', 1, True, no_params),
+    ('player_killed', 1, True, no_params),
+]
+
+
+def setup_game():
+    host = Player.objects.create(name="Host")
+    game = Game.objects.create(host=host, home_base_lat=37.7749, home_base_lng=-122.4194)
+    players = [
+        Player.objects.create(name=f"Agent {name}", game=game)
+        for name in ['Alpha', 'Bravo', 'Charlie', 'Delta', 'Echo', 'Foxtrot',
+                     'Golf', 'Hotel', 'India', 'Juliett', 'Kilo', 'Lima'][:PLAYERS]
+    ]
+    return game, players
+
+
+def make_events(game, players):
+    """Return the same events as ``(legacy, compact)`` unsaved row lists"""
+    types = random.choices(MIX, weights=[weight for _, weight, _, _ in MIX], k=EVENTS)
+    legacy, compact = [], []
+    for event_type, _, has_player, make_params in types:
+        params = make_params()
+        fields = {
+            'game': game, 'type': event_type,
+            'player': random.choice(players) if has_player else None,
+            'position_lat': 37.7749 + random.uniform(-0.01, 0.01),
+            'position_lng': -122.4194 + random.uniform(-0.01, 0.01),
+        }
+        event = Event(params=params, **fields)
+        compact.append(event)
+        legacy.append(Event(message=render_message(event), **fields))
+    return legacy, compact
+
+
+def copy_rows(events):
+    return [
+        Event(**{field.attname: getattr(event, field.attname) for field in Event._meta.concrete_fields
+                 if field.attname != 'id'})
+        for event in events
+    ]
+
+
+def table_bytes():
+    table = Event._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute("SELECT pg_total_relation_size(%s)", [table])
+        elif connection.vendor == 'sqlite':
+            cursor.execute(
+                "SELECT SUM(pgsize) FROM dbstat WHERE name = %s OR name IN "
+                "(SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = %s)",
+                [table, table]
+            )
+        else:
+            return None
+        return cursor.fetchone()[0] or 0
+
+
+def reset():
+    Event.objects.all().delete()
+    if connection.vendor in ('sqlite', 'postgresql'):
+        with connection.cursor() as cursor:
+            cursor.execute("VACUUM")
+
+
+def insert_rowwise(events):
+    start = time.perf_counter()
+    for event in events:
+        with transaction.atomic():
+            event.save(force_insert=True)
+    return len(events) / (time.perf_counter() - start)
+
+
+def insert_batched(events):
+    batch_size = getattr(settings, 'EVENT_BATCH_SIZE', 100)
+    start = time.perf_counter()
+    for offset in range(0, len(events), batch_size):
+        Event.objects.bulk_create(events[offset:offset + batch_size])
+    return len(events) / (time.perf_counter() - start)
+
+
+def measure(events):
+    reset()
+    empty = table_bytes()
+    rowwise = insert_rowwise(copy_rows(events))
+    size = table_bytes()
+    reset()
+    batched = insert_batched(copy_rows(events))
+    return (size - empty if size is not None else None), rowwise, batched
+
+
+def main():
+    random.seed(7)
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0)
+    try:
+        game, players = setup_game()
+        legacy, compact = make_events(game, players)
+        results = [('stored message', measure(legacy)), ('params', measure(compact))]
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    print(f"{EVENTS} events ({connection.vendor})")
+    print(f"{'encoding':<16}{'table bytes':>14}{'bytes/row':>11}{'rows/s':>10}{'batched/s':>11}")
+    for name, (size, rowwise, batched) in results:
+        size_text = f"{size:>14,}{size / EVENTS:>11.1f}" if size is not None else f"{'n/a':>14}{'n/a':>11}"
+        print(f"{name:<16}{size_text}{rowwise:>10.0f}{batched:>11.0f}")
+    old_size, new_size = results[0][1][0], results[1][1][0]
+    if old_size and new_size is not None:
+        print(f"Table size reduction: {1 - new_size / old_size:.1%}")
+
+
+if __name__ == '__main__':
+    main()
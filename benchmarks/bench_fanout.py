@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+CPU cost of one group broadcast fanned out to N GameConsumer instances.
+
+Compares the old per-recipient handlers (rebuild dict + json.dumps in every
+consumer) against serialize-once frames (encode at the group_send site,
+forward the text unchanged). The channel layer and socket are left out so
+only the per-broadcast encoding and handler work is measured.
+
+Usage:
+    python benchmarks/bench_fanout.py
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "examplesite.settings")
+
+import django
+
+django.setup()
+
+from core.broadcast import frame_message, keyed_frame_message  # noqa: E402
+from core.consumers import GameConsumer  # noqa: E402
+from core.outbound import OutboundQueue  # noqa: E402
+
+
+SUBSCRIBERS = [20, 100, 500]
+REPEAT = 200
+
+
+class LegacyHandlers:
+    """The per-recipient handlers GameConsumer used before frames"""
+
+    def __init__(self, player_id):
+        self.player_id = player_id
+
+    async def send(self, text_data=None, bytes_data=None):
+        pass
+
+    async def player_joined(self, event):
+        await self.send(text_data=json.dumps({
+            'type': 'player_joined',
+            'player': event['player']
+        }))
+
+    async def item_used(self, event):
+        await self.send(text_data=json.dumps({
+            'type': 'item_used',
+            'item_type': event['item_type'],
+            'player_id': event['player_id'],
+            'effects': event.get('effects', {})
+        }))
+
+    async def player_moved(self, event):
+        if event.get('player_id') != str(self.player_id):
+            await self.send(text_data=json.dumps({
+                'type': 'player_moved',
+                'player_id': event['player_id'],
+                'position': event['position']
+            }))
+
+
+def make_consumer(player_id):
+    consumer = GameConsumer()
+    consumer.player_id = player_id
+    consumer.position_encoder = None
+    consumer.outbound = OutboundQueue('BENCH')
+
+    async def send(text_data=None, bytes_data=None):
+        pass
+
+    consumer.send = send
+    return consumer
+
+
+def sample_player(i):
+    return {
+        'id': f'00000000-0000-0000-0000-{i:012d}',
+        'name': f'Player {i}',
+        'avatar_url': f'https://api.dicebear.com/7.x/avataaars/svg?seed={i}',
+        'team': 'blue',
+        'is_alive': True,
+        'is_online': True,
+        'visibility': 'active',
+        'position': {'lat': 37.7749 + i * 1e-5, 'lng': -122.4194 - i * 1e-5},
+        'position_accuracy': 5.0,
+        'last_seen': '2024-01-01T12:00:00.000000Z',
+        'death_time': None,
+        'death_position': None,
+        'current_item': None,
+        'joined_at': '2024-01-01T12:00:00.000000Z',
+    }
+
+
+async def run_legacy(handlers, method, events):
+    for event in events:
+        for handler in handlers:
+            await getattr(handler, method)(event)
+
+
+async def run_frames(consumers, messages):
+    for build in messages:
+        message = build()
+        for consumer in consumers:
+            await consumer.broadcast_frame(message)
+            # What the connection's writer task does
+            while len(consumer.outbound):
+                await consumer.send_outbound(await consumer.outbound.get())
+
+
+def measure(coro_factory, broadcasts):
+    loop = asyncio.new_event_loop()
+    try:
+        start = time.process_time()
+        for _ in range(REPEAT):
+            loop.run_until_complete(coro_factory())
+        elapsed = time.process_time() - start
+    finally:
+        loop.close()
+    return elapsed / (REPEAT * broadcasts) * 1e6
+
+
+def main():
+    ids = [f'00000000-0000-0000-0000-{i:012d}' for i in range(max(SUBSCRIBERS))]
+    movers = {
+        pid: {'player_id': pid, 'position': {'lat': 37.7749 + i * 1e-5, 'lng': -122.4194}}
+        for i, pid in enumerate(ids[:20])
+    }
+    item_used = {
+        'type': 'item_used', 'item_type': 'emp',
+        'player_id': ids[0], 'effects': {'radius': 50, 'duration': 120},
+    }
+    player_joined = {'type': 'player_joined', 'player': sample_player(1)}
+
+    cases = [
+        ('item_used', 'item_used', [item_used],
+         [lambda: frame_message(item_used)]),
+        ('player_joined', 'player_joined', [player_joined],
+         [lambda: frame_message(player_joined)]),
+        # 20 movers: legacy sends 20 player_moved messages, frames send 1 snapshot
+        ('20 movers', 'player_moved', [
+            {'type': 'player_moved', 'player_id': m['player_id'], 'position': m['position']}
+            for m in movers.values()
+        ], [lambda: keyed_frame_message('positions_snapshot', 'positions', movers)]),
+    ]
+
+    print(f"{'broadcast':<15}{'subscribers':>12}{'before us':>12}{'after us':>12}{'speedup':>10}")
+    for label, method, events, messages in cases:
+        for n in SUBSCRIBERS:
+            handlers = [LegacyHandlers(pid) for pid in ids[:n]]
+            consumers = [make_consumer(pid) for pid in ids[:n]]
+            before = measure(lambda: run_legacy(handlers, method, events), 1)
+            after = measure(lambda: run_frames(consumers, messages), 1)
+            print(f"{label:<15}{n:>12}{before:>12.1f}{after:>12.1f}{before / after:>9.1f}x")
+
+
+if __name__ == '__main__':
+    main()
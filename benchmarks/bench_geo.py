@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Scalar Python vs NumPy-vectorized distance math (core.geo).
+
+Times one-to-many (a player against every entity) and many-to-many
+(every player against every entity) distance computations at game-sized
+inputs, for both haversine and the equirectangular approximation.
+
+Usage:
+    python benchmarks/bench_geo.py
+"""
+import math
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+
+from core import geo  # noqa: E402
+
+
+CENTER = (37.7749, -122.4194)
+SIZES = [(1, 100), (1, 1000), (20, 100), (100, 500), (500, 500)]
+
+
+def scalar_haversine(lat1, lng1, lat2, lng2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * geo.EARTH_RADIUS_M * math.asin(math.sqrt(min(1.0, a)))
+
+
+def scalar_equirectangular(lat1, lng1, lat2, lng2):
+    x = math.radians(lng2 - lng1) * math.cos(math.radians((lat1 + lat2) / 2))
+    y = math.radians(lat2 - lat1)
+    return geo.EARTH_RADIUS_M * math.hypot(x, y)
+
+
+def points(n):
+    return [geo.random_point(CENTER[0], CENTER[1], 1000, min_fraction=0) for _ in range(n)]
+
+
+def timed(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    return (time.perf_counter() - start) / repeat * 1e6, result
+
+
+def main():
+    random.seed(7)
+    print(f"{'players x entities':<20}{'method':<17}{'scalar us':>12}{'numpy us':>12}{'speedup':>10}")
+    for n_players, n_entities in SIZES:
+        players = points(n_players)
+        entities = points(n_entities)
+        p_lat = np.array([p[0] for p in players])
+        p_lng = np.array([p[1] for p in players])
+        e_lat = np.array([e[0] for e in entities])
+        e_lng = np.array([e[1] for e in entities])
+        repeat = max(3, 20000 // (n_players * n_entities))
+
+        for name, scalar, vectorized in [
+            ('haversine', scalar_haversine, geo.haversine),
+            ('equirectangular', scalar_equirectangular, geo.equirectangular),
+        ]:
+            scalar_us, expected = timed(
+                lambda: [[scalar(a, b, c, d) for c, d in entities] for a, b in players],
+                repeat
+            )
+            numpy_us, matrix = timed(
+                lambda: geo.distance_matrix(p_lat, p_lng, e_lat, e_lng, method=vectorized),
+                repeat
+            )
+            assert np.allclose(matrix, expected)
+            label = f"{n_players} x {n_entities}"
+            print(f"{label:<20}{name:<17}{scalar_us:>12.1f}{numpy_us:>12.1f}{scalar_us / numpy_us:>9.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Bytes and CPU per position update: JSON snapshots vs delta frames (core.deltas).
+
+Simulates a 30-player game where everyone walks and reports at the tick
+rate, and measures what one recipient receives per tick: the shared
+``positions_snapshot`` JSON text, or its own quantized delta frame with
+acknowledgements arriving one tick late. JSON is encoded once per tick
+for the whole group; delta frames are encoded per connection, so their
+encode cost is per recipient.
+
+Usage:
+    python benchmarks/bench_position_encoding.py
+"""
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "examplesite.settings")
+
+import django
+
+django.setup()
+
+from core import geo  # noqa: E402
+from core.broadcast import keyed_frame_message, render_frame  # noqa: E402
+from core.deltas import PositionDecoder, PositionEncoder  # noqa: E402
+
+
+PLAYERS = 30
+TICKS = 2000
+TICK_RATE = 5
+WALKING_SPEED = 1.4
+MOVERS = [PLAYERS, 10]
+
+
+def simulate(movers):
+    """Yield each tick's ``{player_id: (lat, lng)}`` of the players who moved"""
+    random.seed(7)
+    players = {
+        f'{random.getrandbits(128):032x}': geo.random_point(37.7749, -122.4194, 800, min_fraction=0)
+        for _ in range(PLAYERS)
+    }
+    heading = {player_id: random.uniform(0, 360) for player_id in players}
+    step = WALKING_SPEED / TICK_RATE
+    for _ in range(TICKS):
+        moved = {}
+        for player_id in random.sample(list(players), movers):
+            heading[player_id] += random.uniform(-20, 20)
+            lat, lng = geo.destination_point(*players[player_id], heading[player_id], step)
+            players[player_id] = moved[player_id] = (float(lat), float(lng))
+        yield moved
+
+
+def json_frames(ticks):
+    start = time.perf_counter()
+    frames = [
+        render_frame(keyed_frame_message('positions_snapshot', 'positions', {
+            player_id: {'player_id': player_id, 'position': {'lat': lat, 'lng': lng}}
+            for player_id, (lat, lng) in moved.items()
+        }))
+        for moved in ticks
+    ]
+    encode = time.perf_counter() - start
+    start = time.perf_counter()
+    for frame in frames:
+        json.loads(frame)
+    return frames, encode, time.perf_counter() - start
+
+
+def delta_frames(ticks):
+    encoder, decoder = PositionEncoder(), PositionDecoder()
+    frames, encode, decode, pending = [], 0.0, 0.0, None
+    for moved in ticks:
+        start = time.perf_counter()
+        if pending is not None:
+            encoder.ack(pending)
+        frame = encoder.encode(moved)
+        encode += time.perf_counter() - start
+        if frame is None:
+            continue
+        frames.append(frame)
+        start = time.perf_counter()
+        decoder.decode(frame)
+        decode += time.perf_counter() - start
+        # The ack reaches the server in time for the next tick
+        pending = decoder.ack(json.loads(frame)['s'])['seq']
+    return frames, encode, decode
+
+
+def main():
+    print(f"{PLAYERS} players, {TICKS} ticks at {TICK_RATE} Hz, walking at {WALKING_SPEED} m/s")
+    print(f"{'movers/tick':<13}{'encoding':<10}{'bytes/update':>14}{'bytes/tick':>12}"
+          f"{'encode us/tick':>16}{'decode us/tick':>16}")
+    for movers in MOVERS:
+        ticks = list(simulate(movers))
+        updates = sum(len(moved) for moved in ticks)
+        for name, (frames, encode, decode) in [
+            ('json', json_frames(ticks)),
+            ('delta', delta_frames(ticks)),
+        ]:
+            size = sum(len(frame.encode()) for frame in frames)
+            print(f"{movers:<13}{name:<10}{size / updates:>14.1f}{size / TICKS:>12.0f}"
+                  f"{encode / TICKS * 1e6:>16.1f}{decode / TICKS * 1e6:>16.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Write amplification of position updates: wide Player row vs PlayerState.
+
+Before the hot/cold split every position update saved the whole Player
+row, rewriting all of its columns (name, avatar, team, death data, ...)
+to change four. This compares that statement shape, replayed against a
+copy of the old wide table, with the column-targeted UPDATE of the narrow
+PlayerState row the position store now issues. Runs against a throwaway
+test database.
+
+Usage:
+    python benchmarks/bench_write_amplification.py
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "examplesite.settings")
+os.environ.setdefault("DJANGO_SECRET_KEY", "benchmark")
+
+import django
+
+django.setup()
+
+from django.db import connection, transaction  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+from core.models import Game, Player, PlayerState  # noqa: E402
+
+
+PLAYERS = 200
+UPDATES = 5000
+STATE_COLUMNS = ['position_lat', 'position_lng', 'position_accuracy', 'last_seen']
+
+
+def setup_game():
+    host = Player.objects.create(name="Host")
+    game = Game.objects.create(host=host, home_base_lat=37.7749, home_base_lng=-122.4194)
+    for i in range(PLAYERS):
+        Player.objects.create(
+            name=f"Player {i}", game=game, team=random.choice(['red', 'blue']),
+            avatar_url=f"https://example.com/avatars/{i}.png",
+            position_lat=37.7749, position_lng=-122.4194
+        )
+    return list(Player.objects.values_list('id', flat=True))
+
+
+def create_wide_table():
+    """Recreate the pre-split Player table: profile and state columns in one row"""
+    player_columns = [field.column for field in Player._meta.concrete_fields]
+    state_columns = ['is_online'] + STATE_COLUMNS
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "CREATE TABLE bench_wide_player AS SELECT "
+            + ", ".join(f'p."{column}"' for column in player_columns) + ", "
+            + ", ".join(f's."{column}"' for column in state_columns)
+            + ' FROM core_player p JOIN core_playerstate s ON s.player_id = p.id'
+        )
+        cursor.execute('CREATE UNIQUE INDEX bench_wide_player_id ON bench_wide_player ("id")')
+    return [column for column in player_columns + state_columns if column != 'id']
+
+
+def random_fix():
+    return (
+        37.7749 + random.uniform(-0.005, 0.005),
+        -122.4194 + random.uniform(-0.005, 0.005),
+        random.uniform(3, 30),
+        timezone.now(),
+    )
+
+
+def time_wide(player_ids, columns):
+    """Model.save() shape: every column of the wide row is rewritten"""
+    fields = [field for field in Player._meta.concrete_fields if field.column != 'id']
+    rows = {
+        player.id: [
+            field.get_db_prep_save(getattr(player, field.attname), connection)
+            for field in fields
+        ]
+        for player in Player.objects.all()
+    }
+    prep = Player._meta.pk.get_db_prep_save
+    sql = (
+        "UPDATE bench_wide_player SET "
+        + ", ".join(f'"{column}" = %s' for column in columns)
+        + ' WHERE "id" = %s'
+    )
+    start = time.perf_counter()
+    with transaction.atomic(), connection.cursor() as cursor:
+        for _ in range(UPDATES):
+            player_id = random.choice(player_ids)
+            lat, lng, accuracy, seen = random_fix()
+            params = rows[player_id] + [
+                True, lat, lng, accuracy,
+                PlayerState._meta.get_field('last_seen').get_db_prep_save(seen, connection),
+                prep(player_id, connection),
+            ]
+            cursor.execute(sql, params)
+    return time.perf_counter() - start
+
+
+def time_narrow(player_ids):
+    """Column-targeted UPDATE of the narrow PlayerState row"""
+    prep = Player._meta.pk.get_db_prep_save
+    last_seen = PlayerState._meta.get_field('last_seen')
+    sql = (
+        "UPDATE core_playerstate SET "
+        + ", ".join(f'"{column}" = %s' for column in STATE_COLUMNS)
+        + ' WHERE "player_id" = %s'
+    )
+    start = time.perf_counter()
+    with transaction.atomic(), connection.cursor() as cursor:
+        for _ in range(UPDATES):
+            lat, lng, accuracy, seen = random_fix()
+            cursor.execute(sql, [
+                lat, lng, accuracy,
+                last_seen.get_db_prep_save(seen, connection),
+                prep(random.choice(player_ids), connection),
+            ])
+    return time.perf_counter() - start
+
+
+def main():
+    random.seed(7)
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0)
+    try:
+        player_ids = setup_game()
+        wide_columns = create_wide_table()
+        wide = time_wide(player_ids, wide_columns)
+        narrow = time_narrow(player_ids)
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    print(f"{UPDATES} position updates across {PLAYERS} players ({connection.vendor})")
+    print(f"{'shape':<28}{'columns':>9}{'total ms':>11}{'us/update':>11}")
+    print(f"{'wide Player save()':<28}{len(wide_columns):>9}{wide * 1e3:>11.1f}{wide / UPDATES * 1e6:>11.1f}")
+    print(f"{'narrow PlayerState UPDATE':<28}{len(STATE_COLUMNS):>9}{narrow * 1e3:>11.1f}{narrow / UPDATES * 1e6:>11.1f}")
+
+
+if __name__ == '__main__':
+    main()
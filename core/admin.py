@@ -14,9 +14,12 @@ class GameAdmin(admin.ModelAdmin):
 @admin.register(Player)
 class PlayerAdmin(admin.ModelAdmin):
     list_display = ['name', 'game', 'team', 'is_alive', 'is_online', 'visibility']
-    list_filter = ['team', 'is_alive', 'is_online', 'visibility']
+    list_filter = ['team', 'is_alive', 'state__is_online']
     search_fields = ['name', 'game__code']
     readonly_fields = ['id', 'joined_at', 'last_seen']
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_cloak().select_related('state')
 
 @admin.register(Zone)
 class ZoneAdmin(admin.ModelAdmin):
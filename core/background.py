@@ -0,0 +1,70 @@
+import atexit
+import logging
+import threading
+
+from django.db import close_old_connections
+
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicWorker:
+    """Run a callable every ``interval`` seconds on a daemon thread.
+
+    Used by the write-behind stores to flush buffered rows without tying
+    the flush to a request or a WebSocket connection. The callable runs
+    one last time at interpreter exit so a clean shutdown loses nothing.
+    """
+
+    def __init__(self, name, func, interval):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._exit_hook_registered = False
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Start the worker thread if it is not already running"""
+        with self._lock:
+            if self.running:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run, name=self.name, daemon=True
+            )
+            self._thread.start()
+            if not self._exit_hook_registered:
+                atexit.register(self.run_once)
+                self._exit_hook_registered = True
+
+    def stop(self, flush=True):
+        """Stop the worker thread, optionally running the callable once more"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+            self._stop.set()
+            if self._exit_hook_registered:
+                atexit.unregister(self.run_once)
+                self._exit_hook_registered = False
+        if thread is not None:
+            thread.join(timeout=self.interval + 1)
+        if flush:
+            self.run_once()
+
+    def run_once(self):
+        """Run the callable, logging (not raising) any failure"""
+        try:
+            self.func()
+        except Exception:
+            logger.exception("Background worker %s failed", self.name)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.run_once()
+            # The thread owns its connection; drop it if it went bad
+            close_old_connections()
@@ -0,0 +1,112 @@
+import asyncio
+import json
+
+from .outbox import broadcast_outbox
+
+
+FRAME_MESSAGE_TYPE = 'broadcast.frame'
+
+
+def game_group(game_code):
+    """Channel group every connection in a game joins"""
+    return f'game_{game_code}'
+
+
+def team_group(game_code, team):
+    """Channel group for one team's connections in a game"""
+    return f'game_{game_code}_{team}'
+
+
+def cell_group(game_code, cell):
+    """Channel group for the connections interested in one map cell (see core.interest)"""
+    cx, cy = cell
+    return f'game_{game_code}_cell_{cx}_{cy}'
+
+
+def unlocated_group(game_code):
+    """Channel group for connections with no known position, which see every cell"""
+    return f'game_{game_code}_unlocated'
+
+
+def player_group(player_id):
+    """Channel group for a single player's connections"""
+    return f'player_{player_id}'
+
+
+def player_context_message(**changes):
+    """Build an invalidation message for a player's cached connection context"""
+    return {'type': 'player.context', 'changes': changes}
+
+
+def frame_message(payload, **routing):
+    """Build a group message carrying a frame that is already encoded.
+
+    The payload is serialized exactly once here, at the send site, and
+    every consumer in the group forwards the resulting text unchanged.
+    ``routing`` holds any plain metadata consumers need for per-recipient
+    filtering; it is never sent to clients. ``frame_type`` repeats the
+    payload's type so consumers can classify the frame without parsing it.
+    """
+    message = {
+        'type': FRAME_MESSAGE_TYPE,
+        'frame_type': payload.get('type'),
+        'text': json.dumps(payload),
+    }
+    message.update(routing)
+    return message
+
+
+def keyed_frame_message(frame_type, list_key, entries, **routing):
+    """Build a frame whose list entries are encoded once but can be dropped per recipient.
+
+    ``entries`` maps a player id to that player's list item. Each item is
+    encoded separately so a consumer can leave out its own player's entry
+    by joining the remaining pre-encoded strings, without re-serializing.
+    """
+    head = json.dumps({'type': frame_type, list_key: []})
+    message = {
+        'type': FRAME_MESSAGE_TYPE,
+        'frame_type': frame_type,
+        'head': head[:-2],
+        'tail': head[-2:],
+        'parts': {key: json.dumps(entry) for key, entry in entries.items()},
+    }
+    message.update(routing)
+    return message
+
+
+def render_frame(message, player_id=None):
+    """Return the text a given recipient should receive, or None to skip it"""
+    parts = message.get('parts')
+    if parts is None:
+        return message['text']
+    own = str(player_id) if player_id else None
+    entries = [text for key, text in parts.items() if key != own]
+    if not entries:
+        return None
+    return message['head'] + ', '.join(entries) + message['tail']
+
+
+async def group_send_frame(channel_layer, group_name, payload, **routing):
+    """Encode ``payload`` once and broadcast it to a channel group"""
+    await channel_layer.group_send(group_name, frame_message(payload, **routing))
+
+
+async def group_send_many(channel_layer, messages):
+    """Send several ``(group_name, message)`` pairs concurrently"""
+    await asyncio.gather(*(
+        channel_layer.group_send(group_name, message)
+        for group_name, message in messages
+    ))
+
+
+def broadcast_to_game(game_code, payload, **routing):
+    """Broadcast a frame to a game group from synchronous code, once committed"""
+    broadcast_outbox.send(game_group(game_code), frame_message(payload, **routing))
+
+
+def notify_players(messages):
+    """Send ``(player_id, message)`` pairs to player groups from synchronous code, once committed"""
+    broadcast_outbox.send_many(
+        (player_group(player_id), message) for player_id, message in messages
+    )
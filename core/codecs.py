@@ -0,0 +1,71 @@
+"""Wire encodings for GameConsumer, negotiated as a WebSocket subprotocol.
+
+Clients that offer no subprotocol (or ``json``) exchange JSON text
+frames, as before. Clients that offer ``msgpack`` exchange MessagePack
+binary frames in both directions; the messages themselves are the same
+dicts either way, so every handler is shared.
+
+Broadcast frames are still encoded once as JSON at the send site (see
+core.broadcast). A MessagePack connection converts that text on the way
+out, and the conversion is cached per process so a frame fanned out to
+many local connections is converted once.
+"""
+import json
+from functools import lru_cache
+
+import msgpack
+
+
+class JsonCodec:
+    """JSON text frames (the default)"""
+    subprotocol = 'json'
+
+    def decode(self, text_data=None, bytes_data=None):
+        return json.loads(text_data if text_data is not None else bytes_data)
+
+    def encode(self, payload):
+        """Return ``send`` kwargs for a message dict"""
+        return {'text_data': json.dumps(payload)}
+
+    def from_json(self, text):
+        """Return ``send`` kwargs for a frame that is already JSON text"""
+        return {'text_data': text}
+
+
+class MsgpackCodec:
+    """MessagePack binary frames"""
+    subprotocol = 'msgpack'
+
+    def decode(self, text_data=None, bytes_data=None):
+        if bytes_data is None:
+            return json.loads(text_data)
+        return msgpack.unpackb(bytes_data, raw=False)
+
+    def encode(self, payload):
+        return {'bytes_data': msgpack.packb(payload, use_bin_type=True)}
+
+    def from_json(self, text):
+        return {'bytes_data': _json_to_msgpack(text)}
+
+
+@lru_cache(maxsize=256)
+def _json_to_msgpack(text):
+    return msgpack.packb(json.loads(text), use_bin_type=True)
+
+
+CODECS = {codec.subprotocol: codec for codec in (JsonCodec(), MsgpackCodec())}
+
+DEFAULT_CODEC = CODECS['json']
+
+
+def negotiate(subprotocols):
+    """Pick the first offered subprotocol we support.
+
+    Returns ``(codec, subprotocol)``; the subprotocol is None when the
+    client offered none we know, which means plain JSON.
+    """
+    for subprotocol in subprotocols or ():
+        codec = CODECS.get(subprotocol)
+        if codec is not None:
+            return codec, subprotocol
+    return DEFAULT_CODEC, None
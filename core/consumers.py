@@ -1,339 +1,471 @@
-import json
+import asyncio
+import logging
+import time
 from channels.generic.websocket import AsyncWebsocketConsumer
-from channels.db import database_sync_to_async
+from django.core.exceptions import ValidationError
 from django.utils import timezone
-from .models import Game, Player, Event
-from .serializers import PlayerSerializer, EventSerializer
+from .broadcast import (
+    cell_group, frame_message, game_group, group_send_frame, group_send_many,
+    player_group, render_frame, team_group, unlocated_group
+)
+from .codecs import DEFAULT_CODEC, negotiate
+from .context import PlayerContext
+from .dbpool import db_sync_to_async
+from .deltas import PositionEncoder
+from .events import event_sink
+from .interest import InterestGrid, interest_grids
+from .load import DOWNSAMPLE, SHED, acquire_load_monitor, load_monitor, release_load_monitor
+from .metrics import metrics
+from .models import Game, Player
+from .movement import movement_filter
+from .outbound import POSITIONS, OutboundQueue
+from .positions import position_store
+from .presence import presence
+from .radar import radar_cache
+from .scheduler import acquire_scheduler, release_scheduler
+from .spatial import spatial_indexes
+from .ticker import acquire_ticker, release_ticker, snapshot_message
+from .trails import trail_store
+from .triggers import persist_effects, trigger_engine
+
+
+logger = logging.getLogger(__name__)
 
 
 class GameConsumer(AsyncWebsocketConsumer):
     """WebSocket consumer for real-time game updates"""
     
+    codec = DEFAULT_CODEC
+    
     async def connect(self):
         self.game_code = self.scope['url_route']['kwargs']['game_code']
-        self.game_group_name = f'game_{self.game_code}'
+        self.game_group_name = game_group(self.game_code)
         self.player_id = None
+        self.context = None
+        self.team = None
+        self.heartbeat_at = 0
+        self.position_encoder = None
+        self.cell = None
+        self.outbound = OutboundQueue(self.game_code)
+        self.writer = None
         
         # Join game group
         await self.channel_layer.group_add(
             self.game_group_name,
             self.channel_name
         )
+        # Movement from every cell until the player's position is known
+        await self.channel_layer.group_add(
+            unlocated_group(self.game_code),
+            self.channel_name
+        )
+        
+        # Movement is broadcast in batches by the game's ticker
+        acquire_ticker(self.game_code, self.channel_layer)
+        # Expiries, respawns and the game clock fire from the scheduler
+        acquire_scheduler(self.channel_layer)
+        # Event loop lag decides what to shed under overload
+        acquire_load_monitor()
         
-        await self.accept()
+        # JSON text frames unless the client negotiated another encoding
+        self.codec, subprotocol = negotiate(self.scope.get('subprotocols'))
+        await self.accept(subprotocol=subprotocol)
+        self.writer = asyncio.ensure_future(self.write_outbound())
     
     async def disconnect(self, close_code):
-        # Mark player as offline if they were connected
+        if self.writer is not None:
+            self.writer.cancel()
+        self.outbound.close()
+        release_ticker(self.game_code)
+        release_scheduler()
+        release_load_monitor()
+        
+        # The presence sweep marks the player offline once the debounce
+        # window passes without a reconnect
         if self.player_id:
-            await self.mark_player_offline(self.player_id)
-            await self.channel_layer.group_send(
-                self.game_group_name,
-                {
-                    'type': 'player_offline',
-                    'player_id': str(self.player_id)
-                }
-            )
+            await self.release_player(self.player_id)
+            trigger_engine.forget(self.game_code, self.player_id)
+            movement_filter.forget(self.game_code, self.player_id)
         
-        # Leave game group
+        # Leave game, team, player and interest groups
+        await self.leave_player_groups()
+        await self.channel_layer.group_discard(
+            unlocated_group(self.game_code),
+            self.channel_name
+        )
         await self.channel_layer.group_discard(
             self.game_group_name,
             self.channel_name
         )
     
-    async def receive(self, text_data):
-        """Handle incoming WebSocket messages"""
+    async def receive(self, text_data=None, bytes_data=None):
+        """Handle incoming WebSocket messages in the negotiated encoding"""
         try:
-            data = json.loads(text_data)
+            data = self.codec.decode(text_data, bytes_data)
             message_type = data.get('type')
             
+            if message_type != 'authenticate' and self.player_id:
+                # Any message counts as a heartbeat
+                await self.heartbeat(force=message_type == 'heartbeat')
+            
             if message_type == 'authenticate':
-                # Store player ID for this connection
-                self.player_id = data.get('player_id')
-                await self.mark_player_online(self.player_id)
-                
-                # Notify others that player is online
-                await self.channel_layer.group_send(
-                    self.game_group_name,
-                    {
-                        'type': 'player_online',
-                        'player_id': str(self.player_id)
-                    }
+                # Load the player once and cache it for this connection
+                await self.leave_player_groups()
+                self.context, came_online = await self.authenticate_player(
+                    data.get('player_id'), self.player_id
                 )
+                if self.context is None or self.context.game_code != self.game_code:
+                    self.context = self.player_id = None
+                    raise ValueError('Unknown player')
+                self.player_id = self.context.player_id
+                self.heartbeat_at = time.monotonic()
+                await self.join_player_groups(self.context.team)
+                await self.update_interest()
+                
+                # Notify others that player is online (not on a quick reconnect)
+                if came_online:
+                    await self.announce_online()
             
-            elif message_type == 'position_update':
-                # Update player position
-                await self.update_player_position(
-                    self.player_id,
+            elif message_type == 'position_update' and self.context:
+                # Update player position and run movement triggers
+                triggered = await self.update_player_position(
                     data.get('lat'),
                     data.get('lng'),
                     data.get('accuracy')
                 )
-                
-                # Broadcast position to other players
-                await self.channel_layer.group_send(
-                    self.game_group_name,
-                    {
-                        'type': 'player_moved',
-                        'player_id': str(self.player_id),
-                        'position': {
-                            'lat': data.get('lat'),
-                            'lng': data.get('lng')
-                        }
-                    }
-                )
+                if triggered:
+                    await group_send_many(self.channel_layer, triggered)
+                # The game's ticker broadcasts it with the next snapshot
+                await self.update_interest()
+            
+            elif message_type == 'position_encoding':
+                # Opt in to (or out of) compact delta-encoded position frames
+                await self.set_position_encoding(data.get('encoding'))
+            
+            elif message_type == 'position_ack' and self.position_encoder:
+                self.position_encoder.ack(data.get('seq'))
+            
+            elif message_type == 'position_resync' and self.position_encoder:
+                self.position_encoder.resync()
+                await self.send_positions()
             
             elif message_type == 'radar_ping':
-                # Request positions of all visible players
-                visible_players = await self.get_visible_players()
-                await self.send(text_data=json.dumps({
-                    'type': 'radar_response',
-                    'players': visible_players
-                }))
+                await self.radar_ping()
             
-            elif message_type == 'chat':
+            elif message_type == 'chat' and self.context:
                 # Handle in-game chat (team or public)
-                await self.handle_chat_message(
-                    self.player_id,
+                chat = await self.handle_chat_message(
                     data.get('message'),
-                    data.get('visibility', 'public')
+                    data.get('visibility', 'public'),
+                    data.get('recipient_ids', [])
                 )
+                if chat:
+                    message = frame_message({
+                        'type': 'chat_message',
+                        'player_name': chat['player_name'],
+                        'message': chat['message'],
+                        'visibility': chat['visibility'],
+                        'timestamp': chat['timestamp']
+                    })
+                    # Route by channel group instead of filtering on delivery
+                    await group_send_many(self.channel_layer, [
+                        (group_name, message)
+                        for group_name in self.chat_groups(chat)
+                    ])
             
         except Exception as e:
-            await self.send(text_data=json.dumps({
+            await self.send(**self.codec.encode({
                 'type': 'error',
                 'message': str(e)
             }))
     
-    # Message handlers for group broadcasts
-    async def player_joined(self, event):
-        """Handle player joined event"""
-        await self.send(text_data=json.dumps({
-            'type': 'player_joined',
-            'player': event['player']
-        }))
+    async def heartbeat(self, force=False):
+        """Renew the player's presence, at most a few times per TTL"""
+        now = time.monotonic()
+        if not force and now - self.heartbeat_at < presence.ttl / 3:
+            return
+        self.heartbeat_at = now
+        came_online = await db_sync_to_async(presence.refresh)(
+            self.player_id, self.game_code
+        )
+        if came_online:
+            await self.announce_online()
     
-    async def player_left(self, event):
-        """Handle player left event"""
-        await self.send(text_data=json.dumps({
-            'type': 'player_left',
-            'player_id': event['player_id']
-        }))
+    async def radar_ping(self):
+        """Answer from the game's radar snapshot; rebuilt at most once per TTL"""
+        level = load_monitor.level
+        if level >= SHED:
+            # Low priority: the client pings again
+            load_monitor.shed('radar_dropped', game=self.game_code)
+            return
+        snapshot = radar_cache.peek(self.game_code)
+        if snapshot is None and level >= DOWNSAMPLE:
+            snapshot = radar_cache.latest(self.game_code)
+            if snapshot is not None:
+                load_monitor.shed('radar_stale', game=self.game_code)
+        if snapshot is None:
+            snapshot = await db_sync_to_async(radar_cache.get)(self.game_code)
+        await self.send_frame(snapshot.render(self.team, self.player_id))
     
-    async def player_online(self, event):
-        """Handle player online event"""
-        await self.send(text_data=json.dumps({
-            'type': 'player_online',
-            'player_id': event['player_id']
-        }))
+    async def set_position_encoding(self, encoding):
+        if encoding == 'delta':
+            self.position_encoder = PositionEncoder()
+            # Start from everything the game already knows within our
+            # interest cells, minus ourselves
+            grid = interest_grids.peek(self.game_code)
+            cells = InterestGrid.neighbourhood(self.cell)
+            self.position_encoder.update({
+                player_id: (fix.lat, fix.lng)
+                for player_id, fix in position_store.positions(self.game_code).items()
+                if player_id != str(self.player_id)
+                and (grid is None or not cells or grid.cell(fix.lat, fix.lng) in cells)
+            })
+            await self.send_positions()
+        elif encoding == 'json':
+            self.position_encoder = None
+        else:
+            raise ValueError(f'Unknown position encoding: {encoding}')
     
-    async def player_offline(self, event):
-        """Handle player offline event"""
-        await self.send(text_data=json.dumps({
-            'type': 'player_offline',
-            'player_id': event['player_id']
-        }))
+    async def send_positions(self, coordinates=None):
+        """Send the next delta frame (a keyframe if one is due)"""
+        if coordinates:
+            own = str(self.player_id) if self.player_id else None
+            coordinates = {
+                player_id: position for player_id, position in coordinates.items()
+                if player_id != own
+            }
+        text = self.position_encoder.encode(coordinates)
+        if text is not None:
+            await self.send_frame(text)
     
-    async def player_moved(self, event):
-        """Handle player movement event"""
-        # Don't send position updates back to the sender
-        if event.get('player_id') != str(self.player_id):
-            await self.send(text_data=json.dumps({
-                'type': 'player_moved',
-                'player_id': event['player_id'],
-                'position': event['position']
-            }))
+    async def send_frame(self, text):
+        """Send a frame that is already JSON text, converted to this connection's encoding"""
+        await self.send(**self.codec.from_json(text))
     
-    async def game_started(self, event):
-        """Handle game start event"""
-        await self.send(text_data=json.dumps({
-            'type': 'game_started',
-            'teams': event['teams']
-        }))
+    async def announce_online(self):
+        await group_send_frame(
+            self.channel_layer,
+            self.game_group_name,
+            {
+                'type': 'player_online',
+                'player_id': str(self.player_id)
+            }
+        )
     
-    async def task_launched(self, event):
-        """Handle task launch event"""
-        await self.send(text_data=json.dumps({
-            'type': 'task_launched',
-            'task': event['task']
-        }))
+    # Channel group membership
+    async def join_player_groups(self, team):
+        """Join the per-player group and, once assigned, the team group"""
+        if not self.player_id:
+            return
+        await self.channel_layer.group_add(
+            player_group(self.player_id),
+            self.channel_name
+        )
+        await self.switch_team(team)
     
-    async def task_updated(self, event):
-        """Handle task update event"""
-        await self.send(text_data=json.dumps({
-            'type': 'task_updated',
-            'task': event['task']
-        }))
+    async def leave_player_groups(self):
+        """Leave the per-player, team and interest cell groups"""
+        if not self.player_id:
+            return
+        await self.move_interest(None)
+        await self.switch_team(None)
+        await self.channel_layer.group_discard(
+            player_group(self.player_id),
+            self.channel_name
+        )
     
-    async def item_collected(self, event):
-        """Handle item collection event"""
-        await self.send(text_data=json.dumps({
-            'type': 'item_collected',
-            'item_id': event['item_id'],
-            'player_id': event['player_id']
-        }))
+    async def switch_team(self, team):
+        """Move this connection from its current team group to another"""
+        if team == self.team:
+            return
+        if self.team:
+            await self.channel_layer.group_discard(
+                team_group(self.game_code, self.team),
+                self.channel_name
+            )
+        if team:
+            await self.channel_layer.group_add(
+                team_group(self.game_code, team),
+                self.channel_name
+            )
+        self.team = team
     
-    async def item_used(self, event):
-        """Handle item use event"""
-        await self.send(text_data=json.dumps({
-            'type': 'item_used',
-            'item_type': event['item_type'],
-            'player_id': event['player_id'],
-            'effects': event.get('effects', {})
-        }))
+    async def update_interest(self):
+        """Follow the player's latest position across interest cells"""
+        grid = interest_grids.peek(self.game_code)
+        fix = position_store.get(self.game_code, self.player_id)
+        if grid is None or fix is None:
+            return
+        added = await self.move_interest(grid.locate(fix.lat, fix.lng, self.cell))
+        if added:
+            metrics.incr('interest_cell_changes', game=self.game_code)
+            # Players already standing in the new cells will not move into view
+            await self.send_cell_positions(grid, added)
     
-    async def player_killed(self, event):
-        """Handle player death event"""
-        await self.send(text_data=json.dumps({
-            'type': 'player_killed',
-            'victim_id': event['victim_id'],
-            'killer_id': event.get('killer_id'),
-            'cause': event.get('cause')
-        }))
+    async def move_interest(self, cell):
+        """Subscribe to the cells around ``cell`` (every cell when None); returns the cells added"""
+        if cell == self.cell:
+            return set()
+        old = InterestGrid.neighbourhood(self.cell)
+        new = InterestGrid.neighbourhood(cell)
+        discard = [cell_group(self.game_code, c) for c in old - new]
+        add = [cell_group(self.game_code, c) for c in new - old]
+        if self.cell is None:
+            discard.append(unlocated_group(self.game_code))
+        if cell is None:
+            add.append(unlocated_group(self.game_code))
+        await asyncio.gather(
+            *(self.channel_layer.group_discard(group, self.channel_name) for group in discard),
+            *(self.channel_layer.group_add(group, self.channel_name) for group in add)
+        )
+        self.cell = cell
+        return new - old
     
-    async def game_ended(self, event):
-        """Handle game end event"""
-        await self.send(text_data=json.dumps({
-            'type': 'game_ended',
-            'winner': event['winner'],
-            'stats': event.get('stats', {})
-        }))
+    async def send_cell_positions(self, grid, cells):
+        """Queue the known positions of other players in some cells"""
+        own = str(self.player_id)
+        fixes = [
+            fix for player_id, fix in position_store.positions(self.game_code).items()
+            if player_id != own and grid.cell(fix.lat, fix.lng) in cells
+        ]
+        if fixes:
+            self.outbound.put_positions(snapshot_message(fixes), self.player_id)
     
-    async def chat_message(self, event):
-        """Handle chat message event"""
-        # Check visibility rules
-        if await self.should_receive_message(event):
-            await self.send(text_data=json.dumps({
-                'type': 'chat_message',
-                'player_name': event['player_name'],
-                'message': event['message'],
-                'visibility': event['visibility'],
-                'timestamp': event['timestamp']
-            }))
+    def chat_groups(self, chat):
+        """Return the channel groups a chat message should be sent to"""
+        if chat['visibility'] == 'team':
+            if not chat['player_team']:
+                return []
+            return [team_group(self.game_code, chat['player_team'])]
+        if chat['visibility'] == 'private':
+            return [player_group(recipient_id) for recipient_id in chat['recipient_ids']]
+        return [self.game_group_name]
     
-    # Database operations
-    @database_sync_to_async
-    def mark_player_online(self, player_id):
-        """Mark player as online"""
-        try:
-            player = Player.objects.get(id=player_id)
-            player.is_online = True
-            player.visibility = 'active'
-            player.last_seen = timezone.now()
-            player.save()
-        except Player.DoesNotExist:
-            pass
+    # Message handlers for group broadcasts
+    async def broadcast_frame(self, event):
+        """Queue a pre-encoded group frame (see core.broadcast) for the writer"""
+        if event.get('frame_type') == 'positions_snapshot':
+            # Merged with any snapshot still waiting to go out
+            self.outbound.put_positions(event, self.player_id)
+            return
+        text = render_frame(event, self.player_id)
+        if text is not None:
+            self.outbound.put(text, event.get('frame_type'))
     
-    @database_sync_to_async
-    def mark_player_offline(self, player_id):
-        """Mark player as offline"""
-        try:
-            player = Player.objects.get(id=player_id)
-            player.is_online = False
-            player.visibility = 'dark'
-            player.save()
-        except Player.DoesNotExist:
-            pass
+    async def write_outbound(self):
+        """Send queued frames in order for the life of the connection"""
+        while True:
+            item = await self.outbound.get()
+            try:
+                await self.send_outbound(item)
+            except Exception:
+                logger.exception("Outbound send failed for game %s", self.game_code)
     
-    @database_sync_to_async
-    def update_player_position(self, player_id, lat, lng, accuracy=None):
-        """Update player position in database"""
-        try:
-            player = Player.objects.get(id=player_id)
-            player.position_lat = lat
-            player.position_lng = lng
-            if accuracy:
-                player.position_accuracy = accuracy
-            player.visibility = 'active'
-            player.last_seen = timezone.now()
-            player.save()
-            
-            # Log position event (throttle in production)
-            Event.objects.create(
-                game=player.game,
-                type='player_moved',
-                player=player,
-                message=f"{player.name} moved",
-                position_lat=lat,
-                position_lng=lng,
-                visibility='team'
-            )
-        except Player.DoesNotExist:
-            pass
+    async def send_outbound(self, item):
+        """Send one item taken from the outbound queue"""
+        if item is not POSITIONS:
+            await self.send_frame(item)
+            return
+        text, coordinates = self.outbound.take_positions()
+        if self.position_encoder is not None:
+            await self.send_positions(coordinates)
+        elif text is not None:
+            await self.send_frame(text)
     
-    @database_sync_to_async
-    def get_visible_players(self):
-        """Get list of visible players in the game"""
-        try:
-            game = Game.objects.get(code=self.game_code)
-            players = game.players.filter(
-                is_online=True,
-                visibility__in=['active', 'recent']
-            ).exclude(id=self.player_id)
-            
-            # Serialize player data
-            return [
-                {
-                    'id': str(player.id),
-                    'name': player.name,
-                    'team': player.team,
-                    'position': {
-                        'lat': player.position_lat,
-                        'lng': player.position_lng
-                    } if player.position_lat else None,
-                    'visibility': player.visibility
-                }
-                for player in players
-            ]
-        except Game.DoesNotExist:
-            return []
+    async def player_context(self, event):
+        """Refresh the cached player context (team, death, revive, ...)"""
+        if self.context is None:
+            return
+        self.context.apply(event['changes'])
+        await self.switch_team(self.context.team)
     
-    @database_sync_to_async
-    def handle_chat_message(self, player_id, message, visibility):
-        """Handle and broadcast chat message"""
-        try:
-            player = Player.objects.get(id=player_id)
-            
-            # Create chat event
-            Event.objects.create(
-                game=player.game,
-                type='chat',
-                player=player,
-                message=message,
-                visibility=visibility
-            )
-            
-            # Broadcast to group
-            return {
-                'player_name': player.name,
-                'player_team': player.team,
-                'message': message,
-                'visibility': visibility,
-                'timestamp': timezone.now().isoformat()
-            }
-        except Player.DoesNotExist:
-            return None
+    # Database operations
+    @db_sync_to_async
+    def authenticate_player(self, player_id, previous_player_id=None):
+        """Load the player's connection context and register their presence"""
+        if previous_player_id:
+            presence.disconnect(previous_player_id)
+        context = PlayerContext.load(player_id)
+        if context is None or context.game_code != self.game_code:
+            return context, False
+        came_online = presence.connect(context.player_id, context.game_code)
+        # Build the game's spatial index now so triggers can run in memory,
+        # and its interest grid so movement fans out by map cell
+        if (
+            spatial_indexes.peek(context.game_code) is None
+            or interest_grids.peek(context.game_code) is None
+        ):
+            game = Game.objects.get(id=context.game_id)
+            spatial_indexes.get(game)
+            interest_grids.get(game)
+        return context, came_online
     
-    @database_sync_to_async
-    def should_receive_message(self, event):
-        """Check if player should receive a message based on visibility"""
-        if event['visibility'] == 'public':
-            return True
+    @db_sync_to_async
+    def release_player(self, player_id):
+        """Persist the last buffered position and trail, then start the offline debounce"""
+        position_store.flush_player(player_id)
+        # Snapshots and the tick rate only count connected players
+        position_store.forget(self.game_code, player_id)
+        trail_store.flush_player(player_id)
+        presence.disconnect(player_id)
+    
+    @db_sync_to_async
+    def update_player_position(self, lat, lng, accuracy=None):
+        """Record player position and return the messages any triggers produced"""
+        if lat is None or lng is None:
+            return []
         
-        if not self.player_id:
-            return False
+        # GPS jitter stops here: nothing is stored, triggered or broadcast
+        filtered = movement_filter.filter(self.game_code, self.player_id, lat, lng, accuracy)
+        if filtered is None:
+            return []
+        lat, lng, accuracy = filtered
         
-        try:
-            player = Player.objects.get(id=self.player_id)
-            sender_team = event.get('player_team')
-            
-            if event['visibility'] == 'team':
-                return player.team == sender_team
-            
-            if event['visibility'] == 'private':
-                recipient_ids = event.get('recipient_ids', [])
-                return str(self.player_id) in recipient_ids
-            
-        except Player.DoesNotExist:
-            pass
+        fix = position_store.record(self.game_code, self.player_id, lat, lng, accuracy)
+        trail_store.append(self.context.game_id, self.player_id, lat, lng, fix.timestamp)
+        if position_store.write_through:
+            position_store.flush()
+        spatial_indexes.move_player(self.game_code, self.player_id, lat, lng)
+        effects = trigger_engine.evaluate(
+            spatial_indexes.peek(self.game_code),
+            self.game_code,
+            self.player_id,
+            lat,
+            lng,
+            is_alive=self.context.is_alive
+        )
+        
+        if not effects:
+            return []
+        return persist_effects(self.context.game_id, self.game_code, effects)
+    
+    @db_sync_to_async
+    def handle_chat_message(self, message, visibility, recipient_ids=()):
+        """Log a chat message and return the data to broadcast"""
+        if visibility == 'private':
+            # Private chat only reaches players of this game
+            try:
+                recipient_ids = list(Player.objects.filter(
+                    game_id=self.context.game_id, id__in=list(recipient_ids)
+                ).values_list('id', flat=True))
+            except (TypeError, ValueError, ValidationError):
+                recipient_ids = []
+        else:
+            recipient_ids = []
+        
+        event_sink.record(
+            game_id=self.context.game_id,
+            type='chat',
+            player_id=self.player_id,
+            message=message,
+            visibility=visibility
+        )
         
-        return False
\ No newline at end of file
+        return {
+            'player_name': self.context.name,
+            'player_team': self.context.team,
+            'message': message,
+            'visibility': visibility,
+            'recipient_ids': recipient_ids,
+            'timestamp': timezone.now().isoformat()
+        }
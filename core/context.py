@@ -0,0 +1,50 @@
+from django.core.exceptions import ValidationError
+
+from .models import Player
+
+
+class PlayerContext:
+    """Connection-scoped snapshot of the authenticated player.
+
+    Loaded once when a socket authenticates so the per-message path does
+    not have to look the player up again. Fields that can change during
+    a game are refreshed by ``player.context`` messages sent to the
+    player's channel group (see ``core.broadcast.player_context_message``).
+    """
+
+    FIELDS = ('name', 'team', 'game_id', 'game_code', 'is_alive')
+
+    def __init__(self, player_id, name, team, game_id, game_code, is_alive):
+        self.player_id = str(player_id)
+        self.name = name
+        self.team = team
+        self.game_id = game_id
+        self.game_code = game_code
+        self.is_alive = is_alive
+
+    @classmethod
+    def load(cls, player_id):
+        """Load a player's context with a single query, or None if unknown"""
+        try:
+            row = Player.objects.filter(id=player_id).values(
+                'id', 'name', 'team', 'game_id', 'game__code', 'is_alive'
+            ).first()
+        except ValidationError:
+            # Malformed ids fail UUID validation
+            return None
+        if row is None:
+            return None
+        return cls(
+            player_id=row['id'],
+            name=row['name'],
+            team=row['team'],
+            game_id=row['game_id'],
+            game_code=row['game__code'],
+            is_alive=row['is_alive'],
+        )
+
+    def apply(self, changes):
+        """Apply an invalidation payload, ignoring unknown fields"""
+        for field, value in changes.items():
+            if field in self.FIELDS:
+                setattr(self, field, value)
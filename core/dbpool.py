@@ -0,0 +1,74 @@
+"""Bounded thread pool for the database work of the real-time path.
+
+Channels' ``database_sync_to_async`` is thread-sensitive by default.
+Every call in a worker process then runs on the same single thread, so
+one slow query holds up position updates, chat and radar for every
+game on that worker. ``db_sync_to_async`` runs the call on a shared pool
+of ``CONSUMER_DB_THREADS`` threads instead.
+
+Each pool thread keeps its own Django connection, so the pool size also
+bounds how many connections a worker opens. Connections are cleaned up
+around every call as Channels does: they are closed when broken or older
+than ``CONN_MAX_AGE``, and reused otherwise.
+
+Code run this way must not depend on staying on one thread. The
+in-memory stores it touches (positions, presence, trails, triggers,
+spatial indexes) all take their own locks.
+"""
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from channels.db import DatabaseSyncToAsync
+from django.conf import settings
+
+
+class DatabaseThreadPool:
+    """Lazily created executor sized from ``CONSUMER_DB_THREADS``"""
+
+    def __init__(self):
+        self._executor = None
+        self._size = None
+        self._lock = threading.Lock()
+
+    @property
+    def size(self):
+        return getattr(settings, 'CONSUMER_DB_THREADS', 8)
+
+    @property
+    def executor(self):
+        size = self.size
+        if self._executor is None or self._size != size:
+            with self._lock:
+                if self._executor is None or self._size != size:
+                    previous = self._executor
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=size, thread_name_prefix='consumer-db'
+                    )
+                    self._size = size
+                    if previous is not None:
+                        # Calls already queued there still run
+                        previous.shutdown(wait=False)
+        return self._executor
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+
+db_pool = DatabaseThreadPool()
+
+
+def db_sync_to_async(func):
+    """Run a sync, database-touching callable on the pool from async code.
+
+    Usable as a decorator on consumer methods, like ``database_sync_to_async``.
+    """
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await DatabaseSyncToAsync(
+            func, thread_sensitive=False, executor=db_pool.executor
+        )(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,201 @@
+"""Compact, delta-encoded position frames for clients that opt in.
+
+A connection that sends ``{"type": "position_encoding", "encoding":
+"delta"}`` receives ``positions_snapshot`` broadcasts re-encoded by its
+own ``PositionEncoder`` instead of the shared JSON text:
+
+* players are referred to by small per-connection indices, introduced
+  in an ``i`` map (``{"3": "<uuid>"}``) until a frame carrying them is
+  acknowledged;
+* coordinates are integers of 1e-6 degrees (``SCALE``), about 11 cm;
+* every frame has a sequence number ``s``. A frame with a base ``b``
+  lists, relative to the client's state after frame ``b``, the players
+  whose position changed: ``d`` holds ``[index, dlat, dlng]`` deltas and
+  ``a`` holds ``[index, lat, lng]`` for players the base did not have.
+  Players not listed keep their base position. A keyframe has no base
+  and lists every player in ``a``.
+
+The client acknowledges frames with ``{"type": "position_ack", "seq":
+s}``; deltas are always taken from the last acknowledged frame, so
+frames dropped on the way never corrupt the client's state. Keyframes
+are sent first, every ``POSITION_KEYFRAME_INTERVAL`` frames, when acks
+fall more than ``POSITION_DELTA_HISTORY`` frames behind, and after a
+``{"type": "position_resync"}``. ``PositionDecoder`` is the reference
+client implementation.
+"""
+import json
+
+from django.conf import settings
+
+
+# Coordinates travel as integers of 1 / SCALE degrees
+SCALE = 1_000_000
+
+FRAME_DELTA = 'pd'
+FRAME_KEY = 'pk'
+
+
+def quantize(value):
+    return round(value * SCALE)
+
+
+def dequantize(value):
+    return value / SCALE
+
+
+def dumps(frame):
+    return json.dumps(frame, separators=(',', ':'))
+
+
+class PositionEncoder:
+    """Per-connection encoder holding the world state the client has acknowledged"""
+
+    def __init__(self, keyframe_interval=None, history=None):
+        self.keyframe_interval = keyframe_interval or getattr(
+            settings, 'POSITION_KEYFRAME_INTERVAL', 100
+        )
+        self.history = history or getattr(settings, 'POSITION_DELTA_HISTORY', 32)
+        self.seq = 0
+        self.indices = {}
+        self.world = {}
+        self.sent = {}
+        self.acked_seq = None
+        self.acked = {}
+        self._pending_indices = {}
+        self._since_keyframe = 0
+        self._need_keyframe = True
+
+    def update(self, positions):
+        """Merge ``{player_id: (lat, lng)}`` into the current world"""
+        for player_id, (lat, lng) in positions.items():
+            self.world[str(player_id)] = (quantize(lat), quantize(lng))
+
+    def encode(self, positions=None):
+        """Merge new positions and return the next frame's text, or None if nothing changed"""
+        if positions:
+            self.update(positions)
+        if (
+            self._need_keyframe
+            or self._since_keyframe >= self.keyframe_interval
+            or len(self.sent) >= self.history
+        ):
+            return self.keyframe()
+
+        changed = {
+            player_id: position for player_id, position in self.world.items()
+            if self.acked.get(player_id) != position
+        }
+        if not changed:
+            return None
+        frame = {'t': FRAME_DELTA, 's': self._next_seq()}
+        if self.acked_seq is not None:
+            frame['b'] = self.acked_seq
+        deltas, absolute = [], []
+        for player_id, (lat, lng) in changed.items():
+            index = self._index(player_id)
+            base = self.acked.get(player_id)
+            if base is None:
+                absolute.append([index, lat, lng])
+            else:
+                deltas.append([index, lat - base[0], lng - base[1]])
+        if self._pending_indices:
+            frame['i'] = {
+                str(index): player_id
+                for index, (player_id, _) in self._pending_indices.items()
+            }
+        if deltas:
+            frame['d'] = deltas
+        if absolute:
+            frame['a'] = absolute
+        return self._sent(frame)
+
+    def keyframe(self):
+        """Return a frame listing every player absolutely, with the full index map"""
+        frame = {
+            't': FRAME_KEY,
+            's': self._next_seq(),
+            'a': [[self._index(player_id), lat, lng] for player_id, (lat, lng) in self.world.items()],
+        }
+        frame['i'] = {str(index): player_id for player_id, index in self.indices.items()}
+        # Unacknowledged frames stop being usable bases past a keyframe
+        self.sent.clear()
+        self._need_keyframe = False
+        self._since_keyframe = 0
+        return self._sent(frame)
+
+    def ack(self, seq):
+        """Adopt the state after frame ``seq`` as the base for future deltas"""
+        state = self.sent.get(seq)
+        if state is None:
+            return False
+        self.acked_seq, self.acked = seq, state
+        self.sent = {s: sent for s, sent in self.sent.items() if s > seq}
+        self._pending_indices = {
+            index: (player_id, introduced)
+            for index, (player_id, introduced) in self._pending_indices.items()
+            if introduced > seq
+        }
+        return True
+
+    def resync(self):
+        """Forget what the client acknowledged and start over with a keyframe"""
+        self.acked_seq, self.acked = None, {}
+        self.sent.clear()
+        self._need_keyframe = True
+
+    def _next_seq(self):
+        self.seq += 1
+        return self.seq
+
+    def _index(self, player_id):
+        index = self.indices.get(player_id)
+        if index is None:
+            index = self.indices[player_id] = len(self.indices)
+            self._pending_indices[index] = (player_id, self.seq)
+        return index
+
+    def _sent(self, frame):
+        self._since_keyframe += 1
+        if frame['t'] == FRAME_KEY:
+            # A keyframe introduces every index at once
+            self._pending_indices = {
+                index: (player_id, frame['s'])
+                for index, (player_id, _) in self._pending_indices.items()
+            }
+        self.sent[frame['s']] = dict(self.world)
+        return dumps(frame)
+
+
+class PositionDecoder:
+    """Reference client for delta frames: rebuilds positions and says what to ack"""
+
+    def __init__(self):
+        self.players = {}
+        self.states = {}
+        self.state = {}
+
+    def decode(self, text):
+        """Apply a frame; returns ``{player_id: (lat, lng)}`` after it"""
+        frame = json.loads(text)
+        for index, player_id in frame.get('i', {}).items():
+            self.players[int(index)] = player_id
+        if frame['t'] == FRAME_KEY or 'b' not in frame:
+            state = {}
+        else:
+            state = dict(self.states[frame['b']])
+        for index, dlat, dlng in frame.get('d', ()):
+            lat, lng = state[index]
+            state[index] = (lat + dlat, lng + dlng)
+        for index, lat, lng in frame.get('a', ()):
+            state[index] = (lat, lng)
+        self.states[frame['s']] = state
+        self.state = state
+        return {
+            self.players[index]: (dequantize(lat), dequantize(lng))
+            for index, (lat, lng) in state.items()
+        }
+
+    def ack(self, seq):
+        """Drop states older than an acknowledged frame; returns the ack message"""
+        self.states = {s: state for s, state in self.states.items() if s >= seq}
+        return {'type': 'position_ack', 'seq': seq}
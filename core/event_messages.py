@@ -0,0 +1,51 @@
+"""Event log messages, rendered when read.
+
+Templated events store only their type and a few ``params``. The English
+text is built here when an event is serialized, instead of being stored
+in every row. A template is a ``str.format`` string or a callable, given
+the params plus ``player``, the event player's name. ``Event.message`` is
+returned as is for free text (chat) and for old rows the backfill could
+not parse.
+"""
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+
+def _item_name(item_type):
+    return item_type.replace('_', ' ')
+
+
+EVENT_TEMPLATES = {
+    'player_joined': lambda v: f"{v['player']} {'created' if v.get('host') else 'joined'} the game",
+    'player_left': "{player} left the game",
+    'game_started': "Game started with {players} players",
+    'game_ended': "Time ran out; {winner} team wins",
+    'item_picked': "{player} picked up {item}",
+    'item_used': "{player} used {item}",
+    'item_respawn': "{item} respawned",
+    'explosion': lambda v: f"A {_item_name(v['item'])} exploded",
+    'player_killed': "{player} was killed by an explosion",
+    'motion_detected': lambda v: f"{_item_name(v['item']).capitalize()} detected movement",
+}
+
+
+def render_message(event):
+    """The text of an event: its stored message, or its template filled in"""
+    if event.message:
+        return event.message
+    template = EVENT_TEMPLATES.get(event.type)
+    if template is None:
+        return ''
+    values = {
+        'player': event.player.name if event.player_id else 'Someone',
+        **(event.params or {}),
+    }
+    try:
+        if callable(template):
+            return template(values)
+        return template.format_map(values)
+    except (KeyError, AttributeError, ValueError):
+        logger.warning("Event %s has params %r that do not fit its template", event.id, event.params)
+        return event.get_type_display()
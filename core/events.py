@@ -0,0 +1,126 @@
+"""Write-behind sink for the game event log.
+
+Most ``Event`` rows are an audit trail nobody reads during the request
+that logs them (joins, pickups, item use, chat). ``event_sink.record``
+buffers those in this worker's memory and writes them with one
+``bulk_create`` every ``EVENT_FLUSH_INTERVAL`` seconds, or as soon as
+``EVENT_BATCH_SIZE`` are waiting. An interval of 0 writes each event as
+it is recorded (tests).
+
+Events that change the outcome of a game (``CRITICAL_EVENT_TYPES``) are
+still written straight away, in the caller's transaction. Buffered
+events recorded inside a transaction only join the buffer once it
+commits, so a rollback discards them too. ``created_at`` is taken when
+the event is recorded, not when it is written.
+
+Buffered events are written at interpreter exit; the event API flushes
+before reading so a worker always serves its own events.
+"""
+import logging
+import threading
+
+from django.conf import settings
+from django.db import transaction
+
+from .background import PeriodicWorker
+from .models import Event
+
+
+logger = logging.getLogger(__name__)
+
+CRITICAL_EVENT_TYPES = frozenset({
+    'game_started', 'game_ended', 'player_killed', 'player_revived', 'explosion',
+})
+
+
+class EventSink:
+    """Buffers non-critical events and writes them in batches"""
+
+    def __init__(self, flush_interval=None, batch_size=None):
+        self._flush_interval = flush_interval
+        self._batch_size = batch_size
+        self._lock = threading.Lock()
+        self._pending = []
+        self._worker = None
+
+    @property
+    def flush_interval(self):
+        if self._flush_interval is not None:
+            return self._flush_interval
+        return getattr(settings, 'EVENT_FLUSH_INTERVAL', 2.0)
+
+    @property
+    def batch_size(self):
+        if self._batch_size is not None:
+            return self._batch_size
+        return getattr(settings, 'EVENT_BATCH_SIZE', 100)
+
+    @property
+    def pending(self):
+        return len(self._pending)
+
+    def record(self, **fields):
+        """Log an event (``Event.objects.create`` arguments); returns the Event"""
+        event = Event(**fields)
+        if event.type in CRITICAL_EVENT_TYPES or self.flush_interval <= 0:
+            event.save(force_insert=True)
+        elif transaction.get_connection().in_atomic_block:
+            transaction.on_commit(lambda: self._buffer(event))
+        else:
+            self._buffer(event)
+        return event
+
+    def flush(self):
+        """Write every buffered event; returns the number written"""
+        with self._lock:
+            events, self._pending = self._pending, []
+        if not events:
+            return 0
+        try:
+            Event.objects.bulk_create(events, batch_size=500)
+        except Exception:
+            # One bad row (e.g. its game was deleted meanwhile) must not
+            # hold back the rest: write them one by one and drop failures
+            logger.warning("Batched event write failed; retrying row by row", exc_info=True)
+            return self._write_each(events)
+        return len(events)
+
+    def close(self, flush=True):
+        if self._worker is not None:
+            self._worker.stop(flush=flush)
+            self._worker = None
+        elif flush:
+            self.flush()
+
+    def _buffer(self, event):
+        with self._lock:
+            self._pending.append(event)
+            full = len(self._pending) >= self.batch_size
+        if full:
+            self.flush()
+        else:
+            self._ensure_worker()
+
+    def _write_each(self, events):
+        written = 0
+        for event in events:
+            try:
+                with transaction.atomic():
+                    event.save(force_insert=True)
+            except Exception:
+                logger.exception("Dropped %s event for game %s", event.type, event.game_id)
+            else:
+                written += 1
+        return written
+
+    def _ensure_worker(self):
+        if self._worker is None:
+            with self._lock:
+                if self._worker is None:
+                    self._worker = PeriodicWorker(
+                        'event-flush', self.flush, self.flush_interval
+                    )
+        self._worker.start()
+
+
+event_sink = EventSink()
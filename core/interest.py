@@ -0,0 +1,106 @@
+"""Cell-based interest management for position fanout.
+
+Each game's map is divided into square cells sized from ``map_radius``.
+The ticker publishes a mover's position only to the channel group of the
+cell the mover is in. A located connection subscribes to its own cell's
+group and the eight around it, and re-subscribes as its player crosses
+cell boundaries. So a player hears about everyone within at least one
+cell of them and nobody on the far side of a large map.
+
+Connections whose player has no known position yet (spectators, players
+before their first fix) join the game's ``unlocated`` group. It still
+receives every snapshot. Per-recipient rules (dropping your own entry,
+radar visibility, team routing) apply on top, as before.
+"""
+import math
+import threading
+
+from django.conf import settings
+
+from . import geo
+
+
+def cell_size_for(map_radius):
+    """Interest cell size in meters for a map, or None when interest management is off"""
+    cells_per_radius = getattr(settings, 'INTEREST_CELLS_PER_RADIUS', 4)
+    if not cells_per_radius:
+        return None
+    return max(getattr(settings, 'INTEREST_MIN_CELL_SIZE', 100), map_radius / cells_per_radius)
+
+
+class InterestGrid:
+    """Square cells over one game's map, projected around its home base"""
+
+    def __init__(self, origin_lat, origin_lng, cell_size):
+        self.origin_lat = origin_lat
+        self.origin_lng = origin_lng
+        self.cell_size = cell_size
+        self._meters_per_deg_lng = float(geo.meters_per_degree_lng(origin_lat))
+
+    def project(self, lat, lng):
+        """Return planar (x, y) meters from the origin"""
+        return (
+            (lng - self.origin_lng) * self._meters_per_deg_lng,
+            (lat - self.origin_lat) * geo.METERS_PER_DEGREE_LAT,
+        )
+
+    def cell(self, lat, lng):
+        x, y = self.project(lat, lng)
+        return (math.floor(x / self.cell_size), math.floor(y / self.cell_size))
+
+    def locate(self, lat, lng, current=None):
+        """Return the cell a subscriber at ``(lat, lng)`` belongs to.
+
+        A subscriber keeps ``current`` until it is more than
+        ``INTEREST_HYSTERESIS`` of a cell past its edge. This stops a player
+        walking along a boundary from churning nine group subscriptions.
+        """
+        if current is not None:
+            margin = self.cell_size * getattr(settings, 'INTEREST_HYSTERESIS', 0.1)
+            x, y = self.project(lat, lng)
+            cx, cy = current
+            if (
+                cx * self.cell_size - margin <= x < (cx + 1) * self.cell_size + margin
+                and cy * self.cell_size - margin <= y < (cy + 1) * self.cell_size + margin
+            ):
+                return current
+        return self.cell(lat, lng)
+
+    @staticmethod
+    def neighbourhood(cell):
+        """A cell and the eight cells around it"""
+        if cell is None:
+            return set()
+        cx, cy = cell
+        return {(cx + dx, cy + dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)}
+
+
+class InterestGridRegistry:
+    """Per-process cache of each game's interest grid, keyed by game code"""
+
+    def __init__(self):
+        self._grids = {}
+        self._lock = threading.Lock()
+
+    def get(self, game):
+        """Return the game's grid, building it on first use (None when disabled)"""
+        grid = self._grids.get(game.code)
+        if grid is not None:
+            return grid
+        cell_size = cell_size_for(game.map_radius)
+        if cell_size is None:
+            return None
+        with self._lock:
+            grid = self._grids.setdefault(
+                game.code, InterestGrid(game.home_base_lat, game.home_base_lng, cell_size)
+            )
+        return grid
+
+    def peek(self, game_code):
+        return self._grids.get(game_code)
+
+    def discard(self, game_code):
+        self._grids.pop(game_code, None)
+
+
+interest_grids = InterestGridRegistry()
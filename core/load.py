@@ -0,0 +1,137 @@
+"""Message priority classes and event-loop-lag load shedding.
+
+Every frame type belongs to a priority class:
+
+* ``HIGH`` covers game-state changes a client must not miss (kills,
+  revives, game start and end). They are never shed or dropped.
+* ``LOW`` covers traffic that the next update supersedes anyway
+  (movement snapshots, radar, derived visibility).
+* ``NORMAL`` is everything else.
+
+The ``LoadMonitor`` samples how late the worker's event loop wakes from
+a short sleep. It keeps a moving average so that only sustained lag
+counts. Above ``LOAD_SHED_DOWNSAMPLE_LAG`` seconds the worker down-samples
+low-priority traffic: position ticks slow by ``LOAD_SHED_DOWNSAMPLE_FACTOR``
+and radar pings reuse the last snapshot however old. Above
+``LOAD_SHED_DROP_LAG`` it sheds low-priority traffic entirely: position
+ticks are skipped (movement stays buffered and goes out once load
+subsides), radar pings go unanswered and queued low-priority frames are
+dropped. Normal and high-priority messages keep flowing at every level.
+
+Each decision is counted as ``load_shed{action=...,priority=...}``. The
+current ``event_loop_lag`` and ``load_level`` are exported as gauges.
+"""
+import asyncio
+import logging
+
+from django.conf import settings
+
+from .metrics import metrics
+
+
+logger = logging.getLogger(__name__)
+
+HIGH, NORMAL, LOW = 'high', 'normal', 'low'
+
+HIGH_PRIORITY_TYPES = frozenset({
+    'game_started', 'game_ended', 'player_killed', 'player_revived',
+    'task_launched',
+})
+LOW_PRIORITY_TYPES = frozenset({
+    'positions_snapshot', 'radar_response', 'visibility_changed',
+})
+
+# Load levels
+NORMAL_LOAD, DOWNSAMPLE, SHED = 0, 1, 2
+
+
+def priority_of(frame_type):
+    """Priority class of a frame type"""
+    if frame_type in HIGH_PRIORITY_TYPES:
+        return HIGH
+    if frame_type in LOW_PRIORITY_TYPES:
+        return LOW
+    return NORMAL
+
+
+class LoadMonitor:
+    """Per-process event loop lag probe that decides what to shed"""
+
+    def __init__(self, interval=None, smoothing=0.3):
+        self._interval = interval
+        self.smoothing = smoothing
+        self.subscribers = 0
+        self._task = None
+        self.lag = 0.0
+
+    @property
+    def interval(self):
+        if self._interval is not None:
+            return self._interval
+        return getattr(settings, 'LOAD_SAMPLE_INTERVAL', 0.25)
+
+    @property
+    def lag(self):
+        return self._lag
+
+    @lag.setter
+    def lag(self, lag):
+        # The level and factor are read for every frame, so they are plain
+        # attributes worked out here, when the lag changes
+        self._lag = lag
+        if lag >= getattr(settings, 'LOAD_SHED_DROP_LAG', 0.5):
+            self.level = SHED
+        elif lag >= getattr(settings, 'LOAD_SHED_DOWNSAMPLE_LAG', 0.1):
+            self.level = DOWNSAMPLE
+        else:
+            self.level = NORMAL_LOAD
+        self.downsample_factor = getattr(settings, 'LOAD_SHED_DOWNSAMPLE_FACTOR', 2.0)
+
+    def sample(self, lag):
+        """Fold one lag measurement (seconds) into the moving average"""
+        self.lag += self.smoothing * (max(lag, 0.0) - self.lag)
+        metrics.gauge('event_loop_lag', round(self.lag, 4))
+        metrics.gauge('load_level', self.level)
+
+    def shed(self, action, priority=LOW, **labels):
+        """Record one shedding decision"""
+        metrics.incr('load_shed', action=action, priority=priority, **labels)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            interval = self.interval
+            expected = loop.time() + interval
+            await asyncio.sleep(interval)
+            try:
+                self.sample(loop.time() - expected)
+            except Exception:
+                logger.exception("Load sample failed")
+
+
+load_monitor = LoadMonitor()
+
+
+def acquire_load_monitor():
+    """Register a connection, starting the lag probe with the first one"""
+    load_monitor.subscribers += 1
+    load_monitor.start()
+    return load_monitor
+
+
+def release_load_monitor():
+    """Unregister a connection, stopping the probe (and forgetting the lag) after the last one"""
+    load_monitor.subscribers -= 1
+    if load_monitor.subscribers <= 0:
+        load_monitor.subscribers = 0
+        load_monitor.stop()
+        load_monitor.lag = 0.0
@@ -0,0 +1,350 @@
+"""Async lobby views: join, start and leave a game.
+
+These actions come in bursts (a whole group joining within seconds).
+They run as native async views, and each hands its database work to the
+consumers' database pool (``core.dbpool``) in one call:
+
+- The lookups, checks and the action's multi-row write run together on
+  a pool thread, the write as one transaction, because Django has no
+  async transactions. One call per request keeps the thread hops, and
+  the connection checks around them, to one.
+- The pool is shared with the WebSocket consumers and bounded by
+  ``CONSUMER_DB_THREADS``, so a burst of joins waits for a pool thread
+  rather than opening more connections.
+- Broadcasts are queued in the broadcast outbox inside the transaction.
+  They go out once it commits, when the view returns, awaited on the
+  event loop rather than from the pool thread.
+
+The URLs, payloads and responses are the same as the ``GameViewSet``
+actions these views replace, including camelCase JSON.
+"""
+import json
+import random
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Prefetch
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from djangorestframework_camel_case.render import CamelCaseJSONRenderer
+from djangorestframework_camel_case.util import underscoreize
+from rest_framework import status
+from rest_framework.response import Response
+
+from . import geo
+from .broadcast import broadcast_to_game, notify_players, player_context_message
+from .dbpool import db_sync_to_async
+from .events import event_sink
+from .models import Event, Game, ItemSpawn, Player, PlayerInventory, Zone
+from .positions import position_store
+from .presence import presence
+from .scheduler import game_scheduler
+from .serializers import GameDetailSerializer, JoinGameSerializer, PlayerSerializer
+from .spatial import spatial_indexes
+from .trails import trail_store
+
+
+def game_detail_queryset():
+    """Games with what GameDetailSerializer needs: each player's cloak and state"""
+    return Game.objects.prefetch_related(
+        Prefetch('players', queryset=Player.objects.with_cloak().select_related('state'))
+    )
+
+
+def api_response(data=None, status=status.HTTP_200_OK):
+    """A DRF Response rendered like the API views' (camelCase JSON)"""
+    response = Response(data, status=status)
+    response.accepted_renderer = CamelCaseJSONRenderer()
+    response.accepted_media_type = 'application/json'
+    response.renderer_context = {}
+    return response
+
+
+def error_response(message, status=status.HTTP_400_BAD_REQUEST):
+    return api_response({'error': message}, status=status)
+
+
+def not_found_response():
+    return api_response({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+
+
+def request_data(request):
+    """Parse a JSON or form body, with camelCase keys turned into snake_case.
+
+    Returns None for a malformed body.
+    """
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            return None
+    else:
+        data = request.POST.dict()
+    return underscoreize(data)
+
+
+def get_game(code):
+    return Game.objects.filter(code=code).first()
+
+
+@csrf_exempt
+@require_POST
+async def join_game(request, code):
+    """Join a game lobby"""
+    return await db_sync_to_async(join)(code, request_data(request))
+
+
+@csrf_exempt
+@require_POST
+async def start_game(request, code):
+    """Start the game (host only)"""
+    return await db_sync_to_async(start)(code)
+
+
+@csrf_exempt
+@require_POST
+async def leave_game(request, code):
+    """Leave a game"""
+    return await db_sync_to_async(leave)(code, request_data(request))
+
+
+def join(code, data):
+    """Check a join request and add the player"""
+    game = get_game(code)
+    if game is None:
+        return not_found_response()
+
+    if game.status != 'lobby':
+        return error_response('Game has already started')
+
+    if game.players.count() >= game.max_players:
+        return error_response('Game is full')
+
+    if data is None:
+        return error_response('Malformed request body')
+    serializer = JoinGameSerializer(data=data)
+    if not serializer.is_valid():
+        return api_response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    # Check if name is already taken
+    name = serializer.validated_data['player_name']
+    if game.players.filter(name=name).exists():
+        return error_response('Name already taken')
+
+    player = add_player(game, name, serializer.validated_data.get('avatar_url', ''))
+    return api_response(player, status=status.HTTP_201_CREATED)
+
+
+def start(code):
+    """Check a start request and begin the game"""
+    game = get_game(code)
+    if game is None:
+        return not_found_response()
+
+    if game.status != 'lobby':
+        return error_response('Game has already started')
+
+    # Check if request is from host (simplified for now)
+    # In production, use proper authentication
+
+    if game.players.count() < 2:
+        return error_response('Need at least 2 players to start')
+
+    return api_response(begin_game(game))
+
+
+def leave(code, data):
+    """Check a leave request and remove the player"""
+    game = get_game(code)
+    if game is None:
+        return not_found_response()
+
+    try:
+        player = game.players.filter(id=(data or {}).get('player_id')).first()
+    except ValidationError:
+        player = None
+    if player is None:
+        return error_response('Player not found', status=status.HTTP_404_NOT_FOUND)
+
+    remove_player(game, player)
+    return api_response(status=status.HTTP_204_NO_CONTENT)
+
+
+@transaction.atomic
+def add_player(game, name, avatar_url):
+    """Create a player with an inventory and log it; returns the serialized player"""
+    player = Player.objects.create(game=game, name=name, avatar_url=avatar_url)
+    PlayerInventory.objects.create(player=player)
+    event_sink.record(
+        game=game,
+        type='player_joined',
+        player=player
+    )
+    player_data = PlayerSerializer(player).data
+
+    # Broadcast to all players in the game via WebSocket
+    broadcast_to_game(game.code, {
+        'type': 'player_joined',
+        'player': player_data
+    })
+    return player_data
+
+
+@transaction.atomic
+def begin_game(game):
+    """Assign teams, generate content and activate the game; returns the serialized game"""
+    players = list(game.players.all())
+    red_count = max(1, int(len(players) * game.red_team_ratio))
+    red_players = random.sample(players, red_count)
+
+    for player in players:
+        if player in red_players:
+            player.team = 'red'
+        else:
+            player.team = 'blue'
+        player.save()
+
+    # Generate zones and items
+    generate_game_content(game)
+    # Rebuild the index with the new zones and items once they are
+    # committed, replacing any index built meanwhile from the old rows;
+    # connections from the lobby keep using it without authenticating again
+    transaction.on_commit(lambda: spatial_indexes.rebuild(game))
+
+    # Update game status
+    game.status = 'active'
+    game.started_at = timezone.now()
+    game.save()
+    transaction.on_commit(lambda: game_scheduler.schedule_game(game))
+
+    # Log event
+    event_sink.record(
+        game=game,
+        type='game_started',
+        params={'players': len(players)}
+    )
+
+    game_data = GameDetailSerializer(game_detail_queryset().get(pk=game.pk)).data
+
+    # Refresh each connection's cached team (moving it into the team
+    # group), then tell everyone the game started
+    notify_players(
+        (player.id, player_context_message(team=player.team)) for player in players
+    )
+    broadcast_to_game(game.code, {
+        'type': 'game_started',
+        'game': game_data
+    })
+    return game_data
+
+
+@transaction.atomic
+def remove_player(game, player):
+    """Remove a player from a lobby, or mark them as having left an active game"""
+    player_id = str(player.id)
+
+    # If game hasn't started, remove player completely
+    # If game is active, just mark them as offline
+    if game.status == 'lobby':
+        # Check if this is the host leaving
+        if player.id == game.host_id:
+            # Transfer host to another player if any exist
+            remaining_players = game.players.exclude(id=player.id)
+            if remaining_players.exists():
+                game.host_id = remaining_players.first().id
+                game.save()
+
+        # Log event BEFORE deleting the player
+        Event.objects.create(
+            game=game,
+            type='player_left',
+            player=player
+        )
+
+        player.delete()  # Remove player from game entirely
+        transaction.on_commit(lambda: forget_player(game.code, player_id, deleted=True))
+    else:
+        player.left_at = timezone.now()
+        player.is_online = False
+        player.save()
+        presence.forget(player.id)
+        transaction.on_commit(lambda: forget_player(game.code, player_id))
+
+        # Log event after marking as offline
+        event_sink.record(
+            game=game,
+            type='player_left',
+            player=player
+        )
+
+    # Broadcast to all players in the game via WebSocket
+    broadcast_to_game(game.code, {
+        'type': 'player_left',
+        'player_id': player_id
+    })
+
+
+def forget_player(game_code, player_id, deleted=False):
+    """Drop a player who left from this worker's in-memory game state"""
+    if deleted:
+        # Their buffered trail points can no longer be written
+        trail_store.discard_player(player_id)
+    else:
+        position_store.flush_player(player_id)
+        trail_store.flush_player(player_id)
+    position_store.forget(game_code, player_id)
+    # Keeps them out of blast radii and proximity triggers
+    spatial_indexes.remove(game_code, 'player', player_id)
+
+
+def generate_game_content(game):
+    """Generate zones, items, and tasks for the game"""
+    # Generate task zones (3-5 zones)
+    for i in range(random.randint(3, 5)):
+        lat, lng = geo.random_point(
+            game.home_base_lat,
+            game.home_base_lng,
+            game.map_radius
+        )
+        Zone.objects.create(
+            game=game,
+            type='task',
+            position_lat=lat,
+            position_lng=lng,
+            radius=30
+        )
+
+    # Generate reviver zones (2 zones)
+    for i in range(2):
+        lat, lng = geo.random_point(
+            game.home_base_lat,
+            game.home_base_lng,
+            game.map_radius
+        )
+        Zone.objects.create(
+            game=game,
+            type='reviver',
+            position_lat=lat,
+            position_lng=lng,
+            radius=20
+        )
+
+    # Generate item spawns (10-15 items)
+    item_types = [
+        'emp', 'camera', 'dagger', 'mask', 'armor',
+        'invisibility_cloak', 'poison', 'motion_sensor', 'decoy'
+    ]
+
+    for i in range(random.randint(10, 15)):
+        lat, lng = geo.random_point(
+            game.home_base_lat,
+            game.home_base_lng,
+            game.map_radius
+        )
+        ItemSpawn.objects.create(
+            game=game,
+            item_type=random.choice(item_types),
+            position_lat=lat,
+            position_lng=lng
+        )
@@ -1,9 +1,10 @@
 from django.core.management.base import BaseCommand
 from django.utils import timezone
+from datetime import timedelta
 from django.db import transaction
 import random
-import math
 
+from core import geo
 from core.models import (
     Game, Player, Zone, Event, ItemSpawn, 
     PlayerInventory, Task
@@ -109,8 +110,7 @@ class Command(BaseCommand):
             Event.objects.create(
                 game=game,
                 type='player_joined',
-                player=player,
-                message=f"{player.name} joined the game"
+                player=player
             )
         
         self.stdout.write(f"Created {len(players)} players")
@@ -140,8 +140,8 @@ class Command(BaseCommand):
                 lat, lng = self._random_position(home_lat, home_lng, map_radius * 0.5)
                 player.position_lat = lat
                 player.position_lng = lng
-                player.visibility = random.choice(['active', 'recent', 'dark'])
-                player.last_seen = timezone.now()
+                # Visibility is derived from last_seen; age it to get a mix of states
+                player.last_seen = timezone.now() - timedelta(minutes=random.choice([0, 3, 10]))
                 player.save()
             
             # Update game status
@@ -153,7 +153,7 @@ class Command(BaseCommand):
             Event.objects.create(
                 game=game,
                 type='game_started',
-                message=f"Game started with {len(players)} players"
+                params={'players': len(players)}
             )
             
             self.stdout.write(self.style.SUCCESS('Game started!'))
@@ -190,14 +190,7 @@ class Command(BaseCommand):
     
     def _random_position(self, center_lat, center_lng, radius_meters):
         """Generate random position within radius"""
-        radius_deg = radius_meters / 111000
-        angle = random.uniform(0, 2 * math.pi)
-        distance = random.uniform(0.3, 1) * radius_deg
-        
-        lat = center_lat + distance * math.cos(angle)
-        lng = center_lng + distance * math.sin(angle)
-        
-        return lat, lng
+        return geo.random_point(center_lat, center_lng, radius_meters)
     
     def _generate_zones(self, game, center_lat, center_lng, radius):
         """Generate task and reviver zones"""
@@ -0,0 +1,91 @@
+"""In-process counters, gauges and summaries for the real-time pipeline.
+
+Values are kept per worker process and start from zero on restart.
+Each metric has a name and optional labels (usually ``game``);
+``GET /api/metrics/`` returns a snapshot of everything recorded.
+Gauges too costly to keep current on a hot path are filled in by
+collectors, which run whenever a snapshot is taken.
+"""
+import threading
+
+
+def metric_key(name, labels):
+    """Render a metric as ``name{game=ABC123}``"""
+    if not labels:
+        return name
+    rendered = ','.join(f'{label}={value}' for label, value in labels)
+    return f'{name}{{{rendered}}}'
+
+
+class Metrics:
+    """Thread-safe registry of counters, gauges and summaries"""
+
+    def __init__(self):
+        self._counters = {}
+        self._gauges = {}
+        self._summaries = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def incr(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def gauge(self, name, value, **labels):
+        self._gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def observe(self, name, value, **labels):
+        """Record one sample (e.g. a latency) into a count/mean/max summary"""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            count, total, peak = self._summaries.get(key, (0, 0.0, value))
+            self._summaries[key] = (count + 1, total + value, max(peak, value))
+
+    def register_collector(self, collector):
+        """Call ``collector(metrics)`` before every snapshot to refresh its gauges"""
+        self._collectors.append(collector)
+        return collector
+
+    def counter(self, name, **labels):
+        return self._counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def summary(self, name, **labels):
+        """``{'count', 'mean', 'max'}`` of the samples observed, or None"""
+        value = self._summaries.get((name, tuple(sorted(labels.items()))))
+        if value is None:
+            return None
+        count, total, peak = value
+        return {'count': count, 'mean': round(total / count, 3), 'max': round(peak, 3)}
+
+    def snapshot(self, **labels):
+        """Return every metric carrying all the given labels, keyed by ``metric_key``"""
+        for collector in self._collectors:
+            collector(self)
+        wanted = set(labels.items())
+        with self._lock:
+            counters = list(self._counters.items())
+            summaries = [
+                (key, self.summary(key[0], **dict(key[1]))) for key in list(self._summaries)
+            ]
+        return {
+            kind: {
+                metric_key(name, metric_labels): value
+                for (name, metric_labels), value in values
+                if wanted <= set(metric_labels)
+            }
+            for kind, values in (
+                ('counters', counters),
+                ('gauges', list(self._gauges.items())),
+                ('summaries', summaries),
+            )
+        }
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._summaries.clear()
+        self._gauges.clear()
+
+
+metrics = Metrics()
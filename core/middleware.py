@@ -0,0 +1,22 @@
+from asgiref.sync import iscoroutinefunction
+from django.utils.decorators import sync_and_async_middleware
+
+from .outbox import broadcast_outbox
+
+
+@sync_and_async_middleware
+def outbox_middleware(get_response):
+    """Send the broadcasts a request committed together, once its view returns"""
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            with broadcast_outbox.collect() as batch:
+                response = await get_response(request)
+            await broadcast_outbox.deliver(batch)
+            return response
+    else:
+        def middleware(request):
+            with broadcast_outbox.collect() as batch:
+                response = get_response(request)
+            broadcast_outbox.deliver_sync(batch)
+            return response
+    return middleware
@@ -0,0 +1,33 @@
+# Generated by Django 5.0.11 on 2026-10-16 22:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_alter_player_game'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='deployeditem',
+            name='expires_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='itemspawn',
+            name='respawn_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='statuseffect',
+            name='expires_at',
+            field=models.DateTimeField(db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='zone',
+            name='expires_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.0.11 on 2026-10-16 22:49
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_index_deadline_fields'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='player',
+            name='visibility',
+        ),
+    ]
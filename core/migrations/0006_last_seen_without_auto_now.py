@@ -0,0 +1,19 @@
+# Generated by Django 5.0.11 on 2026-10-16 22:52
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_derive_player_visibility'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='player',
+            name='last_seen',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,82 @@
+# Generated by Django 5.0.11 on 2026-10-16 22:55
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def copy_player_state(apps, schema_editor):
+    Player = apps.get_model('core', 'Player')
+    PlayerState = apps.get_model('core', 'PlayerState')
+    PlayerState.objects.bulk_create(
+        [
+            PlayerState(
+                player_id=row['id'],
+                is_online=row['is_online'],
+                position_lat=row['position_lat'],
+                position_lng=row['position_lng'],
+                position_accuracy=row['position_accuracy'],
+                last_seen=row['last_seen'],
+            )
+            for row in Player.objects.values(
+                'id', 'is_online', 'position_lat', 'position_lng',
+                'position_accuracy', 'last_seen'
+            ).iterator()
+        ],
+        batch_size=500
+    )
+
+
+def restore_player_state(apps, schema_editor):
+    Player = apps.get_model('core', 'Player')
+    PlayerState = apps.get_model('core', 'PlayerState')
+    for state in PlayerState.objects.iterator():
+        Player.objects.filter(id=state.player_id).update(
+            is_online=state.is_online,
+            position_lat=state.position_lat,
+            position_lng=state.position_lng,
+            position_accuracy=state.position_accuracy,
+            last_seen=state.last_seen,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_last_seen_without_auto_now'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlayerState',
+            fields=[
+                ('player', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='state', serialize=False, to='core.player')),
+                ('is_online', models.BooleanField(default=True)),
+                ('position_lat', models.FloatField(blank=True, null=True)),
+                ('position_lng', models.FloatField(blank=True, null=True)),
+                ('position_accuracy', models.FloatField(blank=True, null=True)),
+                ('last_seen', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.RunPython(copy_player_state, restore_player_state),
+        migrations.RemoveField(
+            model_name='player',
+            name='is_online',
+        ),
+        migrations.RemoveField(
+            model_name='player',
+            name='last_seen',
+        ),
+        migrations.RemoveField(
+            model_name='player',
+            name='position_accuracy',
+        ),
+        migrations.RemoveField(
+            model_name='player',
+            name='position_lat',
+        ),
+        migrations.RemoveField(
+            model_name='player',
+            name='position_lng',
+        ),
+    ]
@@ -0,0 +1,93 @@
+# Generated by Django 5.0.11 on 2026-10-16 22:58
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+import numpy as np
+
+
+CHUNK_SIZE = 256
+BATCH_SIZE = 500
+
+
+def move_events_to_trails(apps, schema_editor):
+    """Convert logged player_moved events into trail chunks and drop them.
+
+    Events are streamed in player order, and chunks are written
+    ``BATCH_SIZE`` at a time, so memory stays flat however long the
+    history is. There is no reverse: the events are deleted, and
+    rolling back would drop the trails holding what is left of them.
+    """
+    Event = apps.get_model('core', 'Event')
+    MovementTrail = apps.get_model('core', 'MovementTrail')
+    moves = Event.objects.filter(
+        type='player_moved', player__isnull=False, position_lat__isnull=False
+    ).order_by('game_id', 'player_id', 'created_at')
+
+    chunks = []
+
+    def add_chunk(game_id, player_id, rows):
+        started_at = rows[0][0]
+        packed = np.array([
+            ((created_at - started_at).total_seconds(), lat, lng)
+            for created_at, lat, lng in rows
+        ], dtype=np.float32)
+        chunks.append(MovementTrail(
+            game_id=game_id,
+            player_id=player_id,
+            started_at=started_at,
+            ended_at=rows[-1][0],
+            point_count=len(rows),
+            points=packed.tobytes(),
+        ))
+        if len(chunks) >= BATCH_SIZE:
+            MovementTrail.objects.bulk_create(chunks)
+            chunks.clear()
+
+    key, rows = None, []
+    for game_id, player_id, created_at, lat, lng in moves.values_list(
+        'game_id', 'player_id', 'created_at', 'position_lat', 'position_lng'
+    ).iterator(chunk_size=2000):
+        if (game_id, player_id) != key or len(rows) >= CHUNK_SIZE:
+            if rows:
+                add_chunk(*key, rows)
+            key, rows = (game_id, player_id), []
+        rows.append((created_at, lat, lng))
+    if rows:
+        add_chunk(*key, rows)
+    if chunks:
+        MovementTrail.objects.bulk_create(chunks)
+    Event.objects.filter(type='player_moved').delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_player_state'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='event',
+            name='type',
+            field=models.CharField(choices=[('player_joined', 'Player Joined'), ('player_left', 'Player Left'), ('game_started', 'Game Started'), ('item_picked', 'Item Picked'), ('item_used', 'Item Used'), ('task_started', 'Task Started'), ('task_progress', 'Task Progress'), ('task_completed', 'Task Completed'), ('task_failed', 'Task Failed'), ('player_killed', 'Player Killed'), ('player_revived', 'Player Revived'), ('game_ended', 'Game Ended'), ('motion_detected', 'Motion Detected'), ('explosion', 'Explosion'), ('item_respawn', 'Item Respawn')], max_length=30),
+        ),
+        migrations.CreateModel(
+            name='MovementTrail',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('started_at', models.DateTimeField()),
+                ('ended_at', models.DateTimeField()),
+                ('point_count', models.PositiveIntegerField()),
+                ('points', models.BinaryField()),
+                ('game', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trails', to='core.game')),
+                ('player', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trail_chunks', to='core.player')),
+            ],
+            options={
+                'ordering': ['player', 'started_at'],
+                'indexes': [models.Index(fields=['player', 'started_at'], name='core_moveme_player__78dcf2_idx'), models.Index(fields=['game', 'started_at'], name='core_moveme_game_id_95b2b9_idx')],
+            },
+        ),
+        migrations.RunPython(move_events_to_trails),
+    ]
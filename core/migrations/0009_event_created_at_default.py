@@ -0,0 +1,19 @@
+# Generated by Django 5.0.11 on 2026-10-16 23:33
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_movement_trails'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='event',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.11 on 2026-10-16 23:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_event_created_at_default'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='params',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='event',
+            name='message',
+            field=models.TextField(blank=True),
+        ),
+    ]
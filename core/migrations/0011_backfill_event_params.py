@@ -0,0 +1,126 @@
+"""Move existing event messages into params.
+
+Each templated message is parsed back into the params its template takes
+(see core.event_messages, copied here as it stood). The stored text is
+cleared only when re-rendering the params gives it back exactly, so
+messages that do not match keep their text. Reversing renders the text
+back into every templated row without one.
+"""
+import re
+
+from django.db import migrations
+
+
+def _item(text):
+    return text.lower().replace(' ', '_')
+
+
+def _item_name(item_type):
+    return item_type.replace('_', ' ')
+
+
+# type: [(pattern, params from match, render)], in the order tried
+TEMPLATES = {
+    'player_joined': [
+        (r'(?P<player>.+) joined the game', lambda m: None,
+         lambda name, p: f"{name} joined the game"),
+        (r'(?P<player>.+) created the game', lambda m: {'host': True},
+         lambda name, p: f"{name} {'created' if p.get('host') else 'joined'} the game"),
+    ],
+    'player_left': [
+        (r'(?P<player>.+) left the game', lambda m: None,
+         lambda name, p: f"{name} left the game"),
+    ],
+    'game_started': [
+        (r'Game started with (?P<players>\d+) players', lambda m: {'players': int(m['players'])},
+         lambda name, p: f"Game started with {p['players']} players"),
+    ],
+    'game_ended': [
+        (r'Time ran out; (?P<winner>\w+) team wins', lambda m: {'winner': m['winner']},
+         lambda name, p: f"Time ran out; {p['winner']} team wins"),
+    ],
+    'item_picked': [
+        (r'(?P<player>.+) picked up (?P<item>\w+)', lambda m: {'item': m['item']},
+         lambda name, p: f"{name} picked up {p['item']}"),
+    ],
+    'item_used': [
+        (r'(?P<player>.+) used (?P<item>\w+)', lambda m: {'item': m['item']},
+         lambda name, p: f"{name} used {p['item']}"),
+    ],
+    'item_respawn': [
+        (r'(?P<item>\w+) respawned', lambda m: {'item': m['item']},
+         lambda name, p: f"{p['item']} respawned"),
+    ],
+    'explosion': [
+        (r'A (?P<item>.+) exploded', lambda m: {'item': _item(m['item'])},
+         lambda name, p: f"A {_item_name(p['item'])} exploded"),
+    ],
+    'player_killed': [
+        (r'(?P<player>.+) was killed by an explosion', lambda m: None,
+         lambda name, p: f"{name} was killed by an explosion"),
+    ],
+    'motion_detected': [
+        (r'(?P<item>.+) detected movement', lambda m: {'item': _item(m['item'])},
+         lambda name, p: f"{_item_name(p['item']).capitalize()} detected movement"),
+    ],
+}
+
+BATCH_SIZE = 2000
+
+
+def parse(event_type, message, player_name):
+    """``(parsed, params)``: whether ``message`` fits a template, and its params"""
+    for pattern, to_params, render in TEMPLATES.get(event_type, []):
+        match = re.fullmatch(pattern, message)
+        if match is None:
+            continue
+        params = to_params(match)
+        if render(player_name or 'Someone', params or {}) == message:
+            return True, params
+    return False, None
+
+
+def backfill(apps, schema_editor):
+    Event = apps.get_model('core', 'Event')
+    events = Event.objects.filter(type__in=TEMPLATES, params__isnull=True).exclude(message='')
+    changed = []
+    for event in events.select_related('player').iterator(chunk_size=BATCH_SIZE):
+        parsed, params = parse(event.type, event.message, event.player.name if event.player_id else None)
+        if not parsed:
+            continue
+        event.params = params
+        event.message = ''
+        changed.append(event)
+        if len(changed) >= BATCH_SIZE:
+            Event.objects.bulk_update(changed, ['params', 'message'])
+            changed = []
+    if changed:
+        Event.objects.bulk_update(changed, ['params', 'message'])
+
+
+def restore(apps, schema_editor):
+    Event = apps.get_model('core', 'Event')
+    changed = []
+    for event in Event.objects.filter(type__in=TEMPLATES, message='').select_related('player').iterator(
+        chunk_size=BATCH_SIZE
+    ):
+        name = event.player.name if event.player_id else 'Someone'
+        # The last template of a type renders every params it may hold
+        event.message = TEMPLATES[event.type][-1][2](name, event.params or {})
+        changed.append(event)
+        if len(changed) >= BATCH_SIZE:
+            Event.objects.bulk_update(changed, ['message'])
+            changed = []
+    if changed:
+        Event.objects.bulk_update(changed, ['message'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_event_params'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, restore),
+    ]
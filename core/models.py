@@ -4,6 +4,9 @@ import string
 from django.db import models
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.utils import timezone
+
+from .visibility import derive_visibility, visibility_expression
 
 
 def generate_game_code():
@@ -51,6 +54,36 @@ class Game(models.Model):
         return f"Game {self.code} - {self.status}"
 
 
+class PlayerQuerySet(models.QuerySet):
+    def with_cloak(self, now=None):
+        """Annotate ``cloaked``: whether an invisibility effect is active"""
+        return self.annotate(cloaked=models.Exists(
+            StatusEffect.objects.filter(
+                player=models.OuterRef('pk'),
+                type='invisible',
+                expires_at__gt=now or timezone.now()
+            )
+        ))
+    
+    def with_visibility(self, now=None):
+        """Annotate ``derived_visibility`` so listing players needs no extra queries"""
+        return self.with_cloak(now).annotate(
+            derived_visibility=visibility_expression(now, prefix='state__')
+        )
+
+
+def state_property(name):
+    """Expose a PlayerState column as an attribute of Player"""
+    def getter(self):
+        return getattr(self.live_state, name)
+    
+    def setter(self, value):
+        setattr(self.live_state, name, value)
+        self.__dict__.setdefault('_dirty_state', set()).add(name)
+    
+    return property(getter, setter)
+
+
 class Player(models.Model):
     """Player in a game"""
     TEAM_CHOICES = [
@@ -58,12 +91,6 @@ class Player(models.Model):
         ('red', 'Red Team'),
     ]
     
-    VISIBILITY_CHOICES = [
-        ('active', 'Active'),
-        ('recent', 'Recent'),
-        ('dark', 'Dark'),
-    ]
-    
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
     name = models.CharField(max_length=100)
@@ -75,14 +102,6 @@ class Player(models.Model):
     
     # Player state
     is_alive = models.BooleanField(default=True)
-    is_online = models.BooleanField(default=True)
-    visibility = models.CharField(max_length=20, choices=VISIBILITY_CHOICES, default='active')
-    
-    # Position
-    position_lat = models.FloatField(null=True, blank=True)
-    position_lng = models.FloatField(null=True, blank=True)
-    position_accuracy = models.FloatField(null=True, blank=True)
-    last_seen = models.DateTimeField(auto_now=True)
     
     # Death tracking
     death_time = models.DateTimeField(null=True, blank=True)
@@ -93,14 +112,77 @@ class Player(models.Model):
     joined_at = models.DateTimeField(auto_now_add=True)
     left_at = models.DateTimeField(null=True, blank=True)
     
+    objects = PlayerQuerySet.as_manager()
+    
+    # Fast-changing columns live in PlayerState (see below)
+    is_online = state_property('is_online')
+    position_lat = state_property('position_lat')
+    position_lng = state_property('position_lng')
+    position_accuracy = state_property('position_accuracy')
+    last_seen = state_property('last_seen')
+    
     class Meta:
         ordering = ['game', 'team', 'name']
         unique_together = [['game', 'name']]
     
+    @property
+    def live_state(self):
+        """This player's PlayerState, created in memory if the row does not exist yet"""
+        # A new player has no state row to look up
+        if not self._state.adding or Player.state.is_cached(self):
+            try:
+                return self.state
+            except PlayerState.DoesNotExist:
+                pass
+        self.state = PlayerState(player=self)
+        return self.state
+    
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        super().save(*args, **kwargs)
+        dirty = self.__dict__.pop('_dirty_state', None)
+        if adding or dirty:
+            state = self.live_state
+            if state._state.adding:
+                state.save(force_insert=True)
+            else:
+                # Only the state columns that were assigned
+                state.save(update_fields=dirty)
+    
+    @property
+    def is_cloaked(self):
+        if 'cloaked' in self.__dict__:
+            return self.__dict__['cloaked']
+        return self.status_effects.filter(
+            type='invisible', expires_at__gt=timezone.now()
+        ).exists()
+    
+    @property
+    def visibility(self):
+        """'active', 'recent' or 'dark', derived from last_seen (see core.visibility)"""
+        if 'derived_visibility' in self.__dict__:
+            return self.__dict__['derived_visibility']
+        return derive_visibility(self.last_seen, self.is_online, self.is_cloaked)
+    
     def __str__(self):
         return f"{self.name} ({self.game.code})"
 
 
+class PlayerState(models.Model):
+    """Fast-changing player columns (position, presence), kept out of the wide Player row"""
+    player = models.OneToOneField(
+        Player, on_delete=models.CASCADE, primary_key=True, related_name='state'
+    )
+    is_online = models.BooleanField(default=True)
+    position_lat = models.FloatField(null=True, blank=True)
+    position_lng = models.FloatField(null=True, blank=True)
+    position_accuracy = models.FloatField(null=True, blank=True)
+    last_seen = models.DateTimeField(default=timezone.now)
+    
+    def __str__(self):
+        return f"State of {self.player_id}"
+
+
 class Zone(models.Model):
     """Game zones (home base, task zones, reviver zones, etc.)"""
     TYPE_CHOICES = [
@@ -124,7 +206,7 @@ class Zone(models.Model):
     active = models.BooleanField(default=True)
     created_by = models.ForeignKey(Player, on_delete=models.SET_NULL, null=True, blank=True)
     metadata = models.JSONField(default=dict, blank=True)
-    expires_at = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField(null=True, blank=True, db_index=True)
     
     created_at = models.DateTimeField(auto_now_add=True)
     
@@ -167,7 +249,7 @@ class ItemSpawn(models.Model):
     collected_by = models.ForeignKey(Player, on_delete=models.SET_NULL, null=True, blank=True, related_name='collected_items')
     collected_at = models.DateTimeField(null=True, blank=True)
     dropped_by = models.ForeignKey(Player, on_delete=models.SET_NULL, null=True, blank=True, related_name='dropped_items')
-    respawn_at = models.DateTimeField(null=True, blank=True)
+    respawn_at = models.DateTimeField(null=True, blank=True, db_index=True)
     
     created_at = models.DateTimeField(auto_now_add=True)
     
@@ -192,6 +274,14 @@ class PlayerInventory(models.Model):
 
 class DeployedItem(models.Model):
     """Items deployed by players (cameras, mines, sensors, etc.)"""
+    # Trigger (or blast) radius in meters when metadata has no 'trigger_radius'
+    DEFAULT_TRIGGER_RADII = {
+        'time_bomb': 10,
+        'land_mine': 5,
+        'motion_sensor': 15,
+        'camera': 20,
+    }
+    
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     game = models.ForeignKey(Game, on_delete=models.CASCADE, related_name='deployed_items')
     item_type = models.CharField(max_length=30, choices=ItemSpawn.ITEM_TYPE_CHOICES)
@@ -207,7 +297,14 @@ class DeployedItem(models.Model):
     
     # Item-specific metadata
     metadata = models.JSONField(default=dict, blank=True)
-    expires_at = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    
+    @property
+    def trigger_radius(self):
+        return self.metadata.get(
+            'trigger_radius',
+            self.DEFAULT_TRIGGER_RADII.get(self.item_type, 0)
+        )
     
     def __str__(self):
         return f"{self.item_type} deployed by {self.deployed_by.name}"
@@ -224,7 +321,7 @@ class StatusEffect(models.Model):
     player = models.ForeignKey(Player, on_delete=models.CASCADE, related_name='status_effects')
     type = models.CharField(max_length=20, choices=TYPE_CHOICES)
     source_player = models.ForeignKey(Player, on_delete=models.SET_NULL, null=True, blank=True, related_name='inflicted_effects')
-    expires_at = models.DateTimeField()
+    expires_at = models.DateTimeField(db_index=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
@@ -277,13 +374,37 @@ class Task(models.Model):
         return f"{self.type} task in {self.game.code} - {self.status}"
 
 
+class MovementTrail(models.Model):
+    """A chunk of one player's movement history (see core.trails)"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    game = models.ForeignKey(Game, on_delete=models.CASCADE, related_name='trails')
+    player = models.ForeignKey(Player, on_delete=models.CASCADE, related_name='trail_chunks')
+    
+    # Time span covered by the chunk, for range reads
+    started_at = models.DateTimeField()
+    ended_at = models.DateTimeField()
+    
+    # float32 (seconds since started_at, lat, lng) triples, oldest first
+    point_count = models.PositiveIntegerField()
+    points = models.BinaryField()
+    
+    class Meta:
+        ordering = ['player', 'started_at']
+        indexes = [
+            models.Index(fields=['player', 'started_at']),
+            models.Index(fields=['game', 'started_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.point_count} points of {self.player_id} from {self.started_at}"
+
+
 class Event(models.Model):
     """Game event log"""
     TYPE_CHOICES = [
         ('player_joined', 'Player Joined'),
         ('player_left', 'Player Left'),
         ('game_started', 'Game Started'),
-        ('player_moved', 'Player Moved'),
         ('item_picked', 'Item Picked'),
         ('item_used', 'Item Used'),
         ('task_started', 'Task Started'),
@@ -309,8 +430,10 @@ class Event(models.Model):
     type = models.CharField(max_length=30, choices=TYPE_CHOICES)
     player = models.ForeignKey(Player, on_delete=models.CASCADE, null=True, blank=True)
     
-    # Event details
-    message = models.TextField()
+    # Event details: templated events store only their params and are
+    # rendered on read (core.event_messages); free text (chat) goes in message
+    message = models.TextField(blank=True)
+    params = models.JSONField(null=True, blank=True)
     visibility = models.CharField(max_length=20, choices=VISIBILITY_CHOICES, default='public')
     recipient_players = models.ManyToManyField(Player, related_name='private_events', blank=True)
     
@@ -321,7 +444,8 @@ class Event(models.Model):
     # Additional data
     data = models.JSONField(default=dict, blank=True)
     
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Set when the event is recorded; buffered events are written later
+    created_at = models.DateTimeField(default=timezone.now)
     
     class Meta:
         ordering = ['game', '-created_at']
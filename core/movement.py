@@ -0,0 +1,113 @@
+"""Movement filter in front of the position pipeline.
+
+Phones keep reporting fixes while a player stands still, each a few
+meters off the last. ``MovementFilter`` drops a fix unless it moved the
+player further than the fix's reported accuracy (clamped between
+``MOVEMENT_MIN_DISTANCE`` and ``MOVEMENT_MAX_DEADBAND`` meters) from the
+last position it let through. Only fixes that pass reach the position
+store, trails, triggers and broadcasts.
+
+With ``MOVEMENT_SMOOTHING`` on, fixes first go through a per-player
+Kalman filter (constant position, process noise ``MOVEMENT_PROCESS_NOISE``
+m/s, measurement noise from the reported accuracy), and the smoothed
+estimate is what gets compared and passed on.
+"""
+import math
+import threading
+import time
+
+from django.conf import settings
+
+from . import geo
+from .metrics import metrics as default_metrics
+
+
+class MovementTrack:
+    """Filter state for one player"""
+    __slots__ = ('lat', 'lng', 'variance', 'updated_at', 'sent_lat', 'sent_lng')
+
+    def __init__(self, lat, lng, accuracy, now):
+        self.lat = lat
+        self.lng = lng
+        self.variance = accuracy ** 2
+        self.updated_at = now
+        self.sent_lat = lat
+        self.sent_lng = lng
+
+
+class MovementFilter:
+    """Dead-band (and optional Kalman smoothing) per player, with per-game counters"""
+
+    def __init__(self, metrics=None, smoothing=None):
+        self.metrics = metrics or default_metrics
+        self._smoothing = smoothing
+        self._tracks = {}
+        self._lock = threading.Lock()
+
+    @property
+    def smoothing(self):
+        if self._smoothing is not None:
+            return self._smoothing
+        return getattr(settings, 'MOVEMENT_SMOOTHING', False)
+
+    @property
+    def min_distance(self):
+        return getattr(settings, 'MOVEMENT_MIN_DISTANCE', 2.0)
+
+    @property
+    def max_deadband(self):
+        return getattr(settings, 'MOVEMENT_MAX_DEADBAND', 25.0)
+
+    @property
+    def process_noise(self):
+        return getattr(settings, 'MOVEMENT_PROCESS_NOISE', 3.0)
+
+    def deadband(self, accuracy):
+        """Meters a fix must move to count, given its reported accuracy"""
+        if accuracy is None:
+            return self.min_distance
+        return min(max(accuracy, self.min_distance), self.max_deadband)
+
+    def filter(self, game_code, player_id, lat, lng, accuracy=None, now=None):
+        """Return ``(lat, lng, accuracy)`` to store, or None if the fix is jitter"""
+        now = time.monotonic() if now is None else now
+        key = (game_code, str(player_id))
+        self.metrics.incr('movement_received', game=game_code)
+        noise = accuracy if accuracy is not None else self.min_distance
+        with self._lock:
+            track = self._tracks.get(key)
+            if track is None:
+                self._tracks[key] = MovementTrack(lat, lng, noise, now)
+                self.metrics.incr('movement_accepted', game=game_code)
+                return lat, lng, accuracy
+
+            if self.smoothing:
+                lat, lng, accuracy = self._smooth(track, lat, lng, noise, now)
+            else:
+                track.lat, track.lng, track.updated_at = lat, lng, now
+
+            moved = geo.equirectangular(track.sent_lat, track.sent_lng, lat, lng)
+            if moved < self.deadband(accuracy):
+                self.metrics.incr('movement_suppressed', game=game_code)
+                return None
+            track.sent_lat, track.sent_lng = lat, lng
+        self.metrics.incr('movement_accepted', game=game_code)
+        return lat, lng, accuracy
+
+    def _smooth(self, track, lat, lng, noise, now):
+        # Uncertainty grows with the time the player had to move
+        elapsed = max(0.0, now - track.updated_at)
+        variance = track.variance + (self.process_noise * elapsed) ** 2
+        gain = variance / (variance + noise ** 2)
+        track.lat += gain * (lat - track.lat)
+        track.lng += gain * (lng - track.lng)
+        track.variance = (1 - gain) * variance
+        track.updated_at = now
+        return track.lat, track.lng, math.sqrt(track.variance)
+
+    def forget(self, game_code, player_id):
+        with self._lock:
+            self._tracks.pop((game_code, str(player_id)), None)
+
+
+movement_filter = MovementFilter()
@@ -0,0 +1,162 @@
+"""Per-connection outbound queue for GameConsumer.
+
+Group handlers hand frames to the connection's ``OutboundQueue`` and
+return at once, so a client on a slow link no longer holds up its
+channel-layer inbox. A writer task sends the queued frames in order.
+
+* Position snapshots are not queued one after another. While one is
+  waiting, newer snapshots are merged into it player by player, so a
+  stale position is replaced in place instead of being sent late.
+* The queue holds at most ``OUTBOUND_QUEUE_SIZE`` frames. Once it is full,
+  the oldest droppable frame makes way for the new one. High-priority
+  frames (see core.load) are never dropped and may exceed the bound.
+* While the worker is shedding load, low-priority frames are not queued
+  at all, and queued high-priority frames are sent ahead of the rest.
+
+Queue depth (``outbound_queue_depth``, summed over a game's connections),
+drops (``outbound_dropped``) and merged positions (``outbound_coalesced``)
+are reported through core.metrics. Depth is read from the live queues
+when metrics are collected, not tracked per frame.
+"""
+import asyncio
+import threading
+import weakref
+from collections import deque
+
+from django.conf import settings
+
+from .load import HIGH, LOW, NORMAL_LOAD, SHED, load_monitor, priority_of
+from .metrics import metrics
+
+
+# Queue slot standing for the merged pending position snapshot
+POSITIONS = object()
+
+_live_queues = weakref.WeakSet()
+_live_queues_lock = threading.Lock()
+_reported_games = set()
+
+
+@metrics.register_collector
+def collect_queue_depths(registry):
+    """Set ``outbound_queue_depth`` per game from the queues still open"""
+    with _live_queues_lock:
+        queues = list(_live_queues)
+    depths = {}
+    for queue in queues:
+        depths[queue.game_code] = depths.get(queue.game_code, 0) + len(queue)
+    # Games whose last connection went away read 0 rather than their old depth
+    for game_code in _reported_games - depths.keys():
+        depths[game_code] = 0
+    _reported_games.clear()
+    _reported_games.update(game_code for game_code, depth in depths.items() if depth)
+    for game_code, depth in depths.items():
+        registry.gauge('outbound_queue_depth', depth, game=game_code)
+
+
+class OutboundQueue:
+    """Bounded, coalescing queue of frames waiting to be sent to one client"""
+
+    def __init__(self, game_code, maxsize=None):
+        self.game_code = game_code
+        self.maxsize = maxsize or getattr(settings, 'OUTBOUND_QUEUE_SIZE', 64)
+        # (text or POSITIONS, frame type) pairs, oldest first
+        self._items = deque()
+        self._frame = None
+        self._entries = {}
+        self._coordinates = {}
+        self._ready = asyncio.Event()
+        with _live_queues_lock:
+            _live_queues.add(self)
+
+    def __len__(self):
+        return len(self._items)
+
+    def put(self, text, frame_type=None):
+        """Queue a frame that is already JSON text"""
+        if load_monitor.level >= SHED and priority_of(frame_type) == LOW:
+            load_monitor.shed('frame_dropped', game=self.game_code)
+            return False
+        if len(self._items) >= self.maxsize and not self._make_room(frame_type):
+            self._dropped(frame_type)
+            return False
+        self._append(text, frame_type)
+        return True
+
+    def put_positions(self, message, player_id=None):
+        """Merge a ``positions_snapshot`` group message into the pending one, minus our own entry"""
+        if load_monitor.level >= SHED:
+            load_monitor.shed('frame_dropped', game=self.game_code)
+            return
+        own = str(player_id) if player_id else None
+        parts = {key: text for key, text in message['parts'].items() if key != own}
+        if not parts:
+            return
+        coordinates = message.get('coordinates', {})
+        replaced = sum(1 for key in parts if key in self._entries)
+        if replaced:
+            metrics.incr('outbound_coalesced', replaced, game=self.game_code)
+        for key, text in parts.items():
+            # Re-inserting moves the player to the end, in arrival order
+            self._entries.pop(key, None)
+            self._entries[key] = text
+            if key in coordinates:
+                self._coordinates[key] = coordinates[key]
+        pending = self._frame is not None
+        self._frame = message
+        if not pending:
+            if len(self._items) >= self.maxsize and not self._make_room('positions_snapshot'):
+                self._discard_positions()
+                self._dropped('positions_snapshot')
+                return
+            self._append(POSITIONS, 'positions_snapshot')
+
+    def take_positions(self):
+        """Return the merged snapshot's text and ``{player_id: [lat, lng]}``, then clear it"""
+        frame, entries, coordinates = self._frame, self._entries, self._coordinates
+        self._discard_positions()
+        if frame is None or not entries:
+            return None, {}
+        text = frame['head'] + ', '.join(entries.values()) + frame['tail']
+        return text, coordinates
+
+    async def get(self):
+        """Wait for and return the next frame text, or ``POSITIONS``"""
+        while not self._items:
+            self._ready.clear()
+            await self._ready.wait()
+        if load_monitor.level > NORMAL_LOAD:
+            for index, (item, frame_type) in enumerate(self._items):
+                if priority_of(frame_type) == HIGH:
+                    del self._items[index]
+                    return item
+        item, _ = self._items.popleft()
+        return item
+
+    def close(self):
+        """Drop whatever is still queued"""
+        self._items.clear()
+        self._discard_positions()
+
+    def _append(self, item, frame_type):
+        self._items.append((item, frame_type))
+        self._ready.set()
+
+    def _make_room(self, frame_type):
+        """Drop the oldest droppable frame; critical frames may go over the bound"""
+        for index, (item, queued_type) in enumerate(self._items):
+            if priority_of(queued_type) != HIGH:
+                del self._items[index]
+                if item is POSITIONS:
+                    self._discard_positions()
+                self._dropped(queued_type)
+                return True
+        return priority_of(frame_type) == HIGH
+
+    def _dropped(self, frame_type):
+        metrics.incr('outbound_dropped', game=self.game_code, frame=frame_type or 'other')
+
+    def _discard_positions(self):
+        self._frame = None
+        self._entries = {}
+        self._coordinates = {}
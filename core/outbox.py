@@ -0,0 +1,150 @@
+"""Broadcast outbox: channel-layer messages sent only after commit.
+
+Synchronous code (views and the transactions they run) queues its
+WebSocket broadcasts here instead of sending them right away:
+
+- Inside a transaction, messages wait for it to commit and are dropped
+  with it on rollback, so clients never hear about writes that did not
+  happen.
+- Within a request, committed messages are collected and sent together
+  once the view returns (see ``core.middleware.outbox_middleware``):
+  one trip to the event loop for all of them, different groups in
+  parallel, each group's messages in order.
+- Outside a request (workers, shell) they are sent as soon as they
+  are committed.
+
+A failed send is retried ``OUTBOX_RETRIES`` times, waiting
+``OUTBOX_RETRY_DELAY`` seconds and doubling the wait each time. The
+metrics are ``outbox_delivered``, ``outbox_retried`` and ``outbox_failed``,
+plus the time from commit to delivery as the
+``outbox_commit_to_delivery_ms`` summary.
+
+Async code (consumers, ticker, scheduler) holds no transactions across
+sends and keeps awaiting the channel layer directly.
+"""
+import asyncio
+import contextlib
+import contextvars
+import logging
+import time
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+
+from .metrics import metrics
+
+
+logger = logging.getLogger(__name__)
+
+# Committed (group_name, message, committed_at) entries of the current request
+_request_batch = contextvars.ContextVar('outbox_request_batch', default=None)
+
+
+class BroadcastOutbox:
+    """Queue of ``(group_name, message)`` pairs released on commit"""
+
+    def __init__(self, channel_layer=None, retries=None, retry_delay=None):
+        self._channel_layer = channel_layer
+        self._retries = retries
+        self._retry_delay = retry_delay
+
+    @property
+    def channel_layer(self):
+        return self._channel_layer or get_channel_layer()
+
+    @property
+    def retries(self):
+        if self._retries is not None:
+            return self._retries
+        return getattr(settings, 'OUTBOX_RETRIES', 3)
+
+    @property
+    def retry_delay(self):
+        if self._retry_delay is not None:
+            return self._retry_delay
+        return getattr(settings, 'OUTBOX_RETRY_DELAY', 0.05)
+
+    def send(self, group_name, message, using=None):
+        self.send_many([(group_name, message)], using=using)
+
+    def send_many(self, messages, using=None):
+        """Queue ``(group_name, message)`` pairs for after the current transaction"""
+        messages = list(messages)
+        if not messages:
+            return
+        if transaction.get_connection(using).in_atomic_block:
+            transaction.on_commit(lambda: self._committed(messages), using=using)
+        else:
+            self._committed(messages)
+
+    def _committed(self, messages):
+        committed_at = time.monotonic()
+        entries = [(group_name, message, committed_at) for group_name, message in messages]
+        batch = _request_batch.get()
+        if batch is not None:
+            batch.extend(entries)
+        else:
+            self.deliver_sync(entries)
+
+    @contextlib.contextmanager
+    def collect(self):
+        """Collect messages committed within the block instead of sending them.
+
+        Yields the list they are collected in, for ``deliver``.
+        """
+        batch = []
+        token = _request_batch.set(batch)
+        try:
+            yield batch
+        finally:
+            _request_batch.reset(token)
+
+    def deliver_sync(self, entries):
+        if entries:
+            async_to_sync(self.deliver)(entries)
+
+    async def deliver(self, entries):
+        """Send committed entries, retrying failures; returns those never delivered"""
+        pending = list(entries)
+        for attempt in range(self.retries + 1):
+            if attempt:
+                metrics.incr('outbox_retried', len(pending))
+                await asyncio.sleep(self.retry_delay * 2 ** (attempt - 1))
+            pending = await self._send(pending)
+            if not pending:
+                return []
+        metrics.incr('outbox_failed', len(pending))
+        logger.error(
+            "Dropped %d broadcast(s) after %d retries: %s",
+            len(pending), self.retries, sorted({group_name for group_name, _, _ in pending})
+        )
+        return pending
+
+    async def _send(self, entries):
+        """One pass over the entries; returns the unsent ones, in order"""
+        by_group = {}
+        for entry in entries:
+            by_group.setdefault(entry[0], []).append(entry)
+        channel_layer = self.channel_layer
+
+        async def send_group(group_entries):
+            for index, (group_name, message, committed_at) in enumerate(group_entries):
+                try:
+                    await channel_layer.group_send(group_name, message)
+                except Exception:
+                    logger.warning("Broadcast to %s failed", group_name, exc_info=True)
+                    # Keep the group's order: retry this message and everything after it
+                    return group_entries[index:]
+                metrics.incr('outbox_delivered')
+                metrics.observe(
+                    'outbox_commit_to_delivery_ms', (time.monotonic() - committed_at) * 1000
+                )
+            return []
+
+        unsent = await asyncio.gather(*(send_group(group) for group in by_group.values()))
+        return [entry for group in unsent for entry in group]
+
+
+broadcast_outbox = BroadcastOutbox()
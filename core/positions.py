@@ -0,0 +1,162 @@
+import threading
+
+from django.conf import settings
+from django.utils import timezone
+
+from .background import PeriodicWorker
+from .models import PlayerState
+
+
+class PositionFix:
+    """Latest known position of a single player"""
+    __slots__ = ('player_id', 'lat', 'lng', 'accuracy', 'timestamp')
+
+    def __init__(self, player_id, lat, lng, accuracy, timestamp):
+        self.player_id = player_id
+        self.lat = lat
+        self.lng = lng
+        self.accuracy = accuracy
+        self.timestamp = timestamp
+
+    def as_dict(self):
+        return {'lat': self.lat, 'lng': self.lng}
+
+
+class PositionStore:
+    """Authoritative in-memory position store with write-behind to PlayerState rows.
+
+    Every accepted position update is recorded here instead of being saved
+    on the player's state row. Dirty entries are flushed in batches with
+    ``bulk_update`` every ``POSITION_FLUSH_INTERVAL`` seconds; an interval
+    of 0 makes the store write-through, which callers must honour by
+    calling ``flush()`` from a sync context after ``record()``.
+    """
+
+    FLUSH_FIELDS = [
+        'position_lat', 'position_lng', 'position_accuracy', 'last_seen',
+    ]
+
+    def __init__(self, flush_interval=None):
+        self._flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._games = {}
+        self._dirty = {}
+        self._moved = {}
+        self._worker = None
+
+    @property
+    def flush_interval(self):
+        if self._flush_interval is not None:
+            return self._flush_interval
+        return getattr(settings, 'POSITION_FLUSH_INTERVAL', 2.0)
+
+    @property
+    def write_through(self):
+        return self.flush_interval <= 0
+
+    def record(self, game_code, player_id, lat, lng, accuracy=None):
+        """Record a position fix in memory and mark it for flushing"""
+        player_id = str(player_id)
+        with self._lock:
+            game = self._games.setdefault(game_code, {})
+            previous = game.get(player_id)
+            if accuracy is None and previous is not None:
+                accuracy = previous.accuracy
+            fix = PositionFix(player_id, lat, lng, accuracy, timezone.now())
+            game[player_id] = fix
+            self._dirty[player_id] = fix
+            self._moved.setdefault(game_code, set()).add(player_id)
+        if not self.write_through:
+            self._ensure_worker()
+        return fix
+
+    def get(self, game_code, player_id):
+        """Return the latest fix for a player, or None"""
+        return self._games.get(game_code, {}).get(str(player_id))
+
+    def positions(self, game_code):
+        """Return a snapshot of the latest fixes for every player in a game"""
+        with self._lock:
+            return dict(self._games.get(game_code, {}))
+
+    def player_count(self, game_code):
+        """Return how many players in a game have a known position"""
+        return len(self._games.get(game_code, {}))
+
+    def take_moved(self, game_code):
+        """Return the fixes of players who moved since the last call"""
+        with self._lock:
+            moved = self._moved.pop(game_code, None)
+            if not moved:
+                return []
+            game = self._games.get(game_code, {})
+            return [game[player_id] for player_id in moved if player_id in game]
+
+    def forget(self, game_code, player_id):
+        """Drop a player's in-memory fix (does not flush it)"""
+        player_id = str(player_id)
+        with self._lock:
+            self._games.get(game_code, {}).pop(player_id, None)
+            self._moved.get(game_code, set()).discard(player_id)
+            self._dirty.pop(player_id, None)
+
+    def forget_game(self, game_code):
+        """Drop an ended game's fixes; pending ones are still flushed"""
+        with self._lock:
+            self._games.pop(game_code, None)
+            self._moved.pop(game_code, None)
+
+    def flush(self):
+        """Write every dirty fix to the PlayerState table in one batch"""
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+        return self._write(dirty)
+
+    def flush_player(self, player_id):
+        """Write a single player's pending fix, if any"""
+        with self._lock:
+            fix = self._dirty.pop(str(player_id), None)
+        if fix is None:
+            return 0
+        return self._write({fix.player_id: fix})
+
+    def close(self, flush=True):
+        """Stop the background flusher, by default after a final flush"""
+        if self._worker is not None:
+            self._worker.stop(flush=flush)
+            self._worker = None
+
+    def _write(self, dirty):
+        if not dirty:
+            return 0
+        states = [
+            PlayerState(
+                player_id=fix.player_id,
+                position_lat=fix.lat,
+                position_lng=fix.lng,
+                position_accuracy=fix.accuracy,
+                last_seen=fix.timestamp,
+            )
+            for fix in dirty.values()
+        ]
+        try:
+            PlayerState.objects.bulk_update(states, self.FLUSH_FIELDS, batch_size=500)
+        except Exception:
+            # Put the fixes back unless a newer one arrived meanwhile
+            with self._lock:
+                for player_id, fix in dirty.items():
+                    self._dirty.setdefault(player_id, fix)
+            raise
+        return len(states)
+
+    def _ensure_worker(self):
+        if self._worker is None:
+            with self._lock:
+                if self._worker is None:
+                    self._worker = PeriodicWorker(
+                        'position-flush', self.flush, self.flush_interval
+                    )
+        self._worker.start()
+
+
+position_store = PositionStore()
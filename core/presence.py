@@ -0,0 +1,229 @@
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .background import PeriodicWorker
+from .broadcast import frame_message, game_group
+from .models import PlayerState
+from .outbox import broadcast_outbox
+
+
+class LocalPresenceBackend:
+    """Heartbeats kept in this process's memory"""
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def touch(self, player_id, seen_at, ttl):
+        with self._lock:
+            self._entries[player_id] = (seen_at, time.time() + ttl)
+
+    def get(self, player_id):
+        """Return the last heartbeat time, or None once it has expired"""
+        entry = self._entries.get(player_id)
+        if entry is None or entry[1] <= time.time():
+            return None
+        return entry[0]
+
+    def expire(self, player_id, ttl):
+        with self._lock:
+            entry = self._entries.get(player_id)
+            if entry is not None:
+                self._entries[player_id] = (entry[0], min(entry[1], time.time() + ttl))
+
+    def delete(self, player_id):
+        with self._lock:
+            self._entries.pop(player_id, None)
+
+
+class CachePresenceBackend:
+    """Heartbeats in a Django cache (Redis in production) shared by all workers"""
+
+    def __init__(self, alias='default'):
+        self.alias = alias
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def key(self, player_id):
+        return f'presence:{player_id}'
+
+    def touch(self, player_id, seen_at, ttl):
+        self.cache.set(self.key(player_id), seen_at, ttl)
+
+    def get(self, player_id):
+        return self.cache.get(self.key(player_id))
+
+    def expire(self, player_id, ttl):
+        self.cache.touch(self.key(player_id), ttl)
+
+    def delete(self, player_id):
+        self.cache.delete(self.key(player_id))
+
+
+PRESENCE_BACKENDS = {
+    'local': LocalPresenceBackend,
+    'cache': CachePresenceBackend,
+}
+
+
+class PresenceService:
+    """Online state from heartbeats with a TTL, kept out of the Player table.
+
+    Every message a connection sends refreshes the player's heartbeat;
+    it lapses ``PRESENCE_TTL`` seconds after the last one. Closing a
+    socket only shortens the heartbeat to ``PRESENCE_DEBOUNCE`` seconds,
+    so a client that drops and reconnects inside that window never goes
+    offline. ``PlayerState.is_online`` and ``last_seen`` are written only when
+    a player actually comes online or goes offline (found by ``sweep``),
+    and at game end.
+    """
+
+    def __init__(self, backend=None):
+        self._backend = backend
+        self._tracked = {}
+        self._connections = {}
+        self._lock = threading.Lock()
+        self._worker = None
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            name = getattr(settings, 'PRESENCE_BACKEND', 'local')
+            self._backend = PRESENCE_BACKENDS[name]()
+        return self._backend
+
+    @property
+    def ttl(self):
+        return getattr(settings, 'PRESENCE_TTL', 30)
+
+    @property
+    def debounce(self):
+        return getattr(settings, 'PRESENCE_DEBOUNCE', 10)
+
+    @property
+    def sweep_interval(self):
+        return getattr(settings, 'PRESENCE_SWEEP_INTERVAL', 2.0)
+
+    def connect(self, player_id, game_code):
+        """Register a connection; returns True if the player just came online"""
+        player_id = str(player_id)
+        with self._lock:
+            self._connections[player_id] = self._connections.get(player_id, 0) + 1
+        return self.refresh(player_id, game_code)
+
+    def refresh(self, player_id, game_code):
+        """Renew a heartbeat; returns True (after persisting) if it had lapsed"""
+        player_id = str(player_id)
+        came_online = self.backend.get(player_id) is None
+        seen_at = time.time()
+        self.backend.touch(player_id, seen_at, self.ttl)
+        with self._lock:
+            self._tracked[player_id] = game_code
+        if came_online:
+            PlayerState.objects.filter(player_id=player_id).update(
+                is_online=True, last_seen=_as_datetime(seen_at)
+            )
+        self._ensure_worker()
+        return came_online
+
+    def disconnect(self, player_id):
+        """Drop a connection; the player goes offline after the debounce window"""
+        player_id = str(player_id)
+        with self._lock:
+            remaining = self._connections.get(player_id, 1) - 1
+            if remaining > 0:
+                self._connections[player_id] = remaining
+                return
+            self._connections.pop(player_id, None)
+        self.backend.expire(player_id, self.debounce)
+
+    def forget(self, player_id):
+        """Stop tracking a player who left the game (their row is updated by the caller)"""
+        player_id = str(player_id)
+        with self._lock:
+            self._tracked.pop(player_id, None)
+            self._connections.pop(player_id, None)
+        self.backend.delete(player_id)
+
+    def last_seen(self, player_id):
+        seen_at = self.backend.get(str(player_id))
+        return _as_datetime(seen_at) if seen_at is not None else None
+
+    def merge(self, player_id, last_seen, is_online):
+        """Combine stored ``last_seen``/``is_online`` with live heartbeats"""
+        heartbeat = self.last_seen(player_id)
+        if heartbeat is None:
+            with self._lock:
+                lapsed = str(player_id) in self._tracked
+            return last_seen, is_online and not lapsed
+        if last_seen is None or heartbeat > last_seen:
+            last_seen = heartbeat
+        return last_seen, True
+
+    def sweep(self):
+        """Persist and announce players whose heartbeat lapsed; returns their ids"""
+        with self._lock:
+            tracked = list(self._tracked.items())
+        lapsed = [
+            (player_id, game_code) for player_id, game_code in tracked
+            if player_id not in self._connections and self.backend.get(player_id) is None
+        ]
+        if not lapsed:
+            return []
+        with self._lock:
+            for player_id, _ in lapsed:
+                self._tracked.pop(player_id, None)
+
+        PlayerState.objects.filter(
+            player_id__in=[player_id for player_id, _ in lapsed]
+        ).update(is_online=False)
+        broadcast_outbox.send_many([
+            (game_group(game_code), frame_message({
+                'type': 'player_offline',
+                'player_id': player_id
+            }))
+            for player_id, game_code in lapsed
+        ])
+        return [player_id for player_id, _ in lapsed]
+
+    def flush_game(self, game_code):
+        """Write the latest heartbeat of every tracked player in a game to last_seen"""
+        with self._lock:
+            player_ids = [
+                player_id for player_id, code in self._tracked.items() if code == game_code
+            ]
+        states = []
+        for player_id in player_ids:
+            seen_at = self.last_seen(player_id)
+            if seen_at is not None:
+                states.append(PlayerState(player_id=player_id, last_seen=seen_at))
+        PlayerState.objects.bulk_update(states, ['last_seen'], batch_size=500)
+        return len(states)
+
+    def close(self, sweep=True):
+        if self._worker is not None:
+            self._worker.stop(flush=sweep)
+            self._worker = None
+
+    def _ensure_worker(self):
+        # An interval of 0 leaves sweeping to the caller (tests)
+        if self.sweep_interval <= 0:
+            return
+        if self._worker is None or not self._worker.running:
+            with self._lock:
+                if self._worker is None:
+                    self._worker = PeriodicWorker('presence-sweep', self.sweep, self.sweep_interval)
+            self._worker.start()
+
+
+def _as_datetime(timestamp):
+    return datetime.fromtimestamp(timestamp, tz=dt_timezone.utc)
+
+
+presence = PresenceService()
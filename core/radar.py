@@ -0,0 +1,151 @@
+import json
+import threading
+import time
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from .broadcast import keyed_frame_message, render_frame
+from .models import Player
+from .positions import position_store
+from .presence import presence
+from .visibility import ACTIVE, RECENT, derive_visibility
+
+
+RADAR_VISIBLE = (ACTIVE, RECENT)
+
+# View for players who have not been assigned a team yet (lobby)
+NO_TEAM = None
+
+
+class RadarSnapshot:
+    """Pre-rendered radar responses for one game, one view per team.
+
+    Every player's radar entry is encoded once per build and shared by
+    all views. A team's view holds the entries that team may see:
+    teammates whenever they are online, everyone else only while their
+    visibility is active or recent and they are not invisible. Answering
+    a ping just drops the requester's own entry from their team's view.
+    """
+
+    def __init__(self, game_code, players, built_at):
+        self.game_code = game_code
+        self.built_at = built_at
+        encoded = keyed_frame_message(
+            'radar_response', 'players', {player['id']: player['entry'] for player in players}
+        )
+        teams = {player['team'] for player in players if player['team']} | {NO_TEAM}
+        self.views = {}
+        for team in teams:
+            view = dict(encoded)
+            view['parts'] = {
+                player['id']: encoded['parts'][player['id']]
+                for player in players
+                if self.can_see(team, player)
+            }
+            self.views[team] = view
+
+    @staticmethod
+    def can_see(team, player):
+        if not player['is_online']:
+            return False
+        if team is not NO_TEAM and player['team'] == team:
+            return True
+        return player['visible']
+
+    def render(self, team, player_id):
+        """Return the radar_response text for a requester"""
+        view = self.views.get(team, self.views[NO_TEAM])
+        text = render_frame(view, player_id)
+        if text is None:
+            return json.dumps({'type': 'radar_response', 'players': []})
+        return text
+
+
+class RadarCache:
+    """Per-game radar snapshots rebuilt at most every ``RADAR_SNAPSHOT_TTL`` seconds"""
+
+    def __init__(self, ttl=None):
+        self._ttl = ttl
+        self._snapshots = {}
+        self._build_locks = {}
+        self._lock = threading.Lock()
+
+    @property
+    def ttl(self):
+        if self._ttl is not None:
+            return self._ttl
+        return getattr(settings, 'RADAR_SNAPSHOT_TTL', 0.3)
+
+    def peek(self, game_code):
+        """Return the game's snapshot if it is still fresh, without touching the database"""
+        snapshot = self._snapshots.get(game_code)
+        if snapshot is not None and time.monotonic() - snapshot.built_at < self.ttl:
+            return snapshot
+        return None
+
+    def latest(self, game_code):
+        """Return the game's last snapshot however old, or None"""
+        return self._snapshots.get(game_code)
+
+    def get(self, game_code):
+        """Return a fresh snapshot, rebuilding it (once, for all waiters) if stale"""
+        snapshot = self.peek(game_code)
+        if snapshot is not None:
+            return snapshot
+        # One build per game at a time; other games' builds go ahead
+        with self._build_lock(game_code):
+            snapshot = self.peek(game_code)
+            if snapshot is None:
+                snapshot = self._snapshots[game_code] = build_snapshot(game_code)
+        return snapshot
+
+    def _build_lock(self, game_code):
+        with self._lock:
+            return self._build_locks.setdefault(game_code, threading.Lock())
+
+    def invalidate(self, game_code):
+        self._snapshots.pop(game_code, None)
+
+
+def build_snapshot(game_code):
+    """Load a game's players joined to their state and render every team view"""
+    now = timezone.now()
+    rows = Player.objects.filter(game__code=game_code).with_cloak(now).values(
+        'id', 'name', 'team', 'cloaked',
+        is_online=F('state__is_online'),
+        last_seen=F('state__last_seen'),
+        position_lat=F('state__position_lat'),
+        position_lng=F('state__position_lng'),
+    )
+    live = position_store.positions(game_code)
+
+    players = []
+    for row in rows:
+        player_id = str(row['id'])
+        lat, lng, last_seen = row['position_lat'], row['position_lng'], row['last_seen']
+        fix = live.get(player_id)
+        if fix is not None:
+            lat, lng = fix.lat, fix.lng
+            if last_seen is None or fix.timestamp > last_seen:
+                last_seen = fix.timestamp
+        last_seen, is_online = presence.merge(player_id, last_seen, row['is_online'])
+        visibility = derive_visibility(last_seen, is_online, row['cloaked'], now)
+        players.append({
+            'id': player_id,
+            'team': row['team'],
+            'is_online': is_online,
+            'visible': visibility in RADAR_VISIBLE and not row['cloaked'],
+            'entry': {
+                'id': player_id,
+                'name': row['name'],
+                'team': row['team'],
+                'position': {'lat': lat, 'lng': lng} if lat else None,
+                'visibility': visibility
+            },
+        })
+    return RadarSnapshot(game_code, players, time.monotonic())
+
+
+radar_cache = RadarCache()
@@ -0,0 +1,383 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from channels.layers import get_channel_layer
+from django.db import transaction
+from django.utils import timezone
+
+from .broadcast import frame_message, game_group, group_send_many, player_group
+from .dbpool import db_sync_to_async
+from .models import DeployedItem, Event, Game, ItemSpawn, StatusEffect, Zone
+from .positions import position_store
+from .presence import presence
+from .serializers import ItemSpawnSerializer
+from .spatial import entry_key, index_item, spatial_indexes
+from .triggers import TriggerEffect, blast_victims, record_explosion
+
+
+logger = logging.getLogger(__name__)
+
+
+class GameScheduler:
+    """Min-heap of game deadlines, fired from the event loop.
+
+    Every timed thing in a game (status effect and zone expiry, deployed
+    item expiry and time bomb detonation, item respawns, the game clock)
+    becomes a ``(when, kind, key)`` deadline. The loop sleeps until the
+    earliest one is due, pops everything that is due, and hands each kind
+    its whole batch at once: one claiming update per kind and one
+    ``group_send_many`` for all resulting frames. Nothing scans tables on
+    a timer.
+
+    The heap is rebuilt from the database whenever the scheduler starts,
+    so deadlines survive restarts and overdue ones fire immediately.
+    Handlers claim rows with a conditional update, so a deadline fires
+    once even when several workers hold the same heap.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._scheduled = {}
+        self._lock = threading.Lock()
+        self._counter = itertools.count()
+        self._task = None
+        self._loop = None
+        self._wakeup = None
+        self.channel_layer = None
+        self.subscribers = 0
+
+    def __len__(self):
+        return len(self._scheduled)
+
+    def schedule(self, kind, key, when):
+        """Add or move a deadline; safe to call from any thread"""
+        if hasattr(when, 'timestamp'):
+            when = when.timestamp()
+        key = str(key)
+        with self._lock:
+            self._scheduled[(kind, key)] = when
+            heapq.heappush(self._heap, (when, next(self._counter), kind, key))
+            earliest = self._heap[0][0] == when
+        if earliest:
+            self._wake()
+
+    def cancel(self, kind, key):
+        """Drop a deadline; its heap entry is skipped when it comes up"""
+        with self._lock:
+            self._scheduled.pop((kind, str(key)), None)
+
+    def schedule_game(self, game):
+        """Schedule the end of a started game"""
+        if game.started_at is not None:
+            self.schedule('game_end', game.id, game_end_time(game.started_at, game.game_duration))
+
+    def pop_due(self, now=None):
+        """Remove and return due deadlines grouped by kind"""
+        now = time.time() if now is None else now
+        due = {}
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                when, _, kind, key = heapq.heappop(self._heap)
+                # Skip entries that were cancelled or rescheduled
+                if self._scheduled.get((kind, key)) != when:
+                    continue
+                del self._scheduled[(kind, key)]
+                due.setdefault(kind, []).append(key)
+        return due
+
+    def next_delay(self, now=None):
+        """Seconds until the earliest live deadline, or None if there is none"""
+        now = time.time() if now is None else now
+        with self._lock:
+            while self._heap:
+                when, _, kind, key = self._heap[0]
+                if self._scheduled.get((kind, key)) == when:
+                    return max(0.0, when - now)
+                heapq.heappop(self._heap)
+        return None
+
+    def load(self):
+        """Rebuild the heap from every pending deadline in the database"""
+        with self._lock:
+            self._heap.clear()
+            self._scheduled.clear()
+        for kind, loader in DEADLINE_LOADERS.items():
+            for key, when in loader():
+                self.schedule(kind, key, when)
+        return len(self)
+
+    def fire(self, due):
+        """Run each kind's handler on its batch; returns messages to send"""
+        now = timezone.now()
+        messages = []
+        for kind, keys in due.items():
+            try:
+                messages.extend(DEADLINE_HANDLERS[kind](keys, now))
+            except Exception:
+                logger.exception("Deadline handler %s failed", kind)
+        return messages
+
+    def start(self, channel_layer=None):
+        if self._task is None or self._task.done():
+            self.channel_layer = channel_layer or get_channel_layer()
+            self._loop = asyncio.get_running_loop()
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.ensure_future(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+            self._loop = self._wakeup = None
+
+    def _wake(self):
+        loop, wakeup = self._loop, self._wakeup
+        if loop is not None and wakeup is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(wakeup.set)
+
+    async def _run(self):
+        await db_sync_to_async(self.load)()
+        while True:
+            self._wakeup.clear()
+            delay = self.next_delay()
+            if delay is None or delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+            due = self.pop_due()
+            if not due:
+                continue
+            try:
+                messages = await db_sync_to_async(self.fire)(due)
+                if messages:
+                    await group_send_many(self.channel_layer, messages)
+            except Exception:
+                logger.exception("Firing deadlines failed")
+
+
+def game_end_time(started_at, game_duration):
+    return started_at + timedelta(minutes=game_duration)
+
+
+def _claim(queryset, fields, changes=None, due=None):
+    """Lock the rows that are still due, then update (or delete) them.
+
+    Returns the claimed rows as dicts. Rows another worker already
+    claimed are skipped, which is what makes each deadline fire once.
+    """
+    with transaction.atomic():
+        rows = list(
+            queryset.select_for_update(skip_locked=True, of=('self',)).values('id', *fields)
+        )
+        if due is not None:
+            rows = [row for row in rows if due(row)]
+        if rows:
+            claimed = queryset.model.objects.filter(id__in=[row['id'] for row in rows])
+            if changes is None:
+                claimed.delete()
+            else:
+                claimed.update(**changes)
+    return rows
+
+
+def _load_status_effects():
+    return StatusEffect.objects.values_list('id', 'expires_at')
+
+
+def _load_zones():
+    return Zone.objects.filter(active=True, expires_at__isnull=False).values_list('id', 'expires_at')
+
+
+def _load_deployed():
+    return DeployedItem.objects.filter(
+        active=True, expires_at__isnull=False
+    ).values_list('id', 'expires_at')
+
+
+def _load_respawns():
+    return ItemSpawn.objects.filter(
+        available=False, respawn_at__isnull=False
+    ).values_list('id', 'respawn_at')
+
+
+def _load_game_ends():
+    games = Game.objects.filter(
+        status='active', started_at__isnull=False
+    ).values_list('id', 'started_at', 'game_duration')
+    return [
+        (game_id, game_end_time(started_at, duration))
+        for game_id, started_at, duration in games
+    ]
+
+
+def _expire_status_effects(keys, now):
+    rows = _claim(
+        StatusEffect.objects.filter(id__in=keys, expires_at__lte=now),
+        ('player_id', 'type')
+    )
+    return [
+        (player_group(row['player_id']), frame_message({
+            'type': 'status_effect_expired',
+            'effect': row['type']
+        }))
+        for row in rows
+    ]
+
+
+def _expire_zones(keys, now):
+    rows = _claim(
+        Zone.objects.filter(id__in=keys, active=True, expires_at__lte=now),
+        ('game__code',),
+        changes={'active': False}
+    )
+    by_game = {}
+    for row in rows:
+        spatial_indexes.remove(row['game__code'], 'zone', row['id'])
+        by_game.setdefault(row['game__code'], []).append(str(row['id']))
+    return [
+        (game_group(game_code), frame_message({'type': 'zones_expired', 'zone_ids': zone_ids}))
+        for game_code, zone_ids in by_game.items()
+    ]
+
+
+def _expire_deployed(keys, now):
+    rows = _claim(
+        DeployedItem.objects.filter(id__in=keys, active=True, expires_at__lte=now),
+        ('game_id', 'game__code', 'item_type', 'position_lat', 'position_lng',
+         'deployed_by_id', 'metadata'),
+        changes={'active': False}
+    )
+    messages = []
+    for row in rows:
+        spatial_indexes.remove(row['game__code'], 'deployed', row['id'])
+        if row['item_type'] == 'time_bomb':
+            messages.extend(_detonate(row))
+        else:
+            messages.append((player_group(row['deployed_by_id']), frame_message({
+                'type': 'deployed_item_expired',
+                'deployed_item_id': str(row['id']),
+                'item_type': row['item_type']
+            })))
+    return messages
+
+
+def _detonate(row):
+    radius = DeployedItem(item_type=row['item_type'], metadata=row['metadata']).trigger_radius
+    index = spatial_indexes.get(Game.objects.get(id=row['game_id']))
+    effect = TriggerEffect(
+        'explosion', None, key=entry_key('deployed', row['id']),
+        item_type=row['item_type'], owner_id=str(row['deployed_by_id']),
+        lat=row['position_lat'], lng=row['position_lng'], radius=radius,
+        data={'victims': blast_victims(index, row['position_lat'], row['position_lng'], radius)}
+    )
+    return record_explosion(row['game_id'], row['game__code'], effect)
+
+
+def _respawn_items(keys, now):
+    rows = _claim(
+        ItemSpawn.objects.filter(id__in=keys, available=False, respawn_at__lte=now),
+        (),
+        changes={
+            'available': True,
+            'collected_by': None,
+            'collected_at': None,
+            'respawn_at': None,
+        }
+    )
+    if not rows:
+        return []
+    items = list(ItemSpawn.objects.filter(id__in=[row['id'] for row in rows]).select_related('game'))
+    Event.objects.bulk_create([
+        Event(
+            game=item.game,
+            type='item_respawn',
+            params={'item': item.item_type},
+            position_lat=item.position_lat,
+            position_lng=item.position_lng
+        )
+        for item in items
+    ])
+    by_game = {}
+    for item in items:
+        index = spatial_indexes.peek(item.game.code)
+        if index is not None:
+            index_item(index, item)
+        by_game.setdefault(item.game.code, []).append(item)
+    return [
+        (game_group(game_code), frame_message({
+            'type': 'item_respawn',
+            'items': ItemSpawnSerializer(game_items, many=True).data
+        }))
+        for game_code, game_items in by_game.items()
+    ]
+
+
+def _end_games(keys, now):
+    # Blue did not finish its tasks in time, so red wins
+    rows = _claim(
+        Game.objects.filter(id__in=keys, status='active'),
+        ('code', 'started_at', 'game_duration'),
+        changes={'status': 'completed', 'ended_at': now, 'winner': 'red'},
+        due=lambda row: game_end_time(row['started_at'], row['game_duration']) <= now
+    )
+    Event.objects.bulk_create([
+        Event(game_id=row['id'], type='game_ended', params={'winner': 'red'})
+        for row in rows
+    ])
+    for row in rows:
+        presence.flush_game(row['code'])
+        position_store.forget_game(row['code'])
+        spatial_indexes.discard(row['code'])
+    return [
+        (game_group(row['code']), frame_message({
+            'type': 'game_ended',
+            'winner': 'red',
+            'reason': 'timeout'
+        }))
+        for row in rows
+    ]
+
+
+DEADLINE_LOADERS = {
+    'status_effect': _load_status_effects,
+    'zone': _load_zones,
+    'deployed': _load_deployed,
+    'respawn': _load_respawns,
+    'game_end': _load_game_ends,
+}
+
+DEADLINE_HANDLERS = {
+    'status_effect': _expire_status_effects,
+    'zone': _expire_zones,
+    'deployed': _expire_deployed,
+    'respawn': _respawn_items,
+    'game_end': _end_games,
+}
+
+
+game_scheduler = GameScheduler()
+
+
+def acquire_scheduler(channel_layer):
+    """Register a connection, starting the scheduler with the first one"""
+    game_scheduler.subscribers += 1
+    game_scheduler.start(channel_layer)
+    return game_scheduler
+
+
+def release_scheduler():
+    """Unregister a connection, stopping the scheduler after the last one.
+
+    With nobody connected there is no one to notify; deadlines that pass
+    meanwhile fire as soon as the next connection restarts the scheduler.
+    """
+    game_scheduler.subscribers -= 1
+    if game_scheduler.subscribers <= 0:
+        game_scheduler.subscribers = 0
+        game_scheduler.stop()
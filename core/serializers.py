@@ -3,10 +3,16 @@ from .models import (
     Game, Player, Zone, Event, ItemSpawn, PlayerInventory,
     DeployedItem, StatusEffect, Task
 )
+from .event_messages import render_message
+from .presence import presence
+from .visibility import derive_visibility
 
 
 class PlayerSerializer(serializers.ModelSerializer):
     """Serializer for Player model"""
+    is_online = serializers.SerializerMethodField()
+    visibility = serializers.SerializerMethodField()
+    last_seen = serializers.SerializerMethodField()
     position = serializers.SerializerMethodField()
     death_position = serializers.SerializerMethodField()
     current_item = serializers.SerializerMethodField()
@@ -20,6 +26,20 @@ class PlayerSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['id', 'joined_at', 'last_seen']
     
+    def get_presence(self, obj):
+        # Live heartbeats take precedence over the last persisted state
+        return presence.merge(obj.id, obj.last_seen, obj.is_online)
+    
+    def get_is_online(self, obj):
+        return self.get_presence(obj)[1]
+    
+    def get_visibility(self, obj):
+        last_seen, is_online = self.get_presence(obj)
+        return derive_visibility(last_seen, is_online, obj.is_cloaked)
+    
+    def get_last_seen(self, obj):
+        return serializers.DateTimeField().to_representation(self.get_presence(obj)[0])
+    
     def get_position(self, obj):
         if obj.position_lat and obj.position_lng:
             return {
@@ -140,6 +160,7 @@ class ItemSpawnSerializer(serializers.ModelSerializer):
 class EventSerializer(serializers.ModelSerializer):
     """Serializer for Event model"""
     player_name = serializers.CharField(source='player.name', read_only=True)
+    message = serializers.SerializerMethodField()
     position = serializers.SerializerMethodField()
     
     class Meta:
@@ -150,6 +171,9 @@ class EventSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['id', 'created_at']
     
+    def get_message(self, obj):
+        return render_message(obj)
+    
     def get_position(self, obj):
         if obj.position_lat and obj.position_lng:
             return {
@@ -184,6 +208,20 @@ class UpdatePositionSerializer(serializers.Serializer):
     accuracy = serializers.FloatField(required=False)
 
 
+class TrailQuerySerializer(serializers.Serializer):
+    """Serializer for movement trail time ranges"""
+    since = serializers.DateTimeField(required=False)
+    until = serializers.DateTimeField(required=False)
+
+
+def trail_points(points):
+    """Render a trail array as compact ``[epoch seconds, lat, lng]`` rows"""
+    return [
+        [round(t, 3), round(lat, 6), round(lng, 6)]
+        for t, lat, lng in points.tolist()
+    ]
+
+
 class PickupItemSerializer(serializers.Serializer):
     """Serializer for picking up an item"""
     item_id = serializers.UUIDField(required=True)
@@ -0,0 +1,323 @@
+import heapq
+import math
+import threading
+
+from django.conf import settings
+
+from . import geo
+
+
+class SpatialEntry:
+    """Something with a position on the map"""
+    __slots__ = ('key', 'kind', 'lat', 'lng', 'x', 'y', 'radius', 'data', 'cell')
+
+    def __init__(self, key, kind, lat, lng, x, y, radius, data, cell):
+        self.key = key
+        self.kind = kind
+        self.lat = lat
+        self.lng = lng
+        self.x = x
+        self.y = y
+        self.radius = radius
+        self.data = data
+        self.cell = cell
+
+
+class SpatialIndex:
+    """Uniform grid over a game's map, keyed in meters.
+
+    Positions are projected onto a local plane around the game's home
+    base (equirectangular, accurate to well under a meter at game scale)
+    and bucketed into square cells of ``cell_size`` meters. Radius and
+    k-nearest queries only visit the cells around the query point, so
+    their cost depends on local density rather than on how many zones,
+    items or players the game has.
+
+    Entries may carry their own ``radius`` (zones, pickup radii, trigger
+    radii); queries with ``within_entry_radius=True`` return entries whose
+    area overlaps the query circle.
+    """
+
+    def __init__(self, origin_lat, origin_lng, cell_size=None):
+        self.origin_lat = origin_lat
+        self.origin_lng = origin_lng
+        self.cell_size = cell_size or getattr(settings, 'SPATIAL_CELL_SIZE', 25)
+        self._meters_per_deg_lat = geo.METERS_PER_DEGREE_LAT
+        self._meters_per_deg_lng = float(geo.meters_per_degree_lng(origin_lat))
+        self._cells = {}
+        self._entries = {}
+        self._max_radius = 0
+        # Bounding box of every cell ever occupied, for k-nearest ring limits
+        self._bounds = None
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def project(self, lat, lng):
+        """Return planar (x, y) meters from the origin"""
+        return (
+            (lng - self.origin_lng) * self._meters_per_deg_lng,
+            (lat - self.origin_lat) * self._meters_per_deg_lat,
+        )
+
+    def cell_of(self, x, y):
+        return (math.floor(x / self.cell_size), math.floor(y / self.cell_size))
+
+    def get(self, key):
+        return self._entries.get(key)
+
+    def insert(self, key, kind, lat, lng, radius=0, data=None):
+        """Add an entry, or move and update it if the key already exists"""
+        x, y = self.project(lat, lng)
+        cell = self.cell_of(x, y)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._unlink(entry)
+            entry = SpatialEntry(key, kind, lat, lng, x, y, radius, data, cell)
+            self._entries[key] = entry
+            self._link(entry)
+            if radius > self._max_radius:
+                self._max_radius = radius
+        return entry
+
+    def move(self, key, lat, lng):
+        """Move an existing entry; returns None if the key is unknown"""
+        x, y = self.project(lat, lng)
+        cell = self.cell_of(x, y)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if cell != entry.cell:
+                self._unlink(entry)
+                entry.cell = cell
+                self._link(entry)
+            entry.lat, entry.lng, entry.x, entry.y = lat, lng, x, y
+        return entry
+
+    def remove(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._unlink(entry)
+        return entry
+
+    def query_radius(self, lat, lng, radius, kinds=None, within_entry_radius=False):
+        """Return ``(entry, distance_m)`` pairs within ``radius`` meters, nearest first.
+
+        With ``within_entry_radius`` each entry's own radius is added to the
+        search radius, so a point query (``radius=0``) returns every zone or
+        trigger whose area contains the point.
+        """
+        x, y = self.project(lat, lng)
+        reach = radius + (self._max_radius if within_entry_radius else 0)
+        results = []
+        with self._lock:
+            for key in self._keys_near(x, y, reach):
+                entry = self._entries[key]
+                if kinds is not None and entry.kind not in kinds:
+                    continue
+                distance = math.hypot(entry.x - x, entry.y - y)
+                limit = radius + entry.radius if within_entry_radius else radius
+                if distance <= limit:
+                    results.append((entry, distance))
+        results.sort(key=lambda pair: pair[1])
+        return results
+
+    def nearest(self, lat, lng, k=1, kinds=None, max_distance=None):
+        """Return up to ``k`` ``(entry, distance_m)`` pairs, nearest first"""
+        x, y = self.project(lat, lng)
+        cx, cy = self.cell_of(x, y)
+        best = []
+        with self._lock:
+            if not self._cells:
+                return []
+            max_ring = self._max_ring(cx, cy, max_distance)
+            ring = 0
+            while ring <= max_ring:
+                for cell in self._ring_cells(cx, cy, ring):
+                    for key in self._cells.get(cell, ()):
+                        entry = self._entries[key]
+                        if kinds is not None and entry.kind not in kinds:
+                            continue
+                        distance = math.hypot(entry.x - x, entry.y - y)
+                        if max_distance is not None and distance > max_distance:
+                            continue
+                        heapq.heappush(best, (-distance, key, entry))
+                        if len(best) > k:
+                            heapq.heappop(best)
+                # Anything in ring r+1 is at least r * cell_size away
+                if len(best) == k and -best[0][0] <= ring * self.cell_size:
+                    break
+                ring += 1
+        return sorted(((entry, -d) for d, _, entry in best), key=lambda pair: pair[1])
+
+    def _link(self, entry):
+        self._cells.setdefault(entry.cell, set()).add(entry.key)
+        cx, cy = entry.cell
+        if self._bounds is None:
+            self._bounds = (cx, cy, cx, cy)
+        else:
+            min_cx, min_cy, max_cx, max_cy = self._bounds
+            self._bounds = (min(min_cx, cx), min(min_cy, cy), max(max_cx, cx), max(max_cy, cy))
+
+    def _unlink(self, entry):
+        keys = self._cells.get(entry.cell)
+        if keys is not None:
+            keys.discard(entry.key)
+            if not keys:
+                del self._cells[entry.cell]
+
+    def _keys_near(self, x, y, reach):
+        min_cx, min_cy = self.cell_of(x - reach, y - reach)
+        max_cx, max_cy = self.cell_of(x + reach, y + reach)
+        if (max_cx - min_cx + 1) * (max_cy - min_cy + 1) > len(self._cells):
+            # Sparse grid: walking occupied cells is cheaper than the box
+            for (cx, cy), keys in self._cells.items():
+                if min_cx <= cx <= max_cx and min_cy <= cy <= max_cy:
+                    yield from keys
+            return
+        for cx in range(min_cx, max_cx + 1):
+            for cy in range(min_cy, max_cy + 1):
+                yield from self._cells.get((cx, cy), ())
+
+    def _max_ring(self, cx, cy, max_distance):
+        min_cx, min_cy, max_cx, max_cy = self._bounds
+        ring = max(cx - min_cx, max_cx - cx, cy - min_cy, max_cy - cy)
+        if max_distance is not None:
+            ring = min(ring, int(max_distance // self.cell_size) + 1)
+        return ring
+
+    @staticmethod
+    def _ring_cells(cx, cy, ring):
+        if ring == 0:
+            yield (cx, cy)
+            return
+        for dx in range(-ring, ring + 1):
+            yield (cx + dx, cy - ring)
+            yield (cx + dx, cy + ring)
+        for dy in range(-ring + 1, ring):
+            yield (cx - ring, cy + dy)
+            yield (cx + ring, cy + dy)
+
+
+def entry_key(kind, entity_id):
+    return f'{kind}:{entity_id}'
+
+
+class GameIndexRegistry:
+    """Per-game spatial indexes, built lazily from the database.
+
+    ``get`` must be called from a sync context the first time a game is
+    touched. After that the index is kept current incrementally by the
+    code paths that move, add or remove entities; ``discard`` forces a
+    rebuild on next access (e.g. after bulk content generation).
+    """
+
+    def __init__(self):
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    def get(self, game):
+        """Return the index for ``game``, building it on first use"""
+        index = self._indexes.get(game.code)
+        if index is None:
+            with self._lock:
+                index = self._indexes.get(game.code)
+                if index is None:
+                    index = self._indexes[game.code] = build_game_index(game)
+        return index
+
+    def rebuild(self, game):
+        """Build the index for ``game`` from the database again, replacing the old one"""
+        index = build_game_index(game)
+        with self._lock:
+            self._indexes[game.code] = index
+        return index
+
+    def peek(self, game_code):
+        """Return the index for a game only if it has already been built"""
+        return self._indexes.get(game_code)
+
+    def discard(self, game_code):
+        with self._lock:
+            self._indexes.pop(game_code, None)
+
+    def move_player(self, game_code, player_id, lat, lng):
+        """Track a player's live position in an already built index"""
+        index = self._indexes.get(game_code)
+        if index is not None:
+            index.insert(entry_key('player', player_id), 'player', lat, lng)
+
+    def remove(self, game_code, kind, entity_id):
+        index = self._indexes.get(game_code)
+        if index is not None:
+            index.remove(entry_key(kind, entity_id))
+
+
+def build_game_index(game):
+    """Load a game's zones, items, deployed items and players into a new index"""
+    from .models import DeployedItem, ItemSpawn, Player, Zone
+    from .positions import position_store
+
+    index = SpatialIndex(game.home_base_lat, game.home_base_lng)
+    for zone in Zone.objects.filter(game=game, active=True):
+        index_zone(index, zone)
+    for item in ItemSpawn.objects.filter(game=game, available=True):
+        index_item(index, item)
+    for deployed in DeployedItem.objects.filter(game=game, active=True):
+        index_deployed(index, deployed)
+
+    live = position_store.positions(game.code)
+    players = Player.objects.filter(
+        game=game, left_at__isnull=True,
+        state__position_lat__isnull=False, state__position_lng__isnull=False
+    ).values_list('id', 'state__position_lat', 'state__position_lng')
+    for player_id, lat, lng in players:
+        fix = live.pop(str(player_id), None)
+        if fix is not None:
+            lat, lng = fix.lat, fix.lng
+        index.insert(entry_key('player', player_id), 'player', lat, lng)
+    for player_id, fix in live.items():
+        index.insert(entry_key('player', player_id), 'player', fix.lat, fix.lng)
+    return index
+
+
+def index_zone(index, zone):
+    return index.insert(
+        entry_key('zone', zone.id), 'zone', zone.position_lat, zone.position_lng,
+        radius=zone.radius,
+        data={'type': zone.type, 'expires_at': _timestamp(zone.expires_at)}
+    )
+
+
+def index_item(index, item):
+    return index.insert(
+        entry_key('item', item.id), 'item', item.position_lat, item.position_lng,
+        radius=item.pickup_radius, data={'item_type': item.item_type}
+    )
+
+
+def index_deployed(index, deployed):
+    return index.insert(
+        entry_key('deployed', deployed.id), 'deployed',
+        deployed.position_lat, deployed.position_lng,
+        radius=deployed.trigger_radius,
+        data={
+            'item_type': deployed.item_type,
+            'deployed_by': str(deployed.deployed_by_id),
+            'expires_at': _timestamp(deployed.expires_at),
+        }
+    )
+
+
+def _timestamp(value):
+    return value.timestamp() if value is not None else None
+
+
+spatial_indexes = GameIndexRegistry()
@@ -1,14 +1,59 @@
-from django.test import TestCase, TransactionTestCase
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.db import IntegrityError, connections, transaction
+from django.test.utils import CaptureQueriesContext
+from django.apps import apps as django_apps
 from django.urls import reverse
-from rest_framework.test import APITestCase, APIClient
+from django.utils import timezone
+from rest_framework.test import APITestCase, APITransactionTestCase, APIClient
 from rest_framework import status
+from asgiref.sync import async_to_sync
 from channels.testing import WebsocketCommunicator
 from channels.db import database_sync_to_async
+from channels.layers import InMemoryChannelLayer, get_channel_layer
+from channels.routing import URLRouter
+import importlib
 import json
 import asyncio
+import math
+import msgpack
+import threading
+import time
+from datetime import timedelta
 
-from .models import Game, Player, Zone, Event, ItemSpawn, PlayerInventory
+from .models import (
+    Game, Player, Zone, Event, ItemSpawn, PlayerInventory, DeployedItem, StatusEffect,
+    PlayerState, MovementTrail
+)
+from . import geo
+from .broadcast import (
+    frame_message, group_send_frame, keyed_frame_message, player_context_message,
+    player_group, render_frame
+)
 from .consumers import GameConsumer
+from .codecs import JsonCodec, MsgpackCodec, negotiate
+from .dbpool import db_pool, db_sync_to_async
+from .event_messages import render_message
+from .events import EventSink
+from .deltas import PositionDecoder, PositionEncoder
+from .interest import InterestGrid, cell_size_for, interest_grids
+from .lobby import begin_game
+from .positions import PositionStore, position_store
+from .presence import LocalPresenceBackend, PresenceService
+from .radar import RadarCache
+from .scheduler import GameScheduler
+from .routing import websocket_urlpatterns
+from .spatial import SpatialIndex, entry_key, spatial_indexes
+from .load import (
+    DOWNSAMPLE, HIGH, LOW, NORMAL, NORMAL_LOAD, SHED, LoadMonitor, load_monitor, priority_of
+)
+from .metrics import Metrics, metrics
+from .outbound import POSITIONS, OutboundQueue
+from .outbox import BroadcastOutbox
+from .movement import MovementFilter
+from .ticker import PositionTicker
+from .trails import TrailStore
+from .visibility import VisibilityTracker, derive_visibility
+from .triggers import TriggerEngine
 
 
 class GameModelTest(TestCase):
@@ -99,7 +144,64 @@ class PlayerModelTest(TestCase):
         self.assertEqual(inventory.item, item)
 
 
-class GameAPITest(APITestCase):
+class PlayerStateTest(TestCase):
+    """Test the hot/cold split between Player and PlayerState"""
+    
+    def setUp(self):
+        self.host = Player.objects.create(name="Host")
+        self.game = Game.objects.create(
+            host=self.host,
+            home_base_lat=37.7749,
+            home_base_lng=-122.4194
+        )
+        self.player = Player.objects.create(
+            name="Runner", game=self.game, position_lat=37.7750, position_lng=-122.4195
+        )
+    
+    def test_state_created_with_player(self):
+        """Test that creating a player also writes its state row"""
+        state = PlayerState.objects.get(player=self.player)
+        self.assertEqual(state.position_lat, 37.7750)
+        self.assertTrue(state.is_online)
+        self.assertEqual(PlayerState.objects.get(player=self.host).position_lat, None)
+    
+    def test_state_save_touches_state_columns_only(self):
+        """Test that saving a state change updates just the changed columns"""
+        player = Player.objects.select_related('state').get(id=self.player.id)
+        player.position_lat = 37.7760
+        
+        with CaptureQueriesContext(connections['default']) as queries:
+            player.save()
+        
+        state_updates = [q['sql'] for q in queries if 'UPDATE "core_playerstate"' in q['sql']]
+        self.assertEqual(len(state_updates), 1)
+        self.assertIn('"position_lat"', state_updates[0])
+        self.assertNotIn('"last_seen"', state_updates[0])
+        self.player.refresh_from_db()
+        self.assertEqual(self.player.position_lat, 37.7760)
+    
+    def test_player_list_joins_state(self):
+        """Test that serializing players reads their state through the join"""
+        Player.objects.create(name="Chaser", game=self.game)
+        url = reverse('player-list')
+        
+        with CaptureQueriesContext(connections['default']) as queries:
+            response = self.client.get(url)
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # No per-player state lookups
+        self.assertFalse([q for q in queries if 'FROM "core_playerstate"' in q['sql']])
+        positions = {row['name']: row['position'] for row in response.data['results']}
+        self.assertEqual(positions['Runner'], {'lat': 37.7750, 'lng': -122.4195})
+
+
+# Join, start and leave run on the database pool, which needs committed data
+@override_settings(
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    EVENT_FLUSH_INTERVAL=0,
+    CONSUMER_DB_THREADS=1
+)
+class GameAPITest(APITransactionTestCase):
     """Test Game API endpoints"""
     
     def setUp(self):
@@ -216,6 +318,194 @@ class GameAPITest(APITestCase):
         self.assertGreater(ItemSpawn.objects.filter(game=game).count(), 0)
 
 
+@override_settings(
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    EVENT_FLUSH_INTERVAL=0,
+    CONSUMER_DB_THREADS=1
+)
+class LobbyViewTest(APITransactionTestCase):
+    """Test the async join/start/leave views"""
+    
+    def setUp(self):
+        self.client = APIClient()
+        self.host = Player.objects.create(name="Host")
+        self.game = Game.objects.create(
+            host=self.host,
+            home_base_lat=37.7749,
+            home_base_lng=-122.4194
+        )
+        self.host.game = self.game
+        self.host.save()
+        self.layer = get_channel_layer()
+        self.channel = async_to_sync(self.layer.new_channel)()
+        async_to_sync(self.layer.group_add)(f'game_{self.game.code}', self.channel)
+    
+    def receive(self):
+        return json.loads(async_to_sync(self.layer.receive)(self.channel)['text'])
+    
+    def test_join_broadcasts_after_commit(self):
+        """Test that joining creates the player and announces it to the game group"""
+        response = self.client.post(
+            f'/api/games/{self.game.code}/join/', {'playerName': 'Newcomer'}, format='json'
+        )
+        
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['name'], 'Newcomer')
+        self.assertIn('avatarUrl', response.json())
+        self.assertTrue(PlayerInventory.objects.filter(player__name='Newcomer').exists())
+        frame = self.receive()
+        self.assertEqual(frame['type'], 'player_joined')
+        self.assertEqual(frame['player']['name'], 'Newcomer')
+        
+        response = self.client.post(
+            f'/api/games/{self.game.code}/join/', {'player_name': 'Newcomer'}, format='json'
+        )
+        self.assertEqual(response.data['error'], 'Name already taken')
+        
+        response = self.client.post(
+            f'/api/games/{self.game.code}/join/', '{', content_type='application/json'
+        )
+        self.assertEqual(response.data['error'], 'Malformed request body')
+    
+    def test_start_notifies_players(self):
+        """Test that starting assigns teams, refreshes contexts and announces the start"""
+        player = Player.objects.create(name="Player 1", game=self.game)
+        context_channel = async_to_sync(self.layer.new_channel)()
+        async_to_sync(self.layer.group_add)(f'player_{player.id}', context_channel)
+        
+        response = self.client.post(f'/api/games/{self.game.code}/start/')
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['status'], 'active')
+        player.refresh_from_db()
+        message = async_to_sync(self.layer.receive)(context_channel)
+        self.assertEqual(message['changes'], {'team': player.team})
+        self.assertEqual(self.receive()['type'], 'game_started')
+    
+    def test_leave_lobby_transfers_host(self):
+        """Test that a host leaving the lobby hands the game over"""
+        player = Player.objects.create(name="Player 1", game=self.game)
+        
+        response = self.client.post(
+            f'/api/games/{self.game.code}/leave/', {'playerId': str(self.host.id)}, format='json'
+        )
+        
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.game.refresh_from_db()
+        self.assertEqual(self.game.host_id, player.id)
+        self.assertEqual(self.receive(), {'type': 'player_left', 'player_id': str(self.host.id)})
+        
+        response = self.client.post(
+            f'/api/games/{self.game.code}/leave/', {'playerId': 'nobody'}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+    
+    @override_settings(POSITION_FLUSH_INTERVAL=0)
+    def test_leave_active_game_forgets_player(self):
+        """Test that leaving an active game drops the player from in-memory state"""
+        Game.objects.filter(id=self.game.id).update(status='active')
+        self.addCleanup(spatial_indexes.discard, self.game.code)
+        index = spatial_indexes.get(self.game)
+        position_store.record(self.game.code, self.host.id, 37.7750, -122.4195)
+        spatial_indexes.move_player(self.game.code, self.host.id, 37.7750, -122.4195)
+        
+        response = self.client.post(
+            f'/api/games/{self.game.code}/leave/', {'playerId': str(self.host.id)}, format='json'
+        )
+        
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertNotIn(entry_key('player', self.host.id), index)
+        self.assertIsNone(position_store.get(self.game.code, self.host.id))
+        self.assertEqual(PlayerState.objects.get(player=self.host).position_lat, 37.7750)
+    
+    def test_start_replaces_index_on_commit(self):
+        """Test that the spatial index built from the lobby is replaced only once the start commits"""
+        Player.objects.create(name="Player 1", game=self.game)
+        self.addCleanup(spatial_indexes.discard, self.game.code)
+        lobby_index = spatial_indexes.get(self.game)
+        
+        with transaction.atomic():
+            begin_game(self.game)
+            # A request racing the start still finds the lobby's index
+            self.assertIs(spatial_indexes.peek(self.game.code), lobby_index)
+        
+        index = spatial_indexes.peek(self.game.code)
+        self.assertIsNot(index, lobby_index)
+        for zone in Zone.objects.filter(game=self.game):
+            self.assertIn(entry_key('zone', zone.id), index)
+
+
+class FlakyChannelLayer(InMemoryChannelLayer):
+    """In-memory layer whose first ``failures`` group sends raise"""
+    
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = failures
+    
+    async def group_send(self, group, message):
+        if self.failures > 0:
+            self.failures -= 1
+            raise ConnectionError('channel layer unavailable')
+        await super().group_send(group, message)
+
+
+class BroadcastOutboxTest(TestCase):
+    """Test that view broadcasts wait for commit, go out together and are retried"""
+    
+    def setUp(self):
+        self.layer = FlakyChannelLayer(failures=0)
+        self.outbox = BroadcastOutbox(channel_layer=self.layer, retries=2, retry_delay=0)
+        self.channel = async_to_sync(self.layer.new_channel)()
+        async_to_sync(self.layer.group_add)('game_OUTBOX', self.channel)
+    
+    def receive(self):
+        return json.loads(async_to_sync(self.layer.receive)(self.channel)['text'])
+    
+    def test_sends_after_commit_only(self):
+        """Test that messages wait for commit and a rollback discards them"""
+        delivered = metrics.counter('outbox_delivered')
+        with self.outbox.collect() as batch:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.outbox.send('game_OUTBOX', frame_message({'type': 'first'}))
+                try:
+                    with transaction.atomic():
+                        self.outbox.send('game_OUTBOX', frame_message({'type': 'rolled_back'}))
+                        raise IntegrityError
+                except IntegrityError:
+                    pass
+                self.outbox.send('game_OUTBOX', frame_message({'type': 'second'}))
+                self.assertEqual(batch, [])
+            self.assertEqual(len(batch), 2)
+    
+        self.assertEqual(async_to_sync(self.outbox.deliver)(batch), [])
+        self.assertEqual(self.receive(), {'type': 'first'})
+        self.assertEqual(self.receive(), {'type': 'second'})
+        self.assertEqual(metrics.counter('outbox_delivered'), delivered + 2)
+        self.assertGreaterEqual(metrics.summary('outbox_commit_to_delivery_ms')['count'], 2)
+    
+    def test_retries_failed_sends_in_order(self):
+        """Test that a failed send is retried without reordering the group"""
+        self.layer.failures = 1
+        entries = [
+            ('game_OUTBOX', frame_message({'type': 'first'}), time.monotonic()),
+            ('game_OUTBOX', frame_message({'type': 'second'}), time.monotonic()),
+        ]
+        retried = metrics.counter('outbox_retried')
+    
+        self.assertEqual(async_to_sync(self.outbox.deliver)(entries), [])
+        self.assertEqual(self.receive(), {'type': 'first'})
+        self.assertEqual(self.receive(), {'type': 'second'})
+        self.assertEqual(metrics.counter('outbox_retried'), retried + 2)
+    
+        self.layer.failures = 10
+        failed = metrics.counter('outbox_failed')
+        with self.assertLogs('core.outbox', level='ERROR'):
+            unsent = async_to_sync(self.outbox.deliver)(entries[:1])
+        self.assertEqual(unsent, entries[:1])
+        self.assertEqual(metrics.counter('outbox_failed'), failed + 1)
+
+
+@override_settings(POSITION_FLUSH_INTERVAL=0, TRAIL_FLUSH_INTERVAL=0)
 class PlayerAPITest(APITestCase):
     """Test Player API endpoints"""
     
@@ -259,13 +549,24 @@ class PlayerAPITest(APITestCase):
         self.assertEqual(self.player.position_lng, -122.4195)
         self.assertEqual(self.player.visibility, 'active')
         
-        # Verify event was logged
-        event = Event.objects.filter(
-            game=self.game,
-            type='player_moved',
-            player=self.player
-        ).first()
-        self.assertIsNotNone(event)
+        # Movement goes to the trail store instead of the event log
+        self.assertFalse(Event.objects.filter(game=self.game, player=self.player).exists())
+        response = self.client.get(f'/api/players/{self.player.id}/trail/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['points']), 1)
+        self.assertAlmostEqual(response.data['points'][0][1], 37.7750, places=5)
+    
+    def test_update_position_suppresses_jitter(self):
+        """Test that a fix inside the reported accuracy is not stored"""
+        url = f'/api/players/{self.player.id}/update_position/'
+        self.client.post(url, {'lat': 37.7750, 'lng': -122.4195, 'accuracy': 10}, format='json')
+        self.client.post(url, {'lat': 37.77502, 'lng': -122.4195, 'accuracy': 10}, format='json')
+        
+        self.player.refresh_from_db()
+        self.assertEqual(self.player.position_lat, 37.7750)
+        response = self.client.get('/api/metrics/', {'game_code': self.game.code})
+        key = f'movement_suppressed{{game={self.game.code}}}'
+        self.assertEqual(response.data['counters'][key], 1)
     
     def test_pickup_item(self):
         """Test picking up an item"""
@@ -366,6 +667,122 @@ class EventAPITest(APITestCase):
         self.assertEqual(first_event['type'], 'game_started')
 
 
+class EventSinkTest(TestCase):
+    """Test the write-behind event log sink"""
+    
+    def setUp(self):
+        self.host = Player.objects.create(name="Host")
+        self.game = Game.objects.create(
+            host=self.host,
+            home_base_lat=37.7749,
+            home_base_lng=-122.4194
+        )
+        self.sink = EventSink(flush_interval=60, batch_size=3)
+    
+    def tearDown(self):
+        self.sink.close(flush=False)
+    
+    def record(self, type, message='Something happened'):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.sink.record(game=self.game, type=type, player=self.host, message=message)
+    
+    def test_buffers_until_batch_is_full(self):
+        """Test that routine events are bulk written while critical ones go straight in"""
+        first = self.record('item_picked')
+        self.record('chat')
+        self.assertEqual(self.sink.pending, 2)
+        self.assertFalse(Event.objects.filter(game=self.game).exists())
+        
+        self.record('game_started')
+        self.assertEqual(list(Event.objects.values_list('type', flat=True)), ['game_started'])
+        
+        self.record('item_used')
+        self.assertEqual(self.sink.pending, 0)
+        self.assertEqual(Event.objects.filter(game=self.game).count(), 4)
+        # Timestamped when recorded, not when written
+        self.assertEqual(Event.objects.get(id=first.id).created_at, first.created_at)
+    
+    def test_rollback_discards_buffered_events(self):
+        """Test that events recorded in a rolled back transaction are never written"""
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    self.sink.record(game=self.game, type='chat', message='Never sent')
+                    raise IntegrityError
+            except IntegrityError:
+                pass
+        
+        self.assertEqual(self.sink.pending, 0)
+        self.assertEqual(self.sink.flush(), 0)
+    
+    def test_synchronous_mode_and_flush_on_close(self):
+        """Test that an interval of 0 writes at once and closing writes the buffer"""
+        with override_settings(EVENT_FLUSH_INTERVAL=0):
+            EventSink().record(game=self.game, type='chat', message='Right away')
+        self.assertTrue(Event.objects.filter(message='Right away').exists())
+        
+        self.record('chat', message='On shutdown')
+        self.sink.close()
+        self.assertTrue(Event.objects.filter(message='On shutdown').exists())
+
+
+class EventMessageTest(TestCase):
+    """Test render-on-read event messages and the params backfill"""
+    
+    def setUp(self):
+        self.host = Player.objects.create(name="Host")
+        self.game = Game.objects.create(
+            host=self.host,
+            home_base_lat=37.7749,
+            home_base_lng=-122.4194
+        )
+        self.player = Player.objects.create(name="Alice", game=self.game)
+    
+    def event(self, type, **fields):
+        return Event.objects.create(game=self.game, type=type, **fields)
+    
+    def test_messages_render_from_params(self):
+        """Test that templated events store no text and render it when read"""
+        self.event('player_joined', player=self.host, params={'host': True})
+        self.event('item_picked', player=self.player, params={'item': 'dagger'})
+        self.event('motion_detected', player=self.player, params={'item': 'motion_sensor'})
+        self.event('chat', player=self.player, message='Meet at the fountain')
+        self.assertFalse(Event.objects.exclude(type='chat').exclude(message='').exists())
+        
+        response = self.client.get(f'/api/events/?game_code={self.game.code}')
+        messages = {event['type']: event['message'] for event in response.data['results']}
+        self.assertEqual(messages, {
+            'player_joined': 'Host created the game',
+            'item_picked': 'Alice picked up dagger',
+            'motion_detected': 'Motion sensor detected movement',
+            'chat': 'Meet at the fountain',
+        })
+    
+    def test_backfill_moves_messages_into_params(self):
+        """Test that the data migration parses old messages it can render back"""
+        migration = importlib.import_module('core.migrations.0011_backfill_event_params')
+        picked = self.event('item_picked', player=self.player, message='Alice picked up dagger')
+        exploded = self.event('explosion', message='A motion sensor exploded')
+        started = self.event('game_started', message='Game started with 4 players')
+        renamed = self.event('player_joined', player=self.player, message='Bob joined the game')
+        
+        migration.backfill(django_apps, None)
+        
+        for event, params in ((picked, {'item': 'dagger'}), (exploded, {'item': 'motion_sensor'}),
+                              (started, {'players': 4})):
+            text = event.message
+            event.refresh_from_db()
+            self.assertEqual((event.message, event.params), ('', params))
+            self.assertEqual(render_message(event), text)
+        # Its player is no longer called Bob, so the text stays
+        renamed.refresh_from_db()
+        self.assertEqual((renamed.message, renamed.params), ('Bob joined the game', None))
+        
+        migration.restore(django_apps, None)
+        picked.refresh_from_db()
+        self.assertEqual(picked.message, 'Alice picked up dagger')
+
+
 class WebSocketTest(TransactionTestCase):
     """Test WebSocket connections"""
     
@@ -439,3 +856,1391 @@ class WebSocketTest(TransactionTestCase):
         
         await comm1.disconnect()
         await comm2.disconnect()
+
+
+class PositionStoreTest(TestCase):
+    """Test the write-behind position store"""
+    
+    def setUp(self):
+        self.host = Player.objects.create(name="Host")
+        self.game = Game.objects.create(
+            host=self.host,
+            home_base_lat=37.7749,
+            home_base_lng=-122.4194
+        )
+        self.player = Player.objects.create(name="Runner", game=self.game)
+        self.store = PositionStore(flush_interval=60)
+    
+    def tearDown(self):
+        self.store.close()
+    
+    def test_record_is_buffered_until_flush(self):
+        """Test that recording a position does not touch the database"""
+        self.store.record(self.game.code, self.player.id, 37.7750, -122.4195, 5.0)
+        
+        self.player.refresh_from_db()
+        self.assertIsNone(self.player.position_lat)
+        self.assertEqual(self.store.get(self.game.code, self.player.id).lat, 37.7750)
+        
+        self.assertEqual(self.store.flush(), 1)
+        self.player.refresh_from_db()
+        self.assertEqual(self.player.position_lat, 37.7750)
+        self.assertEqual(self.player.position_accuracy, 5.0)
+    
+    def test_flush_writes_latest_fix_only(self):
+        """Test that repeated updates collapse into one row write"""
+        for i in range(5):
+            self.store.record(self.game.code, self.player.id, 37.7750 + i * 0.0001, -122.4195)
+        
+        self.assertEqual(self.store.flush(), 1)
+        self.player.refresh_from_db()
+        self.assertAlmostEqual(self.player.position_lat, 37.7754)
+        # Nothing left to write
+        self.assertEqual(self.store.flush(), 0)
+    
+    def test_flush_player(self):
+        """Test flushing a single player's pending position"""
+        self.store.record(self.game.code, self.player.id, 37.7750, -122.4195)
+        self.store.record(self.game.code, self.host.id, 37.7760, -122.4190)
+        
+        self.assertEqual(self.store.flush_player(self.player.id), 1)
+        self.host.refresh_from_db()
+        self.assertIsNone(self.host.position_lat)
+        self.assertEqual(self.store.flush(), 1)
+    
+    def test_forget_game_keeps_pending_writes(self):
+        """Test that an ended game's fixes are dropped but still written"""
+        self.store.record(self.game.code, self.player.id, 37.7750, -122.4195)
+        self.store.record(self.game.code, self.host.id, 37.7760, -122.4190)
+        
+        self.store.forget_game(self.game.code)
+        self.assertEqual(self.store.positions(self.game.code), {})
+        self.assertEqual(self.store.player_count(self.game.code), 0)
+        self.assertEqual(self.store.take_moved(self.game.code), [])
+        self.assertEqual(self.store.flush(), 2)
+
+
+class TrailStoreTest(TransactionTestCase):
+    """Test the chunked movement trail store"""
+    
+    def setUp(self):
+        self.host = Player.objects.create(name="Host")
+        self.game = Game.objects.create(
+            host=self.host,
+            home_base_lat=37.7749,
+            home_base_lng=-122.4194
+        )
+        self.player = Player.objects.create(name="Runner", game=self.game)
+        self.store = TrailStore(flush_interval=60, chunk_size=4)
+        self.start = timezone.now()
+    
+    def tearDown(self):
+        self.store.close(flush=False)
+    
+    def append(self, count, offset=0):
+        for i in range(offset, offset + count):
+            self.store.append(
+                self.game.id, self.player.id, 37.7749 + i * 0.0001, -122.4194,
+                self.start + timedelta(seconds=i)
+            )
+    
+    def test_points_written_in_chunks(self):
+        """Test that a full buffer becomes one float32 chunk row"""
+        self.append(6)
+        
+        chunk = MovementTrail.objects.get(player=self.player)
+        self.assertEqual(chunk.point_count, 4)
+        self.assertEqual(len(bytes(chunk.points)), 4 * 3 * 4)
+        # The last two points are still buffered but readable
+        points = self.store.read(player_ids=[self.player.id])[str(self.player.id)]
+        self.assertEqual(len(points), 6)
+        self.assertAlmostEqual(points[5, 1], 37.7754, places=5)
+        self.assertAlmostEqual(points[5, 0], (self.start + timedelta(seconds=5)).timestamp(), places=2)
+    
+    def test_time_range_read(self):
+        """Test reading a time window that spans stored and buffered points"""
+        self.append(10)
+        self.store.flush()
+        
+        trails = self.store.read(
+            game_id=self.game.id,
+            since=self.start + timedelta(seconds=3),
+            until=self.start + timedelta(seconds=6)
+        )
+        times = trails[str(self.player.id)][:, 0] - self.start.timestamp()
+        self.assertEqual([round(t) for t in times], [3, 4, 5, 6])
+        self.assertEqual(
+            self.store.read(game_id=self.game.id, since=self.start + timedelta(minutes=1)), {}
+        )
+    
+    def test_deleted_player_does_not_block_writes(self):
+        """Test that a chunk for a deleted player is dropped and the rest still written"""
+        other = Player.objects.create(name="Chaser", game=self.game)
+        self.append(2)
+        self.store.append(self.game.id, other.id, 37.7749, -122.4194, self.start)
+        self.player.delete()
+        
+        with self.assertLogs('core.trails', level='ERROR'):
+            self.assertEqual(self.store.flush(), 1)
+        self.assertEqual(MovementTrail.objects.get().player_id, other.id)
+        self.assertEqual(list(self.store.read(game_id=self.game.id)), [str(other.id)])
+        # Later flushes are not held back by the dropped chunk
+        self.store.append(self.game.id, other.id, 37.7750, -122.4194, self.start + timedelta(seconds=1))
+        self.assertEqual(self.store.flush(), 1)
+    
+    def test_migration_chunks_moves_per_player(self):
+        """Test that logged moves become chunks per player, split at the chunk size"""
+        migration = importlib.import_module('core.migrations.0008_movement_trails')
+        self.addCleanup(setattr, migration, 'CHUNK_SIZE', migration.CHUNK_SIZE)
+        migration.CHUNK_SIZE = 2
+        other = Player.objects.create(name="Chaser", game=self.game)
+        for player, count in ((self.player, 3), (other, 1)):
+            for i in range(count):
+                Event.objects.create(
+                    game=self.game, type='player_moved', player=player,
+                    created_at=self.start + timedelta(seconds=i),
+                    position_lat=37.7749 + i * 0.0001, position_lng=-122.4194
+                )
+        
+        migration.move_events_to_trails(django_apps, None)
+        
+        self.assertFalse(Event.objects.filter(type='player_moved').exists())
+        counts = sorted(MovementTrail.objects.values_list('player__name', 'point_count'))
+        self.assertEqual(counts, [('Chaser', 1), ('Runner', 1), ('Runner', 2)])
+        points = self.store.read(player_ids=[self.player.id])[str(self.player.id)]
+        self.assertAlmostEqual(points[2, 1], 37.7751, places=5)
+        self.assertAlmostEqual(points[2, 0], (self.start + timedelta(seconds=2)).timestamp(), places=2)
+    
+    def test_discard_player(self):
+        """Test that a discarded player's buffered points are never written"""
+        self.append(2)
+        self.store.discard_player(self.player.id)
+        self.assertEqual(self.store.flush(), 0)
+        self.assertEqual(self.store.read(player_ids=[self.player.id]), {})
+
+
+class MovementFilterTest(SimpleTestCase):
+    """Test GPS dead-band and smoothing ahead of the position pipeline"""
+    
+    def setUp(self):
+        self.metrics = Metrics()
+        self.filter = MovementFilter(metrics=self.metrics, smoothing=False)
+    
+    def offset(self, meters):
+        return 37.7749 + meters / geo.METERS_PER_DEGREE_LAT
+    
+    def test_jitter_inside_accuracy_is_suppressed(self):
+        """Test that fixes within the reported accuracy are dropped and counted"""
+        self.assertIsNotNone(self.filter.filter('ABC123', 'p1', 37.7749, -122.4194, 10))
+        for meters in (3, -4, 6, 2):
+            self.assertIsNone(self.filter.filter('ABC123', 'p1', self.offset(meters), -122.4194, 10))
+        self.assertIsNotNone(self.filter.filter('ABC123', 'p1', self.offset(15), -122.4194, 10))
+        
+        self.assertEqual(self.metrics.counter('movement_received', game='ABC123'), 6)
+        self.assertEqual(self.metrics.counter('movement_suppressed', game='ABC123'), 4)
+        self.assertEqual(self.metrics.counter('movement_accepted', game='ABC123'), 2)
+    
+    def test_deadband_is_clamped(self):
+        """Test that a poor accuracy does not freeze a walking player"""
+        self.filter.filter('ABC123', 'p1', 37.7749, -122.4194, 200)
+        self.assertIsNotNone(self.filter.filter('ABC123', 'p1', self.offset(30), -122.4194, 200))
+        # Without an accuracy the minimum distance applies
+        self.assertIsNotNone(self.filter.filter('ABC123', 'p1', self.offset(33), -122.4194))
+    
+    def test_smoothing_damps_noise(self):
+        """Test that the Kalman estimate stays closer to the truth than raw fixes"""
+        smoothing = MovementFilter(metrics=self.metrics, smoothing=True)
+        noise = [8, -7, 9, -8, 7, -9, 8, -6]
+        estimates = []
+        for i, meters in enumerate(noise):
+            smoothing.filter('ABC123', 'p1', self.offset(meters), -122.4194, 10, now=i)
+            estimates.append(smoothing._tracks[('ABC123', 'p1')].lat)
+        error = abs(estimates[-1] - 37.7749) * geo.METERS_PER_DEGREE_LAT
+        self.assertLess(error, 4)
+
+
+class DatabaseThreadPoolTest(SimpleTestCase):
+    """Test the bounded pool consumer database work runs on"""
+    
+    @override_settings(CONSUMER_DB_THREADS=4)
+    async def test_slow_calls_do_not_serialize(self):
+        """Test that one slow call does not hold up the others"""
+        threads = set()
+        
+        def slow_query():
+            threads.add(threading.get_ident())
+            time.sleep(0.2)
+        
+        start = time.monotonic()
+        await asyncio.gather(*(db_sync_to_async(slow_query)() for _ in range(4)))
+        self.assertLess(time.monotonic() - start, 0.6)
+        self.assertEqual(len(threads), 4)
+    
+    def test_pool_follows_setting(self):
+        """Test that the pool is sized from CONSUMER_DB_THREADS"""
+        with self.settings(CONSUMER_DB_THREADS=3):
+            self.assertEqual(db_pool.executor._max_workers, 3)
+        with self.settings(CONSUMER_DB_THREADS=5):
+            self.assertEqual(db_pool.executor._max_workers, 5)
+
+
+class CodecTest(SimpleTestCase):
+    """Test WebSocket subprotocol negotiation and encodings"""
+    
+    def test_negotiate(self):
+        """Test that the first supported subprotocol wins and JSON is the default"""
+        self.assertEqual(negotiate(['v2.binary', 'msgpack'])[1], 'msgpack')
+        self.assertEqual(negotiate(['json', 'msgpack'])[1], 'json')
+        codec, subprotocol = negotiate([])
+        self.assertIsInstance(codec, JsonCodec)
+        self.assertIsNone(subprotocol)
+    
+    def test_msgpack_round_trip(self):
+        """Test that msgpack frames carry the same messages as JSON"""
+        codec = MsgpackCodec()
+        message = {'type': 'position_update', 'lat': 37.7749, 'lng': -122.4194}
+        frame = codec.encode(message)['bytes_data']
+        self.assertEqual(codec.decode(bytes_data=frame), message)
+        self.assertEqual(codec.from_json(json.dumps(message)), {'bytes_data': frame})
+        # Text frames are still understood
+        self.assertEqual(codec.decode(text_data=json.dumps(message)), message)
+
+
+class DeltaEncodingTest(SimpleTestCase):
+    """Test quantized delta position frames"""
+    
+    def setUp(self):
+        self.encoder = PositionEncoder(keyframe_interval=10, history=4)
+        self.decoder = PositionDecoder()
+    
+    def send(self, positions):
+        text = self.encoder.encode(positions)
+        return text, (self.decoder.decode(text) if text is not None else None)
+    
+    def test_deltas_from_acknowledged_frame(self):
+        """Test that frames after an ack carry small deltas and decode exactly"""
+        text, state = self.send({'a': (37.7749, -122.4194), 'b': (37.7760, -122.4180)})
+        self.assertEqual(json.loads(text)['t'], 'pk')
+        self.encoder.ack(self.decoder.ack(json.loads(text)['s'])['seq'])
+        
+        text, state = self.send({'a': (37.774905, -122.419402)})
+        frame = json.loads(text)
+        self.assertEqual(frame['d'], [[0, 5, -2]])
+        self.assertNotIn('i', frame)
+        self.assertAlmostEqual(state['a'][0], 37.774905)
+        self.assertEqual(state['b'], (37.776, -122.418))
+    
+    def test_dropped_frames_do_not_corrupt_state(self):
+        """Test that deltas stay relative to the last ack when frames are lost"""
+        text, _ = self.send({'a': (37.7749, -122.4194)})
+        self.encoder.ack(json.loads(text)['s'])
+        self.decoder.ack(json.loads(text)['s'])
+        
+        # Lost on the way: never decoded, never acknowledged
+        self.encoder.encode({'a': (37.7750, -122.4194), 'c': (37.7700, -122.4100)})
+        text, state = self.send({'a': (37.7751, -122.4194)})
+        
+        self.assertAlmostEqual(state['a'][0], 37.7751)
+        self.assertEqual(state['c'], (37.77, -122.41))
+        self.assertIn('i', json.loads(text))
+    
+    def test_keyframes(self):
+        """Test keyframes after a resync and when acks fall behind"""
+        self.send({'a': (37.7749, -122.4194)})
+        for i in range(3):
+            text, _ = self.send({'a': (37.7749 + (i + 1) * 1e-5, -122.4194)})
+            self.assertEqual(json.loads(text)['t'], 'pd')
+        # Four unacknowledged frames in flight: start over
+        text, _ = self.send({'a': (37.7760, -122.4194)})
+        self.assertEqual(json.loads(text)['t'], 'pk')
+        
+        self.encoder.resync()
+        text, state = self.send(None)
+        self.assertEqual(json.loads(text)['t'], 'pk')
+        self.assertEqual(json.loads(text)['i'], {'0': 'a'})
+        self.assertAlmostEqual(state['a'][0], 37.7760)
+    
+    def test_smaller_than_json(self):
+        """Test that a steady-state delta frame is a fraction of the JSON snapshot"""
+        players = {f'{i:032x}': (37.7749 + i * 1e-4, -122.4194) for i in range(30)}
+        self.encoder.ack(json.loads(self.encoder.encode(players))['s'])
+        moved = {player_id: (lat + 2e-5, lng) for player_id, (lat, lng) in players.items()}
+        
+        compact = self.encoder.encode(moved)
+        snapshot = render_frame(keyed_frame_message('positions_snapshot', 'positions', {
+            player_id: {'player_id': player_id, 'position': {'lat': lat, 'lng': lng}}
+            for player_id, (lat, lng) in moved.items()
+        }))
+        self.assertLess(len(compact) * 5, len(snapshot))
+
+
+class PositionTickerTest(SimpleTestCase):
+    """Test batched position snapshots"""
+    
+    async def test_tick_sends_only_moved_players(self):
+        """Test that one snapshot carries every mover and nobody else"""
+        store = PositionStore(flush_interval=60)
+        layer = InMemoryChannelLayer()
+        channel = await layer.new_channel()
+        await layer.group_add('game_TICK01', channel)
+        ticker = PositionTicker('TICK01', layer, store=store)
+        
+        store.record('TICK01', 'a', 37.7750, -122.4195)
+        store.record('TICK01', 'a', 37.7751, -122.4196)
+        store.record('TICK01', 'b', 37.7760, -122.4190)
+        
+        self.assertEqual(await ticker.tick(), 2)
+        frame = json.loads(render_frame(await layer.receive(channel)))
+        self.assertEqual(frame['type'], 'positions_snapshot')
+        positions = {p['player_id']: p['position'] for p in frame['positions']}
+        self.assertEqual(positions['a'], {'lat': 37.7751, 'lng': -122.4196})
+        
+        # Nobody moved since, so the next tick sends nothing
+        self.assertEqual(await ticker.tick(), 0)
+        store.record('TICK01', 'b', 37.7761, -122.4190)
+        await ticker.tick()
+        frame = json.loads(render_frame(await layer.receive(channel)))
+        self.assertEqual([p['player_id'] for p in frame['positions']], ['b'])
+        store.close(flush=False)
+    
+    async def test_tick_split_by_interest_cell(self):
+        """Test that movers only reach their own cell's group and unlocated connections"""
+        store = PositionStore(flush_interval=60)
+        layer = InMemoryChannelLayer()
+        near, far, unlocated = [await layer.new_channel() for _ in range(3)]
+        await layer.group_add('game_CELL01_cell_0_0', near)
+        await layer.group_add('game_CELL01_cell_0_4', far)
+        await layer.group_add('game_CELL01_unlocated', unlocated)
+        interest_grids._grids['CELL01'] = InterestGrid(37.7749, -122.4194, 250)
+        ticker = PositionTicker('CELL01', layer, store=store)
+        
+        store.record('CELL01', 'a', 37.7750, -122.4193)
+        store.record('CELL01', 'b', 37.7749 + 0.0095, -122.4193)
+        self.assertEqual(await ticker.tick(), 2)
+        
+        frame = json.loads(render_frame(await layer.receive(near)))
+        self.assertEqual([p['player_id'] for p in frame['positions']], ['a'])
+        frame = json.loads(render_frame(await layer.receive(far)))
+        self.assertEqual([p['player_id'] for p in frame['positions']], ['b'])
+        frame = json.loads(render_frame(await layer.receive(unlocated)))
+        self.assertEqual(len(frame['positions']), 2)
+        interest_grids.discard('CELL01')
+        store.close(flush=False)
+    
+    @override_settings(POSITION_TICK_RATE_MAX=5, POSITION_TICK_RATE_MIN=2,
+                       POSITION_TICK_FULL_RATE_PLAYERS=10)
+    def test_tick_rate_adapts_to_player_count(self):
+        """Test that larger games tick more slowly"""
+        ticker = PositionTicker('RATE01', None, store=PositionStore(flush_interval=60))
+        ticker.subscribers = 4
+        self.assertEqual(ticker.tick_rate, 5)
+        ticker.subscribers = 20
+        self.assertEqual(ticker.tick_rate, 2.5)
+        ticker.subscribers = 100
+        self.assertEqual(ticker.tick_rate, 2)
+
+
+class OutboundQueueTest(SimpleTestCase):
+    """Test the per-connection outbound queue"""
+    
+    def snapshot(self, **positions):
+        return keyed_frame_message('positions_snapshot', 'positions', {
+            player_id: {'player_id': player_id, 'position': {'lat': lat, 'lng': 0.0}}
+            for player_id, lat in positions.items()
+        }, coordinates={player_id: [lat, 0.0] for player_id, lat in positions.items()})
+    
+    async def test_positions_coalesced_in_place(self):
+        """Test that a newer position replaces the queued one instead of queueing behind it"""
+        queue = OutboundQueue('OUTQ01', maxsize=8)
+        queue.put('{"type": "player_joined"}', 'player_joined')
+        queue.put_positions(self.snapshot(a=1.0, b=2.0), player_id='me')
+        queue.put('{"type": "chat_message"}', 'chat_message')
+        queue.put_positions(self.snapshot(a=1.5, me=9.0), player_id='me')
+        
+        self.assertEqual(len(queue), 3)
+        self.assertEqual(metrics.counter('outbound_coalesced', game='OUTQ01'), 1)
+        self.assertEqual(metrics.snapshot(game='OUTQ01')['gauges'],
+                         {'outbound_queue_depth{game=OUTQ01}': 3})
+        self.assertEqual(await queue.get(), '{"type": "player_joined"}')
+        self.assertIs(await queue.get(), POSITIONS)
+        text, coordinates = queue.take_positions()
+        positions = {p['player_id']: p['position']['lat'] for p in json.loads(text)['positions']}
+        self.assertEqual(positions, {'a': 1.5, 'b': 2.0})
+        self.assertEqual(coordinates, {'a': [1.5, 0.0], 'b': [2.0, 0.0]})
+        self.assertEqual(await queue.get(), '{"type": "chat_message"}')
+        self.assertEqual(metrics.snapshot(game='OUTQ01')['gauges'],
+                         {'outbound_queue_depth{game=OUTQ01}': 0})
+    
+    async def test_bounded_but_critical_never_dropped(self):
+        """Test that a full queue sheds the oldest ordinary frame, never a critical one"""
+        queue = OutboundQueue('OUTQ02', maxsize=2)
+        queue.put('killed', 'player_killed')
+        queue.put('chat 1', 'chat_message')
+        queue.put('chat 2', 'chat_message')
+        self.assertEqual(metrics.counter('outbound_dropped', game='OUTQ02', frame='chat_message'), 1)
+        
+        queue.put('ended', 'game_ended')
+        self.assertFalse(queue.put('chat 3', 'chat_message'))
+        self.assertEqual([await queue.get() for _ in range(len(queue))], ['killed', 'ended'])
+        self.assertEqual(metrics.counter('outbound_dropped', game='OUTQ02', frame='chat_message'), 3)
+
+
+@override_settings(LOAD_SHED_DOWNSAMPLE_LAG=0.1, LOAD_SHED_DROP_LAG=0.5,
+                   LOAD_SHED_DOWNSAMPLE_FACTOR=2)
+class LoadSheddingTest(SimpleTestCase):
+    """Test priority classes and event loop lag shedding"""
+    
+    def setUp(self):
+        self.addCleanup(setattr, load_monitor, 'lag', 0.0)
+    
+    def test_priority_classes(self):
+        """Test that game state outranks chat, which outranks movement"""
+        self.assertEqual(priority_of('game_ended'), HIGH)
+        self.assertEqual(priority_of('player_killed'), HIGH)
+        self.assertEqual(priority_of('task_launched'), HIGH)
+        self.assertEqual(priority_of('chat_message'), NORMAL)
+        self.assertEqual(priority_of('positions_snapshot'), LOW)
+        self.assertEqual(priority_of('radar_response'), LOW)
+    
+    def test_only_sustained_lag_raises_the_level(self):
+        """Test that one slow wakeup does not trigger shedding"""
+        monitor = LoadMonitor(smoothing=0.3)
+        monitor.sample(0.3)
+        self.assertEqual(monitor.level, NORMAL_LOAD)
+        for _ in range(5):
+            monitor.sample(0.3)
+        self.assertEqual(monitor.level, DOWNSAMPLE)
+        for _ in range(10):
+            monitor.sample(1.0)
+        self.assertEqual(monitor.level, SHED)
+        for _ in range(20):
+            monitor.sample(0.0)
+        self.assertEqual(monitor.level, NORMAL_LOAD)
+    
+    @override_settings(POSITION_TICK_RATE_MAX=5, POSITION_TICK_FULL_RATE_PLAYERS=10)
+    def test_ticks_downsampled_under_lag(self):
+        """Test that movement ticks slow down once the loop lags"""
+        ticker = PositionTicker('LOAD01', None, store=PositionStore(flush_interval=60))
+        self.assertEqual(ticker.tick_rate, 5)
+        load_monitor.lag = 0.2
+        self.assertEqual(ticker.tick_rate, 2.5)
+    
+    async def test_queue_sheds_low_priority_first(self):
+        """Test that shedding drops movement but lets game state through, first"""
+        queue = OutboundQueue('LOAD02', maxsize=8)
+        queue.put('chat', 'chat_message')
+        load_monitor.lag = 1.0
+        queue.put_positions(keyed_frame_message('positions_snapshot', 'positions', {
+            'a': {'player_id': 'a', 'position': {'lat': 1.0, 'lng': 2.0}},
+        }))
+        self.assertFalse(queue.put('radar', 'radar_response'))
+        queue.put('ended', 'game_ended')
+        
+        self.assertEqual(len(queue), 2)
+        self.assertEqual(await queue.get(), 'ended')
+        self.assertEqual(await queue.get(), 'chat')
+        self.assertEqual(
+            metrics.counter('load_shed', action='frame_dropped', priority=LOW, game='LOAD02'), 2
+        )
+
+
+class InterestGridTest(SimpleTestCase):
+    """Test interest cells for position fanout"""
+    
+    @override_settings(INTEREST_CELLS_PER_RADIUS=4, INTEREST_MIN_CELL_SIZE=100)
+    def test_cell_size_from_map_radius(self):
+        """Test that cells scale with the map, down to a minimum"""
+        self.assertEqual(cell_size_for(1000), 250)
+        self.assertEqual(cell_size_for(200), 100)
+        with self.settings(INTEREST_CELLS_PER_RADIUS=0):
+            self.assertIsNone(cell_size_for(1000))
+    
+    def test_neighbourhood(self):
+        """Test that a connection subscribes to its cell and the eight around it"""
+        cells = InterestGrid.neighbourhood((2, -1))
+        self.assertEqual(len(cells), 9)
+        self.assertIn((1, -2), cells)
+        self.assertIn((3, 0), cells)
+        self.assertEqual(InterestGrid.neighbourhood(None), set())
+    
+    @override_settings(INTEREST_HYSTERESIS=0.1)
+    def test_locate_has_hysteresis(self):
+        """Test that a subscriber only changes cell once clearly past the boundary"""
+        grid = InterestGrid(37.7749, -122.4194, 100)
+        step = 1 / geo.METERS_PER_DEGREE_LAT
+        self.assertEqual(grid.cell(37.7749 + 50 * step, -122.4193), (0, 0))
+        # 5 m into the next cell: still within the margin
+        self.assertEqual(grid.cell(37.7749 + 105 * step, -122.4193), (0, 1))
+        self.assertEqual(grid.locate(37.7749 + 105 * step, -122.4193, (0, 0)), (0, 0))
+        self.assertEqual(grid.locate(37.7749 + 115 * step, -122.4193, (0, 0)), (0, 1))
+        self.assertEqual(grid.locate(37.7749 + 105 * step, -122.4193), (0, 1))
+
+
+class BroadcastFrameTest(SimpleTestCase):
+    """Test serialize-once broadcast frames"""
+    
+    def test_frame_is_encoded_once(self):
+        """Test that the frame text is built at the send site"""
+        message = frame_message({'type': 'player_left', 'player_id': 'abc'}, visibility='public')
+        self.assertEqual(json.loads(message['text']), {'type': 'player_left', 'player_id': 'abc'})
+        self.assertEqual(render_frame(message, 'anyone'), message['text'])
+        # Routing metadata is not part of the frame
+        self.assertNotIn('visibility', json.loads(message['text']))
+    
+    def test_keyed_frame_drops_own_entry(self):
+        """Test that a recipient's own entry is left out without re-encoding"""
+        message = keyed_frame_message('positions_snapshot', 'positions', {
+            'a': {'player_id': 'a', 'position': {'lat': 1.0, 'lng': 2.0}},
+            'b': {'player_id': 'b', 'position': {'lat': 3.0, 'lng': 4.0}},
+        })
+        frame = json.loads(render_frame(message, 'a'))
+        self.assertEqual(frame['type'], 'positions_snapshot')
+        self.assertEqual([p['player_id'] for p in frame['positions']], ['b'])
+        self.assertEqual(len(json.loads(render_frame(message, None))['positions']), 2)
+    
+    def test_keyed_frame_skipped_when_only_own_entry(self):
+        """Test that a snapshot with only the recipient's own move is not sent"""
+        message = keyed_frame_message('positions_snapshot', 'positions', {
+            'a': {'player_id': 'a', 'position': {'lat': 1.0, 'lng': 2.0}},
+        })
+        self.assertIsNone(render_frame(message, 'a'))
+
+
+@override_settings(
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    POSITION_FLUSH_INTERVAL=0,
+    PRESENCE_SWEEP_INTERVAL=0,
+    TRAIL_FLUSH_INTERVAL=0,
+    EVENT_FLUSH_INTERVAL=0,
+    # SQLite's shared in-memory test database locks whole tables, so
+    # concurrent pool threads would fail writes with "table is locked"
+    CONSUMER_DB_THREADS=1
+)
+class GameConsumerBroadcastTest(TransactionTestCase):
+    """Test group broadcasts through GameConsumer"""
+    
+    async def connect(self, game_code):
+        communicator = WebsocketCommunicator(
+            URLRouter(websocket_urlpatterns),
+            f"/ws/game/{game_code}/"
+        )
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+    
+    async def test_frame_forwarded_unchanged(self):
+        """Test that every subscriber receives the pre-encoded text as-is"""
+        comm1 = await self.connect('FAN001')
+        comm2 = await self.connect('FAN001')
+        
+        payload = {'type': 'item_used', 'item_type': 'emp', 'player_id': 'p1', 'effects': {}}
+        await group_send_frame(get_channel_layer(), 'game_FAN001', payload)
+        
+        expected = json.dumps(payload)
+        self.assertEqual(await comm1.receive_from(), expected)
+        self.assertEqual(await comm2.receive_from(), expected)
+        
+        await comm1.disconnect()
+        await comm2.disconnect()
+    
+    async def authenticate(self, communicator, player):
+        await communicator.send_json_to({
+            'type': 'authenticate',
+            'player_id': str(player.id)
+        })
+    
+    async def drain(self, *communicators):
+        for communicator in communicators:
+            while not await communicator.receive_nothing(timeout=0.2):
+                await communicator.receive_from()
+    
+    async def create_team_game(self):
+        create_player = database_sync_to_async(Player.objects.create)
+        host = await create_player(name="Host")
+        game = await database_sync_to_async(Game.objects.create)(
+            host=host,
+            home_base_lat=37.7749,
+            home_base_lng=-122.4194,
+            status='active'
+        )
+        red1 = await create_player(name="Red 1", game=game, team='red')
+        red2 = await create_player(name="Red 2", game=game, team='red')
+        blue = await create_player(name="Blue 1", game=game, team='blue')
+        return game, red1, red2, blue
+    
+    async def test_team_chat_routed_by_group(self):
+        """Test that team chat only reaches the sender's team"""
+        game, red1, red2, blue = await self.create_team_game()
+        comms = [await self.connect(game.code) for _ in range(3)]
+        for communicator, player in zip(comms, [red1, red2, blue]):
+            await self.authenticate(communicator, player)
+        await self.drain(*comms)
+        
+        await comms[0].send_json_to({
+            'type': 'chat',
+            'message': 'Plant it at the fountain',
+            'visibility': 'team'
+        })
+        
+        frame = await comms[1].receive_json_from()
+        self.assertEqual(frame['type'], 'chat_message')
+        self.assertEqual(frame['message'], 'Plant it at the fountain')
+        self.assertTrue(await comms[2].receive_nothing(timeout=0.2))
+        
+        for communicator in comms:
+            await communicator.disconnect()
+    
+    async def test_private_chat_routed_to_recipient(self):
+        """Test that private chat only reaches the listed recipients"""
+        game, red1, red2, blue = await self.create_team_game()
+        comms = [await self.connect(game.code) for _ in range(3)]
+        for communicator, player in zip(comms, [red1, red2, blue]):
+            await self.authenticate(communicator, player)
+        await self.drain(*comms)
+        
+        await comms[2].send_json_to({
+            'type': 'chat',
+            'message': 'Meet me at base',
+            'visibility': 'private',
+            'recipient_ids': [str(red2.id)]
+        })
+        
+        frame = await comms[1].receive_json_from()
+        self.assertEqual(frame['message'], 'Meet me at base')
+        self.assertTrue(await comms[0].receive_nothing(timeout=0.2))
+        
+        for communicator in comms:
+            await communicator.disconnect()
+    
+    async def test_private_chat_stays_in_game(self):
+        """Test that private chat does not reach players of other games"""
+        game, red1, red2, blue = await self.create_team_game()
+        other_game, outsider, _, _ = await self.create_team_game()
+        comms = [await self.connect(game.code), await self.connect(other_game.code)]
+        await self.authenticate(comms[0], blue)
+        await self.authenticate(comms[1], outsider)
+        await self.drain(*comms)
+        
+        await comms[0].send_json_to({
+            'type': 'chat',
+            'message': 'Meet me at base',
+            'visibility': 'private',
+            'recipient_ids': [str(outsider.id)]
+        })
+        
+        self.assertTrue(await comms[1].receive_nothing(timeout=0.2))
+        
+        for communicator in comms:
+            await communicator.disconnect()
+    
+    async def test_team_assignment_moves_connection(self):
+        """Test that a team change in the player context moves the connection"""
+        game, red1, red2, blue = await self.create_team_game()
+        comms = [await self.connect(game.code) for _ in range(2)]
+        await self.authenticate(comms[0], red1)
+        await self.authenticate(comms[1], blue)
+        await self.drain(*comms)
+        
+        await get_channel_layer().group_send(
+            player_group(blue.id),
+            player_context_message(team='red')
+        )
+        # Let the blue connection process the reassignment
+        self.assertTrue(await comms[1].receive_nothing(timeout=0.1))
+        await comms[0].send_json_to({
+            'type': 'chat',
+            'message': 'Welcome aboard',
+            'visibility': 'team'
+        })
+        
+        frame = await comms[1].receive_json_from()
+        self.assertEqual(frame['message'], 'Welcome aboard')
+        
+        for communicator in comms:
+            await communicator.disconnect()
+    
+    async def test_unknown_player_rejected(self):
+        """Test that authenticating as a player outside the game fails"""
+        game, red1, red2, blue = await self.create_team_game()
+        communicator = await self.connect('OTHER1')
+        await self.authenticate(communicator, red1)
+        
+        frame = await communicator.receive_json_from()
+        self.assertEqual(frame, {'type': 'error', 'message': 'Unknown player'})
+        await communicator.disconnect()
+    
+    async def test_msgpack_subprotocol(self):
+        """Test that a msgpack client gets binary frames for the same messages"""
+        game, red1, red2, blue = await self.create_team_game()
+        communicator = WebsocketCommunicator(
+            URLRouter(websocket_urlpatterns),
+            f"/ws/game/{game.code}/",
+            subprotocols=['msgpack', 'json']
+        )
+        connected, subprotocol = await communicator.connect()
+        self.assertTrue(connected)
+        self.assertEqual(subprotocol, 'msgpack')
+        
+        await communicator.send_to(bytes_data=msgpack.packb({
+            'type': 'authenticate', 'player_id': str(red2.id)
+        }))
+        await self.drain(communicator)
+        payload = {'type': 'item_used', 'item_type': 'emp', 'player_id': 'p1', 'effects': {}}
+        await group_send_frame(get_channel_layer(), f'game_{game.code}', payload)
+        self.assertEqual(msgpack.unpackb(await communicator.receive_from()), payload)
+        
+        await communicator.send_to(bytes_data=msgpack.packb({'type': 'authenticate'}))
+        error = msgpack.unpackb(await communicator.receive_from())
+        self.assertEqual(error, {'type': 'error', 'message': 'Unknown player'})
+        await communicator.disconnect()
+    
+    async def test_delta_position_frames(self):
+        """Test that an opted-in connection gets compact frames it can decode"""
+        game, red1, red2, blue = await self.create_team_game()
+        position_store.record(game.code, red2.id, 37.7750, -122.4195)
+        communicator = await self.connect(game.code)
+        await self.authenticate(communicator, red1)
+        await self.drain(communicator)
+        decoder = PositionDecoder()
+        
+        await communicator.send_json_to({'type': 'position_encoding', 'encoding': 'delta'})
+        keyframe = await communicator.receive_from()
+        self.assertEqual(decoder.decode(keyframe), {str(red2.id): (37.7750, -122.4195)})
+        await communicator.send_json_to(decoder.ack(json.loads(keyframe)['s']))
+        
+        position_store.record(game.code, red2.id, 37.7751, -122.4195)
+        position_store.record(game.code, blue.id, 37.7760, -122.4190)
+        await PositionTicker(game.code, get_channel_layer()).tick()
+        frame = await communicator.receive_from()
+        
+        self.assertIn('"d":[[0,100,0]]', frame)
+        positions = decoder.decode(frame)
+        self.assertAlmostEqual(positions[str(red2.id)][0], 37.7751)
+        self.assertAlmostEqual(positions[str(blue.id)][1], -122.4190)
+        
+        position_store.forget(game.code, red2.id)
+        position_store.forget(game.code, blue.id)
+        await communicator.disconnect()
+    
+    async def test_movement_fans_out_by_interest_cell(self):
+        """Test that players only hear about movement in the cells around them"""
+        game, red1, red2, blue = await self.create_team_game()
+        comms = [await self.connect(game.code) for _ in range(3)]
+        for communicator, player in zip(comms, [red1, red2, blue]):
+            await self.authenticate(communicator, player)
+        await self.drain(*comms)
+        
+        # red1 at home base, red2 100 m away, blue about 1 km north
+        for communicator, lat in zip(comms, [37.7749, 37.7758, 37.7839]):
+            await communicator.send_json_to({
+                'type': 'position_update', 'lat': lat, 'lng': -122.4194, 'accuracy': 5
+            })
+        await self.drain(*comms)
+        
+        position_store.record(game.code, red2.id, 37.7760, -122.4194)
+        position_store.record(game.code, blue.id, 37.7841, -122.4194)
+        await PositionTicker(game.code, get_channel_layer()).tick()
+        frame = await comms[0].receive_json_from()
+        self.assertEqual([p['player_id'] for p in frame['positions']], [str(red2.id)])
+        self.assertTrue(await comms[0].receive_nothing(timeout=0.2))
+        self.assertTrue(await comms[2].receive_nothing(timeout=0.1))
+        
+        # Walking north brings red1 within a cell of blue, who is shown straight away
+        await comms[0].send_json_to({
+            'type': 'position_update', 'lat': 37.7820, 'lng': -122.4194, 'accuracy': 5
+        })
+        frame = await comms[0].receive_json_from()
+        self.assertIn(str(blue.id), [p['player_id'] for p in frame['positions']])
+        
+        for player in (red1, red2, blue):
+            position_store.forget(game.code, player.id)
+        for communicator in comms:
+            await communicator.disconnect()
+    
+    async def test_disconnect_forgets_position(self):
+        """Test that a player who disconnects drops out of position snapshots"""
+        game, red1, red2, blue = await self.create_team_game()
+        communicator = await self.connect(game.code)
+        await self.authenticate(communicator, red1)
+        await communicator.send_json_to({
+            'type': 'position_update', 'lat': 37.7750, 'lng': -122.4195, 'accuracy': 5
+        })
+        await self.drain(communicator)
+        self.assertIsNotNone(position_store.get(game.code, red1.id))
+        
+        await communicator.disconnect()
+        
+        self.assertIsNone(position_store.get(game.code, red1.id))
+        state = await database_sync_to_async(PlayerState.objects.get)(player=red1)
+        self.assertEqual(state.position_lat, 37.7750)
+    
+    async def test_mines_trigger_after_start_from_lobby(self):
+        """Test that a connection authenticated in the lobby still sets off mines once the game starts"""
+        game, red1, red2, blue = await self.create_team_game()
+        await database_sync_to_async(Game.objects.filter(id=game.id).update)(status='lobby')
+        game.status = 'lobby'
+        communicator = await self.connect(game.code)
+        await self.authenticate(communicator, red1)
+        await self.drain(communicator)
+        mine = await database_sync_to_async(DeployedItem.objects.create)(
+            game=game, item_type='land_mine', position_lat=37.7760,
+            position_lng=-122.4194, deployed_by=blue
+        )
+        
+        await database_sync_to_async(begin_game)(game)
+        await self.drain(communicator)
+        # Starting changes neither the map radius nor the home base
+        self.assertIsNotNone(interest_grids.peek(game.code))
+        await communicator.send_json_to({
+            'type': 'position_update', 'lat': 37.7760, 'lng': -122.4194, 'accuracy': 5
+        })
+        
+        types = []
+        while not await communicator.receive_nothing(timeout=0.3):
+            types.append((await communicator.receive_json_from())['type'])
+        self.assertIn('explosion', types)
+        self.assertIn('player_killed', types)
+        await database_sync_to_async(mine.refresh_from_db)()
+        self.assertFalse(mine.active)
+        await database_sync_to_async(red1.refresh_from_db)()
+        self.assertFalse(red1.is_alive)
+        
+        spatial_indexes.discard(game.code)
+        await communicator.disconnect()
+    
+    async def test_steady_state_makes_no_player_lookups(self):
+        """Test that chat and movement use the cached connection context"""
+        game, red1, red2, blue = await self.create_team_game()
+        communicator = await self.connect(game.code)
+        await self.authenticate(communicator, red1)
+        await self.drain(communicator)
+        
+        # Consumer DB work runs on the pool; with one thread it is always the same connection
+        queries = CaptureQueriesContext(await db_sync_to_async(lambda: connections['default'])())
+        await db_sync_to_async(queries.__enter__)()
+        await communicator.send_json_to({
+            'type': 'position_update',
+            'lat': 37.7750,
+            'lng': -122.4195
+        })
+        await communicator.send_json_to({
+            'type': 'chat',
+            'message': 'Moving out',
+            'visibility': 'team'
+        })
+        frame = await communicator.receive_json_from()
+        await db_sync_to_async(queries.__exit__)(None, None, None)
+        
+        self.assertEqual(frame['player_name'], 'Red 1')
+        player_selects = [
+            query['sql'] for query in queries.captured_queries
+            if query['sql'].startswith('SELECT') and 'core_player' in query['sql']
+        ]
+        self.assertEqual(player_selects, [])
+        # The chat event itself is still written
+        self.assertTrue(any(
+            query['sql'].startswith('INSERT') for query in queries.captured_queries
+        ))
+        await communicator.disconnect()
+
+
+class SpatialIndexTest(SimpleTestCase):
+    """Test the per-game spatial grid"""
+    
+    def setUp(self):
+        self.index = SpatialIndex(37.7749, -122.4194, cell_size=25)
+        # Roughly 11 m per 0.0001 degrees of latitude
+        self.index.insert('item:near', 'item', 37.77500, -122.4194, radius=10)
+        self.index.insert('item:mid', 'item', 37.77530, -122.4194, radius=10)
+        self.index.insert('item:far', 'item', 37.78490, -122.4194, radius=10)
+        self.index.insert('zone:emp', 'zone', 37.77600, -122.4194, radius=200)
+    
+    def test_query_radius(self):
+        """Test that radius queries return nearby entries, nearest first"""
+        results = self.index.query_radius(37.7749, -122.4194, 50, kinds=('item',))
+        self.assertEqual([entry.key for entry, _ in results], ['item:near', 'item:mid'])
+        self.assertAlmostEqual(results[0][1], 11.1, delta=0.2)
+    
+    def test_point_inside_entry_radius(self):
+        """Test that point queries match entries whose own radius covers the point"""
+        results = self.index.query_radius(37.7749, -122.4194, 0, within_entry_radius=True)
+        # Within the 200 m EMP zone, but 11 m from an item with a 10 m radius
+        self.assertEqual([entry.key for entry, _ in results], ['zone:emp'])
+    
+    def test_nearest(self):
+        """Test k-nearest queries"""
+        results = self.index.nearest(37.7749, -122.4194, k=2, kinds=('item',))
+        self.assertEqual([entry.key for entry, _ in results], ['item:near', 'item:mid'])
+        results = self.index.nearest(37.7849, -122.4194, k=1)
+        self.assertEqual(results[0][0].key, 'item:far')
+    
+    def test_move_and_remove(self):
+        """Test that moves and removals update queries incrementally"""
+        self.index.insert('player:1', 'player', 37.7749, -122.4194)
+        self.index.move('player:1', 37.7849, -122.4194)
+        near_far = self.index.query_radius(37.7849, -122.4194, 5, kinds=('player',))
+        self.assertEqual([entry.key for entry, _ in near_far], ['player:1'])
+        self.assertEqual(self.index.query_radius(37.7749, -122.4194, 5, kinds=('player',)), [])
+        
+        self.index.remove('item:near')
+        results = self.index.nearest(37.7749, -122.4194, k=1, kinds=('item',))
+        self.assertEqual(results[0][0].key, 'item:mid')
+
+
+class GeoTest(SimpleTestCase):
+    """Test vectorized geodesic helpers"""
+    
+    def test_haversine_known_distance(self):
+        """Test great-circle distance between San Francisco and Los Angeles"""
+        distance = geo.haversine(37.7749, -122.4194, 34.0522, -118.2437)
+        self.assertAlmostEqual(float(distance) / 1000, 559.1, delta=1)
+    
+    def test_equirectangular_matches_haversine_at_game_scale(self):
+        """Test that the fast approximation is sub-meter across a game map"""
+        exact = geo.haversine(37.7749, -122.4194, 37.7830, -122.4080)
+        approx = geo.equirectangular(37.7749, -122.4194, 37.7830, -122.4080)
+        self.assertLess(abs(float(exact) - float(approx)), 1)
+    
+    def test_longitude_is_scaled_by_latitude(self):
+        """Test that east-west distance shrinks away from the equator"""
+        equator = geo.haversine(0, 0, 0, 0.001)
+        san_francisco = geo.haversine(37.7749, 0, 37.7749, 0.001)
+        self.assertAlmostEqual(
+            float(san_francisco / equator), math.cos(math.radians(37.7749)), places=4
+        )
+    
+    def test_bearing_and_destination_round_trip(self):
+        """Test that destination_point inverts bearing and distance"""
+        lat, lng = geo.destination_point(37.7749, -122.4194, 90, 500)
+        self.assertAlmostEqual(float(geo.bearing(37.7749, -122.4194, lat, lng)), 90, places=2)
+        self.assertAlmostEqual(float(geo.haversine(37.7749, -122.4194, lat, lng)), 500, places=3)
+    
+    def test_distance_matrix(self):
+        """Test many-to-many distances in one call"""
+        players_lat = [37.7749, 37.7750, 37.7760]
+        players_lng = [-122.4194, -122.4195, -122.4190]
+        items_lat = [37.7749, 37.7800]
+        items_lng = [-122.4194, -122.4194]
+        matrix = geo.distance_matrix(players_lat, players_lng, items_lat, items_lng)
+        self.assertEqual(matrix.shape, (3, 2))
+        self.assertAlmostEqual(float(matrix[0, 0]), 0)
+        self.assertAlmostEqual(
+            float(matrix[2, 1]),
+            float(geo.haversine(37.7760, -122.4190, 37.7800, -122.4194))
+        )
+    
+    def test_random_point_stays_in_radius(self):
+        """Test that generated positions respect the map radius in meters"""
+        for _ in range(50):
+            lat, lng = geo.random_point(37.7749, -122.4194, 1000)
+            distance = float(geo.haversine(37.7749, -122.4194, lat, lng))
+            self.assertGreaterEqual(distance, 299)
+            self.assertLessEqual(distance, 1001)
+
+
+class TriggerEngineTest(SimpleTestCase):
+    """Test movement-triggered effects against the spatial index"""
+    
+    def setUp(self):
+        self.index = SpatialIndex(37.7749, -122.4194, cell_size=25)
+        self.engine = TriggerEngine()
+        # Roughly 11 m per 0.0001 degrees of latitude
+        self.deploy('mine', 'land_mine', 37.7760, 5)
+        self.deploy('sensor', 'motion_sensor', 37.7770, 15)
+        self.deploy('camera', 'camera', 37.7780, 20)
+    
+    def deploy(self, key, item_type, lat, radius, owner='owner'):
+        self.index.insert(
+            f'deployed:{key}', 'deployed', lat, -122.4194, radius=radius,
+            data={'item_type': item_type, 'deployed_by': owner, 'expires_at': None}
+        )
+    
+    def move(self, lat, player_id='runner', is_alive=True):
+        return self.engine.evaluate(
+            self.index, 'TRG001', player_id, lat, -122.4194, is_alive=is_alive
+        )
+    
+    def test_land_mine_explodes_once(self):
+        """Test that a mine fires on entry and is removed from the index"""
+        effects = self.move(37.7760)
+        self.assertEqual([effect.kind for effect in effects], ['explosion'])
+        self.assertEqual(effects[0].entity_id, 'mine')
+        self.assertEqual(effects[0].data['victims'], ['runner'])
+        self.assertNotIn('deployed:mine', self.index)
+        self.assertEqual(self.move(37.7760, player_id='other'), [])
+    
+    def test_sensors_are_edge_triggered(self):
+        """Test that staying inside a radius does not fire again"""
+        effects = self.move(37.7770)
+        self.assertEqual([(effect.kind, effect.item_type) for effect in effects],
+                         [('motion_detected', 'motion_sensor')])
+        self.assertEqual(effects[0].owner_id, 'owner')
+        self.assertEqual(self.move(37.77701), [])
+        self.assertEqual(self.move(37.7749), [])
+        self.assertEqual(len(self.move(37.7770)), 1)
+    
+    def test_owner_and_dead_players_ignored(self):
+        """Test that owners and dead players do not set off triggers"""
+        self.assertEqual(self.move(37.7780, player_id='owner'), [])
+        self.assertEqual(self.move(37.7760, is_alive=False), [])
+        self.assertIn('deployed:mine', self.index)
+    
+    def test_emp_field_suppresses_triggers(self):
+        """Test that items inside an EMP field stay inert and movers are told"""
+        self.index.insert(
+            'zone:emp', 'zone', 37.7760, -122.4194, radius=30,
+            data={'type': 'emp_field', 'expires_at': None}
+        )
+        effects = self.move(37.7760)
+        self.assertEqual([effect.kind for effect in effects], ['emp_status'])
+        self.assertTrue(effects[0].data['active'])
+        self.assertTrue(self.engine.in_emp('TRG001', 'runner'))
+        self.assertIn('deployed:mine', self.index)
+        
+        effects = self.move(37.7749)
+        self.assertEqual([effect.kind for effect in effects], ['emp_status'])
+        self.assertFalse(effects[0].data['active'])
+    
+    def test_evaluation_latency(self):
+        """Test that p99 evaluation cost stays low with many deployed items"""
+        import random
+        import time
+        rng = random.Random(8)
+        for i in range(2000):
+            self.deploy(f'bulk{i}', 'motion_sensor',
+                        37.7749 + rng.uniform(-0.009, 0.009), 15, owner='runner')
+        samples = []
+        for i in range(1000):
+            lat = 37.7749 + rng.uniform(-0.009, 0.009)
+            start = time.perf_counter()
+            self.move(lat, player_id='runner')
+            samples.append(time.perf_counter() - start)
+        samples.sort()
+        self.assertLess(samples[int(len(samples) * 0.99)], 0.005)
+
+
+@override_settings(
+    POSITION_FLUSH_INTERVAL=0,
+    TRAIL_FLUSH_INTERVAL=0,
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+)
+class TriggerPersistenceTest(APITestCase):
+    """Test that triggered effects are recorded"""
+    
+    def setUp(self):
+        self.client = APIClient()
+        self.host = Player.objects.create(name="Host")
+        self.game = Game.objects.create(
+            host=self.host,
+            home_base_lat=37.7749,
+            home_base_lng=-122.4194,
+            status='active'
+        )
+        self.host.game = self.game
+        self.host.save()
+        self.runner = Player.objects.create(name="Runner", game=self.game)
+        self.mine = DeployedItem.objects.create(
+            game=self.game,
+            item_type='land_mine',
+            position_lat=37.7760,
+            position_lng=-122.4194,
+            deployed_by=self.host
+        )
+        spatial_indexes.discard(self.game.code)
+    
+    def tearDown(self):
+        spatial_indexes.discard(self.game.code)
+    
+    def test_land_mine_kills_runner(self):
+        """Test that walking onto a mine kills the player and spends the mine"""
+        response = self.client.post(
+            f'/api/players/{self.runner.id}/update_position/',
+            {'lat': 37.7760, 'lng': -122.4194},
+            format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(response.data['is_alive'])
+        
+        self.mine.refresh_from_db()
+        self.assertFalse(self.mine.active)
+        self.runner.refresh_from_db()
+        self.assertFalse(self.runner.is_alive)
+        self.assertEqual(self.runner.death_position_lat, 37.7760)
+        self.assertTrue(Event.objects.filter(game=self.game, type='explosion').exists())
+        self.assertTrue(Event.objects.filter(
+            game=self.game, type='player_killed', player=self.runner
+        ).exists())
+
+
+class GameSchedulerTest(TestCase):
+    """Test the deadline heap and its batched handlers"""
+    
+    def setUp(self):
+        self.host = Player.objects.create(name="Host")
+        self.game = Game.objects.create(
+            host=self.host,
+            home_base_lat=37.7749,
+            home_base_lng=-122.4194,
+            status='active',
+            started_at=timezone.now() - timedelta(minutes=61),
+            game_duration=60
+        )
+        self.host.game = self.game
+        self.host.save()
+        self.scheduler = GameScheduler()
+        spatial_indexes.discard(self.game.code)
+    
+    def tearDown(self):
+        spatial_indexes.discard(self.game.code)
+    
+    def test_pop_due_in_order_and_skips_cancelled(self):
+        """Test that only live, due deadlines come off the heap"""
+        self.scheduler.schedule('zone', 'a', 30)
+        self.scheduler.schedule('zone', 'b', 10)
+        self.scheduler.schedule('zone', 'c', 20)
+        self.scheduler.schedule('zone', 'c', 50)
+        self.scheduler.cancel('zone', 'b')
+        
+        self.assertEqual(self.scheduler.next_delay(now=0), 30)
+        self.assertEqual(self.scheduler.pop_due(now=40), {'zone': ['a']})
+        self.assertEqual(self.scheduler.pop_due(now=40), {})
+        self.assertEqual(self.scheduler.pop_due(now=60), {'zone': ['c']})
+        self.assertIsNone(self.scheduler.next_delay())
+    
+    def test_load_and_fire_once(self):
+        """Test that rebuilt deadlines fire exactly once in one batch"""
+        past = timezone.now() - timedelta(seconds=1)
+        zones = [
+            Zone.objects.create(
+                game=self.game, type='emp_field', position_lat=37.7749,
+                position_lng=-122.4194, radius=30, expires_at=past
+            )
+            for _ in range(3)
+        ]
+        Zone.objects.create(
+            game=self.game, type='task', position_lat=37.7749,
+            position_lng=-122.4194, radius=30
+        )
+        effect = StatusEffect.objects.create(player=self.host, type='poisoned', expires_at=past)
+        position_store.record(self.game.code, self.host.id, 37.7749, -122.4194)
+        spatial_indexes.get(self.game)
+        
+        self.assertEqual(self.scheduler.load(), 5)
+        due = self.scheduler.pop_due()
+        self.assertEqual(len(due['zone']), 3)
+        
+        messages = self.scheduler.fire(due)
+        groups = [group for group, _ in messages]
+        self.assertEqual(groups.count(f'game_{self.game.code}'), 2)
+        self.assertIn(f'player_{self.host.id}', groups)
+        self.assertFalse(Zone.objects.filter(id__in=[zone.id for zone in zones], active=True).exists())
+        self.assertFalse(StatusEffect.objects.filter(id=effect.id).exists())
+        self.game.refresh_from_db()
+        self.assertEqual(self.game.status, 'completed')
+        self.assertEqual(self.game.winner, 'red')
+        self.assertEqual(position_store.player_count(self.game.code), 0)
+        self.assertIsNone(spatial_indexes.peek(self.game.code))
+        
+        # Another worker firing the same deadlines finds nothing left to claim
+        self.assertEqual(self.scheduler.fire(due), [])
+    
+    def test_time_bomb_detonates(self):
+        """Test that a time bomb kills the players within its blast radius"""
+        victim = Player.objects.create(
+            name="Victim", game=self.game,
+            position_lat=37.77495, position_lng=-122.4194
+        )
+        bystander = Player.objects.create(
+            name="Bystander", game=self.game,
+            position_lat=37.7760, position_lng=-122.4194
+        )
+        # Left after the index was built, so it still has them in range
+        leaver = Player.objects.create(
+            name="Leaver", game=self.game,
+            position_lat=37.77495, position_lng=-122.4194
+        )
+        spatial_indexes.get(self.game)
+        Player.objects.filter(id=leaver.id).update(left_at=timezone.now())
+        bomb = DeployedItem.objects.create(
+            game=self.game, item_type='time_bomb', position_lat=37.7749,
+            position_lng=-122.4194, deployed_by=self.host,
+            expires_at=timezone.now() - timedelta(seconds=1)
+        )
+        
+        self.scheduler.fire({'deployed': [str(bomb.id)]})
+        bomb.refresh_from_db()
+        victim.refresh_from_db()
+        bystander.refresh_from_db()
+        self.assertFalse(bomb.active)
+        self.assertFalse(victim.is_alive)
+        self.assertTrue(bystander.is_alive)
+        self.assertTrue(Event.objects.filter(type='player_killed', player=victim).exists())
+        leaver.refresh_from_db()
+        self.assertTrue(leaver.is_alive)
+        self.assertFalse(Event.objects.filter(type='player_killed', player=leaver).exists())
+
+
+class RadarSnapshotTest(TestCase):
+    """Test cached, per-team radar views"""
+    
+    def setUp(self):
+        self.host = Player.objects.create(name="Host")
+        self.game = Game.objects.create(
+            host=self.host,
+            home_base_lat=37.7749,
+            home_base_lng=-122.4194,
+            status='active'
+        )
+        self.red = Player.objects.create(
+            name="Red", game=self.game, team='red', position_lat=37.7750, position_lng=-122.4194
+        )
+        self.red_dark = Player.objects.create(name="Red Dark", game=self.game, team='red')
+        PlayerState.objects.filter(player=self.red_dark).update(
+            last_seen=timezone.now() - timedelta(minutes=10)
+        )
+        self.blue = Player.objects.create(name="Blue", game=self.game, team='blue')
+        self.blue_offline = Player.objects.create(
+            name="Blue Offline", game=self.game, team='blue', is_online=False
+        )
+        self.blue_cloaked = Player.objects.create(name="Blue Cloaked", game=self.game, team='blue')
+        StatusEffect.objects.create(
+            player=self.blue_cloaked,
+            type='invisible',
+            expires_at=timezone.now() + timedelta(minutes=5)
+        )
+        self.radar = RadarCache(ttl=60)
+    
+    def visible_names(self, player):
+        snapshot = self.radar.get(self.game.code)
+        response = json.loads(snapshot.render(player.team, player.id))
+        self.assertEqual(response['type'], 'radar_response')
+        return {entry['name'] for entry in response['players']}
+    
+    def test_team_views(self):
+        """Test that teammates always show up and enemies only when visible"""
+        self.assertEqual(self.visible_names(self.red), {'Red Dark', 'Blue'})
+        self.assertEqual(self.visible_names(self.blue), {'Red', 'Blue Cloaked'})
+    
+    def test_snapshot_reused_within_ttl(self):
+        """Test that repeated pings are served without queries"""
+        self.radar.get(self.game.code)
+        with self.assertNumQueries(0):
+            self.visible_names(self.red)
+            self.visible_names(self.blue)
+        self.radar.invalidate(self.game.code)
+        with self.assertNumQueries(1):
+            self.radar.get(self.game.code)
+    
+    def test_builds_lock_per_game(self):
+        """Test that a build in progress for one game does not hold up another"""
+        with self.radar._build_lock('OTHER'):
+            with self.assertNumQueries(1):
+                self.radar.get(self.game.code)
+
+
+class VisibilityTest(TestCase):
+    """Test visibility derived from last_seen instead of stored"""
+    
+    def setUp(self):
+        self.host = Player.objects.create(name="Host")
+        self.game = Game.objects.create(
+            host=self.host,
+            home_base_lat=37.7749,
+            home_base_lng=-122.4194
+        )
+        self.player = Player.objects.create(name="Runner", game=self.game)
+    
+    def age(self, minutes):
+        PlayerState.objects.filter(player=self.player).update(
+            last_seen=timezone.now() - timedelta(minutes=minutes)
+        )
+    
+    def test_thresholds(self):
+        """Test the active, recent and dark windows"""
+        now = timezone.now()
+        self.assertEqual(derive_visibility(now - timedelta(minutes=1), True, now=now), 'active')
+        self.assertEqual(derive_visibility(now - timedelta(minutes=3), True, now=now), 'recent')
+        self.assertEqual(derive_visibility(now - timedelta(minutes=6), True, now=now), 'dark')
+        self.assertEqual(derive_visibility(now, False, now=now), 'dark')
+        self.assertEqual(derive_visibility(now, True, cloaked=True, now=now), 'recent')
+    
+    def test_sql_annotation_matches_property(self):
+        """Test that the SQL expression agrees with the Python derivation"""
+        StatusEffect.objects.create(
+            player=self.host, type='invisible',
+            expires_at=timezone.now() + timedelta(minutes=5)
+        )
+        for minutes, expected in [(0, 'active'), (3, 'recent'), (10, 'dark')]:
+            self.age(minutes)
+            annotated = Player.objects.with_visibility().get(id=self.player.id)
+            self.assertEqual(annotated.derived_visibility, expected)
+            self.assertEqual(Player.objects.get(id=self.player.id).visibility, expected)
+        self.assertEqual(Player.objects.with_visibility().get(id=self.host.id).visibility, 'recent')
+    
+    def test_tracker_reports_transitions_only(self):
+        """Test that only changed states are reported, with no writes"""
+        tracker = VisibilityTracker()
+        self.assertEqual(tracker.check(self.game.code), {})
+        self.age(3)
+        with self.assertNumQueries(1):
+            changes = tracker.check(self.game.code)
+        self.assertEqual(changes, {str(self.player.id): 'recent'})
+        self.assertEqual(tracker.check(self.game.code), {})
+
+
+@override_settings(
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    PRESENCE_SWEEP_INTERVAL=0,
+    PRESENCE_DEBOUNCE=0
+)
+class PresenceServiceTest(TestCase):
+    """Test heartbeat presence and its state-change-only writes"""
+    
+    def setUp(self):
+        self.host = Player.objects.create(name="Host")
+        self.game = Game.objects.create(
+            host=self.host,
+            home_base_lat=37.7749,
+            home_base_lng=-122.4194
+        )
+        self.player = Player.objects.create(name="Runner", game=self.game, is_online=False)
+        self.presence = PresenceService(LocalPresenceBackend())
+    
+    def test_connect_persists_only_transitions(self):
+        """Test that coming online writes once and heartbeats do not write"""
+        self.assertTrue(self.presence.connect(self.player.id, self.game.code))
+        self.player.refresh_from_db()
+        self.assertTrue(self.player.is_online)
+        with self.assertNumQueries(0):
+            self.assertFalse(self.presence.connect(self.player.id, self.game.code))
+            self.assertFalse(self.presence.refresh(self.player.id, self.game.code))
+    
+    @override_settings(PRESENCE_DEBOUNCE=30)
+    def test_reconnect_within_debounce_stays_online(self):
+        """Test that a dropped socket that comes back never goes offline"""
+        self.presence.connect(self.player.id, self.game.code)
+        self.presence.disconnect(self.player.id)
+        self.assertEqual(self.presence.sweep(), [])
+        with self.assertNumQueries(0):
+            self.assertFalse(self.presence.connect(self.player.id, self.game.code))
+    
+    def test_sweep_marks_lapsed_players_offline(self):
+        """Test that a lapsed heartbeat is persisted once by the sweep"""
+        self.presence.connect(self.player.id, self.game.code)
+        self.presence.disconnect(self.player.id)
+        self.assertEqual(self.presence.merge(self.player.id, None, True), (None, False))
+        self.assertEqual(self.presence.sweep(), [str(self.player.id)])
+        self.assertEqual(self.presence.sweep(), [])
+        self.player.refresh_from_db()
+        self.assertFalse(self.player.is_online)
+    
+    def test_merge_prefers_live_heartbeat(self):
+        """Test that live presence overrides the stored row"""
+        self.presence.connect(self.player.id, self.game.code)
+        PlayerState.objects.filter(player=self.player).update(is_online=False)
+        last_seen, is_online = self.presence.merge(
+            self.player.id, timezone.now() - timedelta(minutes=10), False
+        )
+        self.assertTrue(is_online)
+        self.assertLess(timezone.now() - last_seen, timedelta(seconds=5))
+
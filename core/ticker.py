@@ -0,0 +1,163 @@
+import asyncio
+import logging
+
+from django.conf import settings
+
+from .broadcast import (
+    cell_group, frame_message, game_group, group_send_many, keyed_frame_message,
+    unlocated_group
+)
+from .dbpool import db_sync_to_async
+from .interest import interest_grids
+from .load import DOWNSAMPLE, SHED, load_monitor
+from .positions import position_store
+from .visibility import visibility_tracker
+
+
+logger = logging.getLogger(__name__)
+
+
+def snapshot_message(fixes):
+    """Build the ``positions_snapshot`` group message for some position fixes"""
+    # Entries are encoded once; consumers drop their own when forwarding.
+    # Raw coordinates ride along for connections using delta frames.
+    return keyed_frame_message(
+        'positions_snapshot',
+        'positions',
+        {fix.player_id: {'player_id': fix.player_id, 'position': fix.as_dict()} for fix in fixes},
+        coordinates={fix.player_id: [fix.lat, fix.lng] for fix in fixes}
+    )
+
+
+class PositionTicker:
+    """Per-game broadcast loop that batches movement into snapshots.
+
+    Instead of one ``player_moved`` group message per position update,
+    the ticker wakes a few times a second, collects every player that
+    moved since the previous tick and sends a single ``positions_snapshot``
+    to the game group. The tick rate drops as the game grows so the
+    number of frames per second stays roughly constant.
+
+    Under sustained event loop lag (see core.load) ticks slow down, then
+    stop until the worker recovers; movers keep accumulating in the store
+    meanwhile, so the next snapshot still carries their latest position.
+
+    When the game has an interest grid (see core.interest) the snapshot
+    is split by map cell, so each connection only hears about players
+    near it.
+    """
+
+    def __init__(self, game_code, channel_layer, store=position_store):
+        self.game_code = game_code
+        self.group_name = game_group(game_code)
+        self.channel_layer = channel_layer
+        self.store = store
+        self.subscribers = 0
+        self._task = None
+
+    @property
+    def tick_rate(self):
+        """Ticks per second for the current number of players and worker load"""
+        max_rate = getattr(settings, 'POSITION_TICK_RATE_MAX', 5.0)
+        min_rate = getattr(settings, 'POSITION_TICK_RATE_MIN', 2.0)
+        full_rate_players = getattr(settings, 'POSITION_TICK_FULL_RATE_PLAYERS', 10)
+        players = max(self.subscribers, self.store.player_count(self.game_code))
+        if players <= full_rate_players:
+            rate = max_rate
+        else:
+            rate = max(min_rate, max_rate * full_rate_players / players)
+        if load_monitor.level >= DOWNSAMPLE:
+            rate /= load_monitor.downsample_factor
+        return rate
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        visibility_tracker.forget(self.game_code)
+        interest_grids.discard(self.game_code)
+
+    async def tick(self):
+        """Broadcast one snapshot of everyone who moved since the last tick"""
+        fixes = self.store.take_moved(self.game_code)
+        if not fixes:
+            return 0
+        grid = interest_grids.peek(self.game_code)
+        if grid is None:
+            await self.channel_layer.group_send(self.group_name, snapshot_message(fixes))
+            return len(fixes)
+        # Each cell's movers go only to the connections interested in that
+        # cell; unlocated connections still get everyone
+        cells = {}
+        for fix in fixes:
+            cells.setdefault(grid.cell(fix.lat, fix.lng), []).append(fix)
+        messages = [
+            (cell_group(self.game_code, cell), snapshot_message(cell_fixes))
+            for cell, cell_fixes in cells.items()
+        ]
+        messages.append((unlocated_group(self.game_code), snapshot_message(fixes)))
+        await group_send_many(self.channel_layer, messages)
+        return len(fixes)
+
+    async def push_visibility(self):
+        """Broadcast the players whose derived visibility changed since the last push"""
+        changes = await db_sync_to_async(visibility_tracker.check)(self.game_code)
+        if not changes:
+            return 0
+        await self.channel_layer.group_send(self.group_name, frame_message({
+            'type': 'visibility_changed',
+            'players': [
+                {'player_id': player_id, 'visibility': visibility}
+                for player_id, visibility in changes.items()
+            ]
+        }))
+        return len(changes)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        next_visibility_push = loop.time()
+        while True:
+            await asyncio.sleep(1 / self.tick_rate)
+            level = load_monitor.level
+            if level >= SHED:
+                load_monitor.shed('tick_skipped', game=self.game_code)
+                continue
+            if level >= DOWNSAMPLE:
+                load_monitor.shed('tick_downsampled', game=self.game_code)
+            try:
+                await self.tick()
+                if loop.time() >= next_visibility_push:
+                    next_visibility_push = loop.time() + getattr(
+                        settings, 'VISIBILITY_PUSH_INTERVAL', 5.0
+                    )
+                    await self.push_visibility()
+            except Exception:
+                logger.exception("Position tick failed for game %s", self.game_code)
+
+
+_tickers = {}
+
+
+def acquire_ticker(game_code, channel_layer):
+    """Register a connection with its game's ticker, starting it if needed"""
+    ticker = _tickers.get(game_code)
+    if ticker is None:
+        ticker = _tickers[game_code] = PositionTicker(game_code, channel_layer)
+    ticker.subscribers += 1
+    ticker.start()
+    return ticker
+
+
+def release_ticker(game_code):
+    """Unregister a connection, stopping the ticker after the last one"""
+    ticker = _tickers.get(game_code)
+    if ticker is None:
+        return
+    ticker.subscribers -= 1
+    if ticker.subscribers <= 0:
+        ticker.stop()
+        del _tickers[game_code]
@@ -0,0 +1,226 @@
+"""Append-only movement history, kept out of the Event log.
+
+Every accepted position fix is appended to a per-player buffer here
+instead of becoming a ``player_moved`` Event. Buffers are written as
+``MovementTrail`` chunks: one row per player per flush holding the
+points as packed float32 ``(seconds since chunk start, lat, lng)``
+triples, 12 bytes a point. Chunks carry their time span, so replays and
+heatmaps read a time range with one indexed query and decode whole
+arrays at once.
+
+A chunk that cannot be written (its player was deleted meanwhile) is
+dropped on its own, so it never holds back other players' chunks.
+"""
+import logging
+import threading
+from datetime import datetime, timezone as dt_timezone
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+
+from .background import PeriodicWorker
+from .models import MovementTrail
+
+
+logger = logging.getLogger(__name__)
+
+POINT_DTYPE = np.float32
+POINT_WIDTH = 3
+
+
+def encode_points(points):
+    """Pack ``(timestamp, lat, lng)`` rows into a chunk's ``started_at`` and bytes"""
+    points = np.asarray(points, dtype=np.float64).reshape(-1, POINT_WIDTH)
+    started = points[0, 0]
+    packed = points.copy()
+    # Offsets keep float32 time precise; epoch seconds would not be
+    packed[:, 0] -= started
+    return _as_datetime(started), packed.astype(POINT_DTYPE).tobytes()
+
+
+def decode_points(started_at, data):
+    """Unpack a chunk into an ``(n, 3)`` float64 array of ``(timestamp, lat, lng)``"""
+    points = np.frombuffer(bytes(data), dtype=POINT_DTYPE).reshape(-1, POINT_WIDTH)
+    points = points.astype(np.float64)
+    points[:, 0] += started_at.timestamp()
+    return points
+
+
+class TrailBuffer:
+    """Points of one player waiting to be written"""
+    __slots__ = ('game_id', 'points')
+
+    def __init__(self, game_id):
+        self.game_id = game_id
+        self.points = []
+
+
+class TrailStore:
+    """Buffers movement per player and writes it in ``MovementTrail`` chunks.
+
+    Buffers are written every ``TRAIL_FLUSH_INTERVAL`` seconds, or as soon
+    as one holds ``TRAIL_CHUNK_SIZE`` points; an interval of 0 writes each
+    point as it arrives. Reads merge stored chunks with buffered points,
+    so a replay is complete even before the next flush.
+    """
+
+    def __init__(self, flush_interval=None, chunk_size=None):
+        self._flush_interval = flush_interval
+        self._chunk_size = chunk_size
+        self._lock = threading.Lock()
+        self._buffers = {}
+        self._worker = None
+
+    @property
+    def flush_interval(self):
+        if self._flush_interval is not None:
+            return self._flush_interval
+        return getattr(settings, 'TRAIL_FLUSH_INTERVAL', 10.0)
+
+    @property
+    def chunk_size(self):
+        if self._chunk_size is not None:
+            return self._chunk_size
+        return getattr(settings, 'TRAIL_CHUNK_SIZE', 256)
+
+    def append(self, game_id, player_id, lat, lng, timestamp):
+        """Buffer a point, writing the player's chunk if it is full"""
+        if game_id is None:
+            return
+        game_id, player_id = str(game_id), str(player_id)
+        with self._lock:
+            buffer = self._buffers.get(player_id)
+            if buffer is None or buffer.game_id != game_id:
+                buffer = self._buffers[player_id] = TrailBuffer(game_id)
+            buffer.points.append((timestamp.timestamp(), lat, lng))
+            full = len(buffer.points) >= self.chunk_size
+        if full or self.flush_interval <= 0:
+            self.flush_player(player_id)
+        else:
+            self._ensure_worker()
+
+    def flush(self):
+        """Write every buffered trail; returns the number of chunks written"""
+        with self._lock:
+            buffers, self._buffers = self._buffers, {}
+        return self._write(buffers)
+
+    def flush_player(self, player_id):
+        player_id = str(player_id)
+        with self._lock:
+            buffer = self._buffers.pop(player_id, None)
+        if buffer is None:
+            return 0
+        return self._write({player_id: buffer})
+
+    def discard_player(self, player_id):
+        """Drop a player's buffered points without writing them"""
+        with self._lock:
+            self._buffers.pop(str(player_id), None)
+
+    def read(self, player_ids=None, game_id=None, since=None, until=None):
+        """Return ``{player_id: (n, 3) array}`` of points in ``[since, until]``.
+
+        Filter by players, by game, or both. Arrays are ordered by time and
+        hold ``(epoch seconds, lat, lng)`` rows.
+        """
+        chunks = MovementTrail.objects.all()
+        if player_ids is not None:
+            player_ids = {str(player_id) for player_id in player_ids}
+            chunks = chunks.filter(player_id__in=player_ids)
+        if game_id is not None:
+            game_id = str(game_id)
+            chunks = chunks.filter(game_id=game_id)
+        if since is not None:
+            chunks = chunks.filter(ended_at__gte=since)
+        if until is not None:
+            chunks = chunks.filter(started_at__lte=until)
+
+        parts = {}
+        for player_id, started_at, data in chunks.order_by('started_at').values_list(
+            'player_id', 'started_at', 'points'
+        ):
+            parts.setdefault(str(player_id), []).append(decode_points(started_at, data))
+        with self._lock:
+            buffered = [
+                (player_id, np.array(buffer.points, dtype=np.float64))
+                for player_id, buffer in self._buffers.items()
+                if (player_ids is None or player_id in player_ids)
+                and (game_id is None or buffer.game_id == game_id)
+            ]
+        for player_id, points in buffered:
+            parts.setdefault(player_id, []).append(points)
+
+        trails = {}
+        for player_id, arrays in parts.items():
+            points = np.concatenate(arrays)
+            mask = np.ones(len(points), dtype=bool)
+            if since is not None:
+                mask &= points[:, 0] >= since.timestamp()
+            if until is not None:
+                mask &= points[:, 0] <= until.timestamp()
+            if mask.any():
+                trails[player_id] = points[mask]
+        return trails
+
+    def close(self, flush=True):
+        if self._worker is not None:
+            self._worker.stop(flush=flush)
+            self._worker = None
+
+    def _write(self, buffers):
+        chunks = []
+        for player_id, buffer in buffers.items():
+            if not buffer.points:
+                continue
+            started_at, data = encode_points(buffer.points)
+            chunks.append(MovementTrail(
+                game_id=buffer.game_id,
+                player_id=player_id,
+                started_at=started_at,
+                ended_at=_as_datetime(buffer.points[-1][0]),
+                point_count=len(buffer.points),
+                points=data,
+            ))
+        if not chunks:
+            return 0
+        try:
+            MovementTrail.objects.bulk_create(chunks, batch_size=500)
+        except Exception:
+            # One bad chunk (e.g. its player was deleted meanwhile) must not
+            # hold back the rest: write them one by one and drop failures
+            logger.warning("Batched trail write failed; retrying chunk by chunk", exc_info=True)
+            return self._write_each(chunks)
+        return len(chunks)
+
+    def _write_each(self, chunks):
+        written = 0
+        for chunk in chunks:
+            try:
+                with transaction.atomic():
+                    chunk.save(force_insert=True)
+            except Exception:
+                logger.exception(
+                    "Dropped trail chunk of %d points for player %s",
+                    chunk.point_count, chunk.player_id
+                )
+            else:
+                written += 1
+        return written
+
+    def _ensure_worker(self):
+        if self._worker is None:
+            with self._lock:
+                if self._worker is None:
+                    self._worker = PeriodicWorker(
+                        'trail-flush', self.flush, self.flush_interval
+                    )
+        self._worker.start()
+
+
+def _as_datetime(timestamp):
+    return datetime.fromtimestamp(timestamp, tz=dt_timezone.utc)
+
+
+trail_store = TrailStore()
@@ -0,0 +1,257 @@
+import threading
+import time
+
+from django.utils import timezone
+
+from .broadcast import (
+    frame_message, game_group, player_context_message, player_group
+)
+from .events import event_sink
+from .models import DeployedItem, Event, Player
+
+
+TRIGGER_ITEM_TYPES = ('land_mine', 'motion_sensor', 'camera')
+
+
+class TriggerEffect:
+    """Something a movement set off, waiting to be persisted and announced"""
+    __slots__ = ('kind', 'player_id', 'key', 'item_type', 'owner_id', 'lat', 'lng', 'radius', 'data')
+
+    def __init__(self, kind, player_id, key=None, item_type=None, owner_id=None,
+                 lat=None, lng=None, radius=0, data=None):
+        self.kind = kind
+        self.player_id = player_id
+        self.key = key
+        self.item_type = item_type
+        self.owner_id = owner_id
+        self.lat = lat
+        self.lng = lng
+        self.radius = radius
+        self.data = data or {}
+
+    @property
+    def entity_id(self):
+        return self.key.split(':', 1)[1] if self.key else None
+
+
+class TriggerEngine:
+    """Evaluates deployed items and EMP fields against player movement.
+
+    Runs on every accepted position update against the game's spatial
+    index, so a check only visits triggers in the grid cells around the
+    mover. Triggers are edge-triggered: an effect fires when a player
+    enters a trigger's radius, not on every update while they stay inside.
+
+    ``evaluate`` only touches memory and is cheap enough to run inline in
+    the consumer; ``persist_effects`` does the database work and returns
+    the channel messages to send.
+    """
+
+    def __init__(self):
+        self._inside = {}
+        self._lock = threading.Lock()
+
+    def evaluate(self, index, game_code, player_id, lat, lng, is_alive=True):
+        """Return the effects of a player moving to ``(lat, lng)``"""
+        if index is None:
+            return []
+        player_id = str(player_id)
+        now = time.time()
+        current = {}
+        for entry, _ in index.query_radius(
+            lat, lng, 0, kinds=('deployed', 'zone'), within_entry_radius=True
+        ):
+            if self._is_trigger(entry, now):
+                current[entry.key] = entry
+
+        with self._lock:
+            previous = self._inside.get((game_code, player_id), {})
+            if current:
+                self._inside[(game_code, player_id)] = current
+            else:
+                self._inside.pop((game_code, player_id), None)
+
+        effects = []
+        in_emp = self._in_emp(current)
+        was_in_emp = self._in_emp(previous)
+        if in_emp != was_in_emp:
+            effects.append(TriggerEffect(
+                'emp_status', player_id, lat=lat, lng=lng, data={'active': in_emp}
+            ))
+
+        for key, entry in current.items():
+            if key in previous or entry.kind != 'deployed':
+                continue
+            if not is_alive or entry.data['deployed_by'] == player_id:
+                continue
+            if self._suppressed(index, entry, now):
+                continue
+            effects.append(self._fire(index, entry, player_id))
+        return effects
+
+    def forget(self, game_code, player_id):
+        """Drop a player's trigger state (disconnect, death)"""
+        with self._lock:
+            self._inside.pop((game_code, str(player_id)), None)
+
+    def in_emp(self, game_code, player_id):
+        """Whether the player's last evaluated position was inside an EMP field"""
+        return self._in_emp(self._inside.get((game_code, str(player_id)), {}))
+
+    def _fire(self, index, entry, player_id):
+        item_type = entry.data['item_type']
+        effect = TriggerEffect(
+            'motion_detected', player_id, key=entry.key, item_type=item_type,
+            owner_id=entry.data['deployed_by'], lat=entry.lat, lng=entry.lng,
+            radius=entry.radius
+        )
+        if item_type == 'land_mine':
+            # A mine goes off once: take it out of the index before anyone else trips it
+            index.remove(entry.key)
+            effect.kind = 'explosion'
+            effect.data['victims'] = blast_victims(index, entry.lat, entry.lng, entry.radius)
+            if player_id not in effect.data['victims']:
+                effect.data['victims'].append(player_id)
+        return effect
+
+    def _suppressed(self, index, entry, now):
+        """Items standing inside an EMP field do not activate"""
+        return any(
+            self._is_emp(zone, now)
+            for zone, _ in index.query_radius(
+                entry.lat, entry.lng, 0, kinds=('zone',), within_entry_radius=True
+            )
+        )
+
+    @classmethod
+    def _is_trigger(cls, entry, now):
+        if entry.kind == 'zone':
+            return cls._is_emp(entry, now)
+        return entry.data['item_type'] in TRIGGER_ITEM_TYPES and not cls._expired(entry, now)
+
+    @classmethod
+    def _is_emp(cls, entry, now):
+        return entry.data.get('type') == 'emp_field' and not cls._expired(entry, now)
+
+    @classmethod
+    def _in_emp(cls, entries):
+        return any(entry.kind == 'zone' for entry in entries.values())
+
+    @staticmethod
+    def _expired(entry, now):
+        expires_at = entry.data.get('expires_at')
+        return expires_at is not None and expires_at <= now
+
+
+def blast_victims(index, lat, lng, radius):
+    """Ids of the players an explosion at ``(lat, lng)`` reaches"""
+    return [
+        entry.key.split(':', 1)[1]
+        for entry, _ in index.query_radius(lat, lng, radius, kinds=('player',))
+    ]
+
+
+def persist_effects(game_id, game_code, effects):
+    """Record trigger effects in the database and return ``(group, message)`` pairs.
+
+    Mines are deactivated with a conditional update so that an explosion
+    is only recorded once even if two processes evaluate the same mine.
+    """
+    messages = []
+    for effect in effects:
+        if effect.kind == 'emp_status':
+            messages.append((player_group(effect.player_id), frame_message({
+                'type': 'emp_status',
+                'active': effect.data['active']
+            })))
+        elif effect.kind == 'explosion':
+            messages.extend(_persist_explosion(game_id, game_code, effect))
+        elif effect.kind == 'motion_detected':
+            messages.extend(_persist_detection(game_id, effect))
+    return messages
+
+
+def _persist_explosion(game_id, game_code, effect):
+    if not DeployedItem.objects.filter(id=effect.entity_id, active=True).update(active=False):
+        return []
+    return record_explosion(game_id, game_code, effect)
+
+
+def record_explosion(game_id, game_code, effect):
+    """Kill the living victims of an explosion whose item has already been spent"""
+    now = timezone.now()
+    victims = list(Player.objects.filter(
+        id__in=effect.data['victims'], game_id=game_id, is_alive=True, left_at__isnull=True
+    ).values_list('id', 'name'))
+    Player.objects.filter(id__in=[victim_id for victim_id, _ in victims]).update(
+        is_alive=False,
+        death_time=now,
+        death_position_lat=effect.lat,
+        death_position_lng=effect.lng
+    )
+
+    event_sink.record(
+        game_id=game_id,
+        type='explosion',
+        player_id=effect.owner_id,
+        params={'item': effect.item_type},
+        position_lat=effect.lat,
+        position_lng=effect.lng,
+        data={'deployed_item_id': effect.entity_id, 'radius': effect.radius}
+    )
+    Event.objects.bulk_create([
+        Event(
+            game_id=game_id,
+            type='player_killed',
+            player_id=victim_id,
+            position_lat=effect.lat,
+            position_lng=effect.lng,
+            data={'cause': effect.item_type}
+        )
+        for victim_id, _ in victims
+    ])
+
+    messages = [(game_group(game_code), frame_message({
+        'type': 'explosion',
+        'item_type': effect.item_type,
+        'position': {'lat': effect.lat, 'lng': effect.lng},
+        'radius': effect.radius
+    }))]
+    for victim_id, _ in victims:
+        trigger_engine.forget(game_code, victim_id)
+        messages.append((game_group(game_code), frame_message({
+            'type': 'player_killed',
+            'victim_id': str(victim_id),
+            'killer_id': effect.owner_id,
+            'cause': effect.item_type
+        })))
+        messages.append((player_group(victim_id), player_context_message(is_alive=False)))
+    return messages
+
+
+def _persist_detection(game_id, effect):
+    payload = {
+        'type': 'motion_detected',
+        'item_type': effect.item_type,
+        'deployed_item_id': effect.entity_id,
+        'position': {'lat': effect.lat, 'lng': effect.lng}
+    }
+    if effect.item_type == 'camera':
+        # Cameras record who walked past; sensors only that someone did
+        payload['player_id'] = effect.player_id
+
+    event = Event.objects.create(
+        game_id=game_id,
+        type='motion_detected',
+        player_id=effect.owner_id,
+        params={'item': effect.item_type},
+        visibility='private',
+        position_lat=effect.lat,
+        position_lng=effect.lng,
+        data={key: value for key, value in payload.items() if key != 'type'}
+    )
+    event.recipient_players.add(effect.owner_id)
+    return [(player_group(effect.owner_id), frame_message(payload))]
+
+
+trigger_engine = TriggerEngine()
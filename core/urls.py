@@ -1,8 +1,9 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
+from .lobby import join_game, leave_game, start_game
 from .views import (
     GameViewSet, PlayerViewSet, EventViewSet,
-    ZoneViewSet, ItemSpawnViewSet, TaskViewSet
+    ZoneViewSet, ItemSpawnViewSet, TaskViewSet, pipeline_metrics
 )
 
 router = DefaultRouter()
@@ -14,5 +15,10 @@ router.register(r'items', ItemSpawnViewSet, basename='item')
 router.register(r'tasks', TaskViewSet, basename='task')
 
 urlpatterns = [
+    path('api/metrics/', pipeline_metrics, name='metrics'),
+    # Lobby actions are async views (see core.lobby), ahead of the router
+    path('api/games/<str:code>/join/', join_game, name='game-join'),
+    path('api/games/<str:code>/start/', start_game, name='game-start'),
+    path('api/games/<str:code>/leave/', leave_game, name='game-leave'),
     path('api/', include(router.urls)),
 ]
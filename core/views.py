@@ -1,18 +1,26 @@
 from django.utils import timezone
 from django.db import transaction
 from rest_framework import viewsets, status
-from rest_framework.decorators import action
+from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
-import random
 
+from .events import event_sink
+from .lobby import forget_player, game_detail_queryset
+from .metrics import metrics
 from .models import Game, Player, Zone, Event, ItemSpawn, PlayerInventory, Task
+from .movement import movement_filter
+from .outbox import broadcast_outbox
+from .positions import position_store
 from .serializers import (
     GameListSerializer, GameDetailSerializer, CreateGameSerializer,
-    JoinGameSerializer, PlayerSerializer, ZoneSerializer, EventSerializer,
+    PlayerSerializer, ZoneSerializer, EventSerializer,
     ItemSpawnSerializer, TaskSerializer, UpdatePositionSerializer,
-    PickupItemSerializer, UseItemSerializer
+    PickupItemSerializer, UseItemSerializer, TrailQuerySerializer, trail_points
 )
+from .spatial import entry_key, index_item, spatial_indexes
+from .trails import trail_store
+from .triggers import persist_effects, trigger_engine
 
 
 class GameViewSet(viewsets.ModelViewSet):
@@ -21,13 +29,15 @@ class GameViewSet(viewsets.ModelViewSet):
     permission_classes = [AllowAny]
     lookup_field = 'code'
     
+    def get_queryset(self):
+        # Derived player visibility needs each player's cloak and state
+        return game_detail_queryset()
+    
     def get_serializer_class(self):
         if self.action == 'list':
             return GameListSerializer
         elif self.action == 'create':
             return CreateGameSerializer
-        elif self.action == 'join':
-            return JoinGameSerializer
         return GameDetailSerializer
     
     @transaction.atomic
@@ -62,11 +72,11 @@ class GameViewSet(viewsets.ModelViewSet):
         )
         
         # Log event
-        Event.objects.create(
+        event_sink.record(
             game=game,
             type='player_joined',
             player=host_player,
-            message=f"{host_player.name} created the game"
+            params={'host': True}
         )
         
         return Response(
@@ -74,271 +84,20 @@ class GameViewSet(viewsets.ModelViewSet):
             status=status.HTTP_201_CREATED
         )
     
-    @action(detail=True, methods=['post'])
-    @transaction.atomic
-    def join(self, request, code=None):
-        """Join a game lobby"""
+    @action(detail=True, methods=['get'])
+    def trails(self, request, code=None):
+        """Movement of every player in a time range (replays, heatmaps)"""
         game = self.get_object()
-        
-        if game.status != 'lobby':
-            return Response(
-                {'error': 'Game has already started'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        if game.players.count() >= game.max_players:
-            return Response(
-                {'error': 'Game is full'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        serializer = JoinGameSerializer(data=request.data)
+        serializer = TrailQuerySerializer(data=request.query_params)
         serializer.is_valid(raise_exception=True)
         
-        # Check if name is already taken
-        if game.players.filter(name=serializer.validated_data['player_name']).exists():
-            return Response(
-                {'error': 'Name already taken'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        # Create player
-        player = Player.objects.create(
-            game=game,
-            name=serializer.validated_data['player_name'],
-            avatar_url=serializer.validated_data.get('avatar_url', '')
-        )
-        
-        # Create inventory
-        PlayerInventory.objects.create(player=player)
-        
-        # Log event
-        Event.objects.create(
-            game=game,
-            type='player_joined',
-            player=player,
-            message=f"{player.name} joined the game"
-        )
-        
-        # Broadcast to all players in the game via WebSocket
-        from channels.layers import get_channel_layer
-        from asgiref.sync import async_to_sync
-        
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(
-            f'game_{game.code}',
-            {
-                'type': 'player_joined',
-                'player': PlayerSerializer(player).data
+        trails = trail_store.read(game_id=game.id, **serializer.validated_data)
+        return Response({
+            'trails': {
+                player_id: trail_points(points)
+                for player_id, points in trails.items()
             }
-        )
-        
-        return Response(
-            PlayerSerializer(player).data,
-            status=status.HTTP_201_CREATED
-        )
-    
-    @action(detail=True, methods=['post'])
-    @transaction.atomic
-    def start(self, request, code=None):
-        """Start the game (host only)"""
-        game = self.get_object()
-        
-        if game.status != 'lobby':
-            return Response(
-                {'error': 'Game has already started'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        # Check if request is from host (simplified for now)
-        # In production, use proper authentication
-        
-        if game.players.count() < 2:
-            return Response(
-                {'error': 'Need at least 2 players to start'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        # Assign teams
-        players = list(game.players.all())
-        red_count = max(1, int(len(players) * game.red_team_ratio))
-        red_players = random.sample(players, red_count)
-        
-        for player in players:
-            if player in red_players:
-                player.team = 'red'
-            else:
-                player.team = 'blue'
-            player.save()
-        
-        # Generate zones and items
-        self._generate_game_content(game)
-        
-        # Update game status
-        game.status = 'active'
-        game.started_at = timezone.now()
-        game.save()
-        
-        # Log event
-        Event.objects.create(
-            game=game,
-            type='game_started',
-            message=f"Game started with {len(players)} players"
-        )
-        
-        # Broadcast game started to all players via WebSocket
-        from channels.layers import get_channel_layer
-        from asgiref.sync import async_to_sync
-        
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(
-            f'game_{game.code}',
-            {
-                'type': 'game_started',
-                'game': GameDetailSerializer(game).data
-            }
-        )
-        
-        return Response(
-            GameDetailSerializer(game).data,
-            status=status.HTTP_200_OK
-        )
-    
-    @action(detail=True, methods=['post'])
-    @transaction.atomic
-    def leave(self, request, code=None):
-        """Leave a game"""
-        game = self.get_object()
-        player_id = request.data.get('player_id')
-        
-        try:
-            player = game.players.get(id=player_id)
-        except Player.DoesNotExist:
-            return Response(
-                {'error': 'Player not found'},
-                status=status.HTTP_404_NOT_FOUND
-            )
-        
-        # Store player info before potential deletion
-        player_name = player.name
-        player_id_str = str(player.id)
-        
-        # If game hasn't started, remove player completely
-        # If game is active, just mark them as offline
-        if game.status == 'lobby':
-            # Check if this is the host leaving
-            if player.id == game.host_id:
-                # Transfer host to another player if any exist
-                remaining_players = game.players.exclude(id=player.id)
-                if remaining_players.exists():
-                    game.host_id = remaining_players.first().id
-                    game.save()
-            
-            # Log event BEFORE deleting the player
-            Event.objects.create(
-                game=game,
-                type='player_left',
-                player=player,
-                message=f"{player_name} left the game"
-            )
-            
-            player.delete()  # Remove player from game entirely
-        else:
-            player.left_at = timezone.now()
-            player.is_online = False
-            player.visibility = 'dark'
-            player.save()
-            
-            # Log event after marking as offline
-            Event.objects.create(
-                game=game,
-                type='player_left',
-                player=player,
-                message=f"{player_name} left the game"
-            )
-        
-        # Broadcast to all players in the game via WebSocket
-        from channels.layers import get_channel_layer
-        from asgiref.sync import async_to_sync
-        
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(
-            f'game_{game.code}',
-            {
-                'type': 'player_left',
-                'player_id': player_id_str
-            }
-        )
-        
-        return Response(status=status.HTTP_204_NO_CONTENT)
-    
-    def _generate_game_content(self, game):
-        """Generate zones, items, and tasks for the game"""
-        import math
-        
-        # Helper to generate random positions within map radius
-        def random_position_in_radius(center_lat, center_lng, radius_meters):
-            # Convert radius to degrees (approximate)
-            radius_deg = radius_meters / 111000  # 1 degree ≈ 111km
-            
-            # Generate random angle and distance
-            angle = random.uniform(0, 2 * math.pi)
-            distance = random.uniform(0.3, 1) * radius_deg
-            
-            # Calculate new position
-            lat = center_lat + distance * math.cos(angle)
-            lng = center_lng + distance * math.sin(angle)
-            
-            return lat, lng
-        
-        # Generate task zones (3-5 zones)
-        for i in range(random.randint(3, 5)):
-            lat, lng = random_position_in_radius(
-                game.home_base_lat,
-                game.home_base_lng,
-                game.map_radius
-            )
-            Zone.objects.create(
-                game=game,
-                type='task',
-                position_lat=lat,
-                position_lng=lng,
-                radius=30
-            )
-        
-        # Generate reviver zones (2 zones)
-        for i in range(2):
-            lat, lng = random_position_in_radius(
-                game.home_base_lat,
-                game.home_base_lng,
-                game.map_radius
-            )
-            Zone.objects.create(
-                game=game,
-                type='reviver',
-                position_lat=lat,
-                position_lng=lng,
-                radius=20
-            )
-        
-        # Generate item spawns (10-15 items)
-        item_types = [
-            'emp', 'camera', 'dagger', 'mask', 'armor',
-            'invisibility_cloak', 'poison', 'motion_sensor', 'decoy'
-        ]
-        
-        for i in range(random.randint(10, 15)):
-            lat, lng = random_position_in_radius(
-                game.home_base_lat,
-                game.home_base_lng,
-                game.map_radius
-            )
-            ItemSpawn.objects.create(
-                game=game,
-                item_type=random.choice(item_types),
-                position_lat=lat,
-                position_lng=lng
-            )
+        })
 
 
 class PlayerViewSet(viewsets.ModelViewSet):
@@ -347,33 +106,81 @@ class PlayerViewSet(viewsets.ModelViewSet):
     serializer_class = PlayerSerializer
     permission_classes = [AllowAny]
     
+    def get_queryset(self):
+        return Player.objects.with_cloak().select_related('state')
+    
+    def perform_destroy(self, instance):
+        player_id = instance.id
+        game_code = instance.game.code if instance.game_id else None
+        instance.delete()
+        transaction.on_commit(lambda: forget_player(game_code, player_id, deleted=True))
+    
     @action(detail=True, methods=['post'])
     def update_position(self, request, pk=None):
         """Update player position"""
         player = self.get_object()
         serializer = UpdatePositionSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
+        game_code = player.game.code if player.game else None
+        
+        # Jitter inside the fix's accuracy is dropped before it is stored
+        filtered = movement_filter.filter(
+            game_code,
+            player.id,
+            serializer.validated_data['lat'],
+            serializer.validated_data['lng'],
+            serializer.validated_data.get('accuracy')
+        )
+        if filtered is None:
+            # Answer with the position the server still holds
+            held = position_store.get(game_code, player.id)
+            if held is not None:
+                player.position_lat, player.position_lng = held.lat, held.lng
+            return Response(PlayerSerializer(player).data)
+        
+        # Positions go through the write-behind store, not player.save()
+        fix = position_store.record(game_code, player.id, *filtered)
+        if position_store.write_through:
+            position_store.flush()
+        if player.game:
+            spatial_indexes.move_player(player.game.code, player.id, fix.lat, fix.lng)
+            effects = trigger_engine.evaluate(
+                spatial_indexes.get(player.game),
+                player.game.code,
+                player.id,
+                fix.lat,
+                fix.lng,
+                is_alive=player.is_alive
+            )
+            if effects:
+                messages = persist_effects(player.game.id, player.game.code, effects)
+                broadcast_outbox.send_many(messages)
+                player.refresh_from_db(fields=['is_alive', 'death_time'])
         
-        player.position_lat = serializer.validated_data['lat']
-        player.position_lng = serializer.validated_data['lng']
-        player.position_accuracy = serializer.validated_data.get('accuracy')
-        player.visibility = 'active'
-        player.last_seen = timezone.now()
-        player.save()
+        player.position_lat = fix.lat
+        player.position_lng = fix.lng
+        player.position_accuracy = fix.accuracy
+        player.last_seen = fix.timestamp
         
-        # Log movement event (throttle this in production)
-        Event.objects.create(
-            game=player.game,
-            type='player_moved',
-            player=player,
-            message=f"{player.name} moved",
-            position_lat=player.position_lat,
-            position_lng=player.position_lng,
-            visibility='team'
-        )
+        # Movement history goes to the trail store, not the event log
+        trail_store.append(player.game_id, player.id, fix.lat, fix.lng, fix.timestamp)
         
         return Response(PlayerSerializer(player).data)
     
+    @action(detail=True, methods=['get'])
+    def trail(self, request, pk=None):
+        """Player's movement in a time range"""
+        player = self.get_object()
+        serializer = TrailQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        
+        trails = trail_store.read(player_ids=[player.id], **serializer.validated_data)
+        points = trails.get(str(player.id))
+        return Response({
+            'player_id': str(player.id),
+            'points': trail_points(points) if points is not None else []
+        })
+    
     @action(detail=True, methods=['post'])
     @transaction.atomic
     def pickup_item(self, request, pk=None):
@@ -394,13 +201,25 @@ class PlayerViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_404_NOT_FOUND
             )
         
-        # Check proximity (simplified - in production use PostGIS)
-        # This is a rough approximation
-        distance = ((player.position_lat - item.position_lat) ** 2 + 
-                   (player.position_lng - item.position_lng) ** 2) ** 0.5
-        max_distance = item.pickup_radius / 111000  # Convert meters to degrees
+        # Prefer the live position over the last flushed one
+        fix = position_store.get(player.game.code, player.id)
+        if fix is not None:
+            player.position_lat, player.position_lng = fix.lat, fix.lng
+        
+        # Check proximity against the game's spatial index
+        index = spatial_indexes.get(player.game)
+        item_key = entry_key('item', item.id)
+        if item_key not in index:
+            index_item(index, item)
+        in_range = player.position_lat is not None and any(
+            entry.key == item_key
+            for entry, _ in index.query_radius(
+                player.position_lat, player.position_lng, 0,
+                kinds=('item',), within_entry_radius=True
+            )
+        )
         
-        if distance > max_distance:
+        if not in_range:
             return Response(
                 {'error': 'Too far from item'},
                 status=status.HTTP_400_BAD_REQUEST
@@ -417,6 +236,7 @@ class PlayerViewSet(viewsets.ModelViewSet):
             old_item.position_lng = player.position_lng
             old_item.dropped_by = player
             old_item.save()
+            transaction.on_commit(lambda: index_item(index, old_item))
         
         # Pick up new item
         inventory.item = item
@@ -426,13 +246,15 @@ class PlayerViewSet(viewsets.ModelViewSet):
         item.collected_by = player
         item.collected_at = timezone.now()
         item.save()
+        # Update the shared index only once the pickup is committed
+        transaction.on_commit(lambda: index.remove(item_key))
         
         # Log event
-        Event.objects.create(
+        event_sink.record(
             game=player.game,
             type='item_picked',
             player=player,
-            message=f"{player.name} picked up {item.item_type}",
+            params={'item': item.item_type},
             position_lat=player.position_lat,
             position_lng=player.position_lng
         )
@@ -470,11 +292,11 @@ class PlayerViewSet(viewsets.ModelViewSet):
         inventory.save()
         
         # Log event
-        Event.objects.create(
+        event_sink.record(
             game=player.game,
             type='item_used',
             player=player,
-            message=f"{player.name} used {item.item_type}",
+            params={'item': item.item_type},
             position_lat=player.position_lat,
             position_lng=player.position_lng
         )
@@ -490,7 +312,9 @@ class EventViewSet(viewsets.ReadOnlyModelViewSet):
     def get_queryset(self):
         game_code = self.request.query_params.get('game_code')
         if game_code:
-            return Event.objects.filter(game__code=game_code)
+            # Include events this worker has recorded but not yet written
+            event_sink.flush()
+            return Event.objects.filter(game__code=game_code).select_related('player')
         return Event.objects.none()
 
 
@@ -528,3 +352,13 @@ class TaskViewSet(viewsets.ModelViewSet):
         if game_code:
             return Task.objects.filter(game__code=game_code)
         return Task.objects.none()
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def pipeline_metrics(request):
+    """Counters and gauges of this worker process, optionally for one game"""
+    game_code = request.query_params.get('game_code')
+    if game_code:
+        return Response(metrics.snapshot(game=game_code))
+    return Response(metrics.snapshot())
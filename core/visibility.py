@@ -0,0 +1,112 @@
+"""Player visibility, derived on read instead of stored.
+
+A player is ``active`` while they have been seen within
+``VISIBILITY_ACTIVE_SECONDS``, ``recent`` until ``VISIBILITY_RECENT_SECONDS``
+and ``dark`` after that or as soon as they go offline. An active
+invisibility cloak keeps a player from showing as ``active``. Nothing
+writes these states: serializers and queries compute them from
+``last_seen``, and ``VisibilityTracker`` pushes the changes to clients.
+"""
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Case, Q, Value, When
+from django.utils import timezone
+
+
+ACTIVE = 'active'
+RECENT = 'recent'
+DARK = 'dark'
+
+
+def thresholds():
+    """Return the ``(active, recent)`` ages as timedeltas"""
+    return (
+        timedelta(seconds=getattr(settings, 'VISIBILITY_ACTIVE_SECONDS', 120)),
+        timedelta(seconds=getattr(settings, 'VISIBILITY_RECENT_SECONDS', 300)),
+    )
+
+
+def derive_visibility(last_seen, is_online, cloaked=False, now=None):
+    """Compute a player's visibility at ``now``"""
+    if not is_online or last_seen is None:
+        return DARK
+    active_for, recent_for = thresholds()
+    age = (now or timezone.now()) - last_seen
+    if age >= recent_for:
+        return DARK
+    if age >= active_for or cloaked:
+        return RECENT
+    return ACTIVE
+
+
+def visibility_expression(now=None, cloaked='cloaked', prefix=''):
+    """SQL expression equivalent to ``derive_visibility``.
+
+    ``cloaked`` names a boolean annotation on the same queryset and
+    ``prefix`` is the lookup path to the presence columns (``state__``
+    from a Player queryset).
+    """
+    now = now or timezone.now()
+    active_for, recent_for = thresholds()
+    is_online, last_seen = f'{prefix}is_online', f'{prefix}last_seen'
+    return Case(
+        When(Q(**{is_online: False}) | Q(**{f'{last_seen}__isnull': True}), then=Value(DARK)),
+        When(**{f'{last_seen}__lte': now - recent_for}, then=Value(DARK)),
+        When(
+            Q(**{f'{last_seen}__lte': now - active_for}) | Q(**{cloaked: True}),
+            then=Value(RECENT)
+        ),
+        default=Value(ACTIVE),
+    )
+
+
+class VisibilityTracker:
+    """Remembers the last visibility pushed per player and reports changes.
+
+    ``check`` is run periodically per game (by the position ticker). It
+    derives every player's visibility with one read query and returns
+    only the players whose state changed since the previous check.
+    """
+
+    def __init__(self):
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def check(self, game_code, now=None):
+        """Return ``{player_id: visibility}`` for players that changed state"""
+        from .models import Player
+        from .positions import position_store
+        from .presence import presence
+
+        now = now or timezone.now()
+        live = position_store.positions(game_code)
+        current = {}
+        for player_id, last_seen, is_online, cloaked in (
+            Player.objects.filter(game__code=game_code)
+            .with_cloak(now)
+            .values_list('id', 'state__last_seen', 'state__is_online', 'cloaked')
+        ):
+            player_id = str(player_id)
+            fix = live.get(player_id)
+            if fix is not None and (last_seen is None or fix.timestamp > last_seen):
+                last_seen = fix.timestamp
+            last_seen, is_online = presence.merge(player_id, last_seen, is_online)
+            current[player_id] = derive_visibility(last_seen, is_online, cloaked, now)
+
+        with self._lock:
+            previous = self._states.get(game_code, {})
+            self._states[game_code] = current
+        return {
+            player_id: state
+            for player_id, state in current.items()
+            if previous.get(player_id, state) != state
+        }
+
+    def forget(self, game_code):
+        with self._lock:
+            self._states.pop(game_code, None)
+
+
+visibility_tracker = VisibilityTracker()
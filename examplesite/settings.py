@@ -59,6 +59,7 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "core.middleware.outbox_middleware",
 ]
 
 ROOT_URLCONF = "examplesite.urls"
@@ -191,3 +192,100 @@ CACHES = {
         "LOCATION": f"redis://{os.environ.get('REDIS_HOST', '127.0.0.1')}:6379/1",
     }
 }
+
+# Game engine tuning
+# Seconds between write-behind flushes of buffered player positions.
+# 0 writes every position update straight through to the database.
+POSITION_FLUSH_INTERVAL = float(os.environ.get("POSITION_FLUSH_INTERVAL", "2"))
+
+# Movement snapshots are broadcast per game at up to POSITION_TICK_RATE_MAX
+# ticks per second, slowing towards POSITION_TICK_RATE_MIN once a game has
+# more than POSITION_TICK_FULL_RATE_PLAYERS players.
+POSITION_TICK_RATE_MAX = float(os.environ.get("POSITION_TICK_RATE_MAX", "5"))
+POSITION_TICK_RATE_MIN = float(os.environ.get("POSITION_TICK_RATE_MIN", "2"))
+POSITION_TICK_FULL_RATE_PLAYERS = int(os.environ.get("POSITION_TICK_FULL_RATE_PLAYERS", "10"))
+
+# Cell size in meters of the per-game spatial index used for proximity checks
+SPATIAL_CELL_SIZE = float(os.environ.get("SPATIAL_CELL_SIZE", "25"))
+
+# Seconds a game's radar snapshot is reused before radar_ping rebuilds it
+RADAR_SNAPSHOT_TTL = float(os.environ.get("RADAR_SNAPSHOT_TTL", "0.3"))
+
+# Player visibility is derived from last_seen: active for the first
+# VISIBILITY_ACTIVE_SECONDS, recent until VISIBILITY_RECENT_SECONDS, then
+# dark. Changes are pushed to clients every VISIBILITY_PUSH_INTERVAL seconds.
+VISIBILITY_ACTIVE_SECONDS = int(os.environ.get("VISIBILITY_ACTIVE_SECONDS", "120"))
+VISIBILITY_RECENT_SECONDS = int(os.environ.get("VISIBILITY_RECENT_SECONDS", "300"))
+VISIBILITY_PUSH_INTERVAL = float(os.environ.get("VISIBILITY_PUSH_INTERVAL", "5"))
+
+# Presence: a player is online while their heartbeat (any WebSocket message)
+# is younger than PRESENCE_TTL seconds. A closed socket goes offline only
+# after PRESENCE_DEBOUNCE seconds without a reconnect. Lapsed players are
+# persisted every PRESENCE_SWEEP_INTERVAL seconds. PRESENCE_BACKEND is
+# "local" (per process) or "cache" (the default Django cache, i.e. Redis).
+PRESENCE_BACKEND = os.environ.get("PRESENCE_BACKEND", "local")
+PRESENCE_TTL = int(os.environ.get("PRESENCE_TTL", "30"))
+PRESENCE_DEBOUNCE = int(os.environ.get("PRESENCE_DEBOUNCE", "10"))
+PRESENCE_SWEEP_INTERVAL = float(os.environ.get("PRESENCE_SWEEP_INTERVAL", "2"))
+
+# Movement trails are buffered per player and written as one chunk every
+# TRAIL_FLUSH_INTERVAL seconds or once TRAIL_CHUNK_SIZE points accumulate.
+# 0 writes every point as it arrives.
+TRAIL_FLUSH_INTERVAL = float(os.environ.get("TRAIL_FLUSH_INTERVAL", "10"))
+TRAIL_CHUNK_SIZE = int(os.environ.get("TRAIL_CHUNK_SIZE", "256"))
+
+# Event log writes are buffered per worker and bulk inserted every
+# EVENT_FLUSH_INTERVAL seconds or once EVENT_BATCH_SIZE events wait.
+# Game-deciding events (kills, revives, start, end, explosions) are
+# always written at once. 0 writes every event synchronously.
+EVENT_FLUSH_INTERVAL = float(os.environ.get("EVENT_FLUSH_INTERVAL", "2"))
+EVENT_BATCH_SIZE = int(os.environ.get("EVENT_BATCH_SIZE", "100"))
+
+# Position fixes that move a player less than their reported accuracy
+# (clamped to MOVEMENT_MIN_DISTANCE..MOVEMENT_MAX_DEADBAND meters) are
+# dropped as GPS jitter. MOVEMENT_SMOOTHING runs fixes through a Kalman
+# filter first, assuming players move at most MOVEMENT_PROCESS_NOISE m/s.
+MOVEMENT_MIN_DISTANCE = float(os.environ.get("MOVEMENT_MIN_DISTANCE", "2"))
+MOVEMENT_MAX_DEADBAND = float(os.environ.get("MOVEMENT_MAX_DEADBAND", "25"))
+MOVEMENT_SMOOTHING = os.environ.get("MOVEMENT_SMOOTHING", "False") == "True"
+MOVEMENT_PROCESS_NOISE = float(os.environ.get("MOVEMENT_PROCESS_NOISE", "3"))
+
+# Delta-encoded position frames (opt-in per connection): a keyframe every
+# POSITION_KEYFRAME_INTERVAL frames, or sooner once POSITION_DELTA_HISTORY
+# frames are sent without an acknowledgement.
+POSITION_KEYFRAME_INTERVAL = int(os.environ.get("POSITION_KEYFRAME_INTERVAL", "100"))
+POSITION_DELTA_HISTORY = int(os.environ.get("POSITION_DELTA_HISTORY", "32"))
+
+# Interest management: each game's map is split into cells of
+# map_radius / INTEREST_CELLS_PER_RADIUS meters (at least
+# INTEREST_MIN_CELL_SIZE), and connections only receive movement from the
+# cells around their player. A player changes cell once they are
+# INTEREST_HYSTERESIS of a cell past its edge. 0 cells sends all movement
+# to every connection in the game.
+INTEREST_CELLS_PER_RADIUS = float(os.environ.get("INTEREST_CELLS_PER_RADIUS", "4"))
+INTEREST_MIN_CELL_SIZE = float(os.environ.get("INTEREST_MIN_CELL_SIZE", "100"))
+INTEREST_HYSTERESIS = float(os.environ.get("INTEREST_HYSTERESIS", "0.1"))
+
+# Frames waiting to be sent to one WebSocket client. Position snapshots are
+# merged while queued; once full, the oldest non-critical frame is dropped.
+OUTBOUND_QUEUE_SIZE = int(os.environ.get("OUTBOUND_QUEUE_SIZE", "64"))
+
+# Load shedding: event loop lag is sampled every LOAD_SAMPLE_INTERVAL
+# seconds and smoothed. Above LOAD_SHED_DOWNSAMPLE_LAG seconds, movement
+# ticks slow by LOAD_SHED_DOWNSAMPLE_FACTOR and radar reuses stale
+# snapshots. Above LOAD_SHED_DROP_LAG, low-priority traffic (movement,
+# radar, visibility) is shed entirely.
+LOAD_SAMPLE_INTERVAL = float(os.environ.get("LOAD_SAMPLE_INTERVAL", "0.25"))
+LOAD_SHED_DOWNSAMPLE_LAG = float(os.environ.get("LOAD_SHED_DOWNSAMPLE_LAG", "0.1"))
+LOAD_SHED_DROP_LAG = float(os.environ.get("LOAD_SHED_DROP_LAG", "0.5"))
+LOAD_SHED_DOWNSAMPLE_FACTOR = float(os.environ.get("LOAD_SHED_DOWNSAMPLE_FACTOR", "2"))
+
+# Threads (and so database connections) per worker process for WebSocket
+# consumer, ticker and scheduler database work
+CONSUMER_DB_THREADS = int(os.environ.get("CONSUMER_DB_THREADS", "8"))
+
+# Broadcast outbox: WebSocket broadcasts from views go out after their
+# transaction commits. A failed send is retried OUTBOX_RETRIES times,
+# first after OUTBOX_RETRY_DELAY seconds, doubling each time.
+OUTBOX_RETRIES = int(os.environ.get("OUTBOX_RETRIES", "3"))
+OUTBOX_RETRY_DELAY = float(os.environ.get("OUTBOX_RETRY_DELAY", "0.05"))